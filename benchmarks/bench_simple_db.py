@@ -0,0 +1,272 @@
+"""
+Micro-benchmark do shared_db/simple_db em agendas sintéticas
+Gera agendas de vários tamanhos (muitos médicos/especialidades, histórico de
+pagamentos) em um diretório temporário e mede latência e memória de cada operação
+do simple_db, com um processo só e com vários processos escrevendo ao mesmo tempo.
+Cada medição roda em um processo novo (SHARED_DB_DIR aponta para a agenda gerada).
+
+Uso: python benchmarks/bench_simple_db.py --sizes 1000,10000,100000 --backends json,sqlite \
+         --writers 4 --output bench.json
+     (--sizes 1000000 também funciona, mas a geração e a carga levam minutos)
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SHARED_DB = os.path.join(ROOT, 'shared_db')
+
+BASE_SPECIALTIES = ["cardiologia", "dermatologia", "neurologia", "pediatria", "ortopedia", "clinica-geral"]
+SLOTS_POR_DIA = 16        # 08:00 às 15:30, de 30 em 30 minutos
+OCUPACAO = 0.1            # fração dos slots já agendada
+PAGAMENTOS_POR_SLOT = 0.1
+
+
+def gerar_agenda(diretorio, tamanho, seed=42):
+    """Escreve appointments.json e payments.json com `tamanho` slots"""
+    rnd = random.Random(seed)
+    medicos = max(10, tamanho // 2000)
+    especialidades = BASE_SPECIALTIES + [f"especialidade-{i:02d}" for i in range(max(0, medicos // 20 - len(BASE_SPECIALTIES)))]
+    horarios = [f"{8 + i // 2:02d}:{30 * (i % 2):02d}" for i in range(SLOTS_POR_DIA)]
+
+    slots = {}
+    inicio = date(2025, 1, 1)
+    n = 0
+    dia = 0
+    while n < tamanho:
+        data = (inicio + timedelta(days=dia)).isoformat()
+        for medico in range(medicos):
+            for horario in horarios:
+                if n >= tamanho:
+                    break
+                ocupado = rnd.random() < OCUPACAO
+                slots.setdefault(data, []).append({
+                    "slot_id": f"SLOT-{n:07d}",
+                    "time": horario,
+                    "doctor_id": f"dr_{medico:04d}",
+                    "doctor_name": f"Dr. Medico {medico:04d}",
+                    "specialties": rnd.sample(especialidades, 2),
+                    "available": not ocupado,
+                    "patient": f"{rnd.randrange(10**10, 10**11)}" if ocupado else None
+                })
+                n += 1
+        dia += 1
+
+    payments = [{
+        "patient_name": f"Paciente {i}",
+        "document": f"{rnd.randrange(10**10, 10**11)}",
+        "date": (inicio + timedelta(days=rnd.randrange(dia))).isoformat(),
+        "specialty": rnd.choice(especialidades)
+    } for i in range(int(tamanho * PAGAMENTOS_POR_SLOT))]
+
+    with open(os.path.join(diretorio, "appointments.json"), "w", encoding="utf-8") as f:
+        json.dump({"appointments": [], "available_slots": slots, "next_appointment_id": 1}, f)
+    with open(os.path.join(diretorio, "payments.json"), "w", encoding="utf-8") as f:
+        json.dump({"payments": payments}, f)
+    return {"slots": n, "dias": dia, "medicos": medicos, "especialidades": len(especialidades),
+            "pagamentos": len(payments)}
+
+
+def resumo(amostras):
+    """Estatísticas em milissegundos"""
+    if not amostras:
+        return None
+    ordenadas = sorted(amostras)
+
+    def p(q):
+        return round(ordenadas[min(len(ordenadas) - 1, int(q / 100 * len(ordenadas)))] * 1000, 4)
+    return {"n": len(ordenadas), "p50_ms": p(50), "p95_ms": p(95), "p99_ms": p(99),
+            "mean_ms": round(sum(ordenadas) / len(ordenadas) * 1000, 4)}
+
+
+def medir(func, args_por_iteracao):
+    tempos = []
+    for args in args_por_iteracao:
+        inicio = time.perf_counter()
+        func(*args)
+        tempos.append(time.perf_counter() - inicio)
+    return tempos
+
+
+def rss_mb():
+    # ru_maxrss em KB no Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _amostra_slots(simple_db, quantidade, rnd):
+    livres = []
+    cursor = None
+    while len(livres) < quantidade * 4:
+        pagina = simple_db.buscar_slots(limite=simple_db.LIMITE_MAXIMO, cursor=cursor)
+        livres += [s["slot_id"] for s in pagina["slots"]]
+        cursor = pagina["next_cursor"]
+        if not cursor:
+            break
+    return rnd.sample(livres, min(quantidade, len(livres)))
+
+
+def worker_single(ops, seed):
+    """Latência de cada operação em um único processo"""
+    import simple_db
+    rnd = random.Random(seed)
+    memoria_inicial = rss_mb()
+
+    inicio = time.perf_counter()
+    simple_db.consultar_slots()  # primeira chamada carrega os dados e monta os índices
+    carga = time.perf_counter() - inicio
+
+    slots = _amostra_slots(simple_db, ops, rnd)
+    documentos = [f"{70000000000 + i}" for i in range(len(slots))]
+    especialidades = BASE_SPECIALTIES
+    resultados = {
+        "carga_s": round(carga, 4),
+        "memoria_mb": {"inicial": memoria_inicial, "apos_carga": rss_mb()},
+        "operacoes": {}
+    }
+    operacoes = resultados["operacoes"]
+    operacoes["consultar_slots"] = resumo(medir(simple_db.consultar_slots, [()] * min(ops, 50)))
+    operacoes["buscar_slots"] = resumo(medir(
+        lambda esp: simple_db.buscar_slots(especialidade=esp, limite=10),
+        [(rnd.choice(especialidades),) for _ in range(ops)]
+    ))
+    datas = sorted(simple_db.consultar_slots())
+    operacoes["buscar_proximo_horario"] = resumo(medir(
+        lambda esp, data, hora: simple_db.buscar_proximo_horario(especialidade=esp, data_inicio=data, hora_inicio=hora),
+        [(rnd.choice(especialidades), rnd.choice(datas), rnd.choice(["08:00", "14:00", "16:30"])) for _ in range(ops)]
+    ))
+    operacoes["agendar_slot"] = resumo(medir(simple_db.agendar_slot, list(zip(slots, documentos))))
+    operacoes["buscar_por_documento"] = resumo(medir(simple_db.buscar_por_documento, [(d,) for d in documentos]))
+    operacoes["liberar_slot"] = resumo(medir(simple_db.liberar_slot, list(zip(slots, documentos))))
+    operacoes["add_payment"] = resumo(medir(
+        simple_db.add_payment, [("Paciente Bench", d, "2025-01-01", "cardiologia") for d in documentos]
+    ))
+    operacoes["refund"] = resumo(medir(simple_db.refund, [(d,) for d in documentos]))
+    operacoes["saldo_paciente"] = resumo(medir(simple_db.saldo_paciente, [(d,) for d in documentos]))
+    operacoes["totais_do_dia"] = resumo(medir(simple_db.totais_do_dia, [("2025-01-01",)] * ops))
+    resultados["memoria_mb"]["final"] = rss_mb()
+    return resultados
+
+
+def worker_writer(ops, seed, writer_id):
+    """Escritor concorrente: agenda/libera slots disputados e registra/reembolsa pagamentos"""
+    import simple_db
+    rnd = random.Random(seed)  # mesma semente em todos: os escritores disputam os mesmos slots
+    simple_db.consultar_slots()
+    slots = _amostra_slots(simple_db, ops, rnd)
+    documento = f"{80000000000 + writer_id}"
+    tempos = {"agendar_slot": [], "liberar_slot": [], "add_payment": [], "refund": []}
+    agendados = 0
+
+    inicio_total = time.perf_counter()
+    for slot_id in slots:
+        inicio = time.perf_counter()
+        if simple_db.agendar_slot(slot_id, documento)["success"]:
+            agendados += 1
+        tempos["agendar_slot"].append(time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        simple_db.add_payment("Paciente Bench", documento, "2025-01-01", "cardiologia")
+        tempos["add_payment"].append(time.perf_counter() - inicio)
+    for slot_id in slots:
+        inicio = time.perf_counter()
+        simple_db.liberar_slot(slot_id, documento)
+        tempos["liberar_slot"].append(time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        simple_db.refund(documento)
+        tempos["refund"].append(time.perf_counter() - inicio)
+    total = time.perf_counter() - inicio_total
+    return {"tempos": tempos, "agendados": agendados, "duracao_s": total}
+
+
+def _rodar_worker(diretorio, backend, modo, ops, seed, writer_id=0):
+    env = dict(os.environ, SHARED_DB_DIR=diretorio, SHARED_DB_BACKEND=backend,
+               SHARED_DB_SQLITE_PATH=os.path.join(diretorio, "health.db"))
+    comando = [sys.executable, os.path.abspath(__file__), "--worker", modo,
+               "--ops", str(ops), "--seed", str(seed), "--writer-id", str(writer_id)]
+    return subprocess.Popen(comando, env=env, stdout=subprocess.PIPE, text=True)
+
+
+def _resultado(processo):
+    saida, _ = processo.communicate()
+    if processo.returncode != 0:
+        raise RuntimeError(f"Worker terminou com código {processo.returncode}")
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+def bench(tamanho, backend, ops, writers, seed):
+    diretorio = tempfile.mkdtemp(prefix=f"bench_db_{tamanho}_")
+    try:
+        inicio = time.perf_counter()
+        dados = gerar_agenda(diretorio, tamanho, seed)
+        dados["geracao_s"] = round(time.perf_counter() - inicio, 2)
+        if backend == "sqlite":
+            sys.path.insert(0, SHARED_DB)
+            from migrate_to_sqlite import migrar
+            migrar(os.path.join(diretorio, "appointments.json"), os.path.join(diretorio, "payments.json"),
+                   os.path.join(diretorio, "health.db"))
+
+        print(f"[*] {backend} {tamanho} slots: processo único", file=sys.stderr)
+        single = _resultado(_rodar_worker(diretorio, backend, "single", ops, seed))
+
+        print(f"[*] {backend} {tamanho} slots: {writers} escritores", file=sys.stderr)
+        processos = [_rodar_worker(diretorio, backend, "writer", ops, seed, i) for i in range(writers)]
+        parciais = [_resultado(p) for p in processos]
+        concorrente = {
+            "writers": writers,
+            "slots_disputados": ops,
+            "agendamentos_ok": sum(p["agendados"] for p in parciais),
+            "ops_por_s": round(sum(sum(len(t) for t in p["tempos"].values()) for p in parciais)
+                               / max(p["duracao_s"] for p in parciais), 1),
+            "operacoes": {op: resumo([t for p in parciais for t in p["tempos"][op]])
+                          for op in parciais[0]["tempos"]}
+        }
+        return {"tamanho": tamanho, "backend": backend, "dados": dados,
+                "processo_unico": single, "concorrente": concorrente}
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do simple_db")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="quantidades de slots, separadas por vírgula")
+    parser.add_argument("--backends", default="json,sqlite")
+    parser.add_argument("--ops", type=int, default=200, help="operações medidas por tipo")
+    parser.add_argument("--writers", type=int, default=4, help="processos escritores concorrentes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="arquivo JSON com os resultados")
+    parser.add_argument("--worker", choices=["single", "writer"], help=argparse.SUPPRESS)
+    parser.add_argument("--writer-id", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, SHARED_DB)
+        if args.worker == "single":
+            resultado = worker_single(args.ops, args.seed)
+        else:
+            resultado = worker_writer(args.ops, args.seed, args.writer_id)
+        print(json.dumps(resultado))
+        return
+
+    resultados = {
+        "python": sys.version.split()[0],
+        "ops": args.ops,
+        "resultados": [bench(int(tamanho), backend, args.ops, args.writers, args.seed)
+                       for tamanho in args.sizes.split(",")
+                       for backend in args.backends.split(",")]
+    }
+    saida = json.dumps(resultados, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(saida)
+    print(saida)
+
+
+if __name__ == "__main__":
+    main()
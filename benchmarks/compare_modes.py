@@ -0,0 +1,129 @@
+"""
+Comparação das duas formas de implantação: servers HTTP x processo único
+Roda o mesmo teste de carga (load_test.py, com o modelo mock) duas vezes:
+- http: sobe os quatro *_server.py e o host chama os agentes por HTTP;
+- inprocess: MCP_MODE=inprocess, os agentes rodam dentro do processo do host.
+Os dois usam uma cópia dos dados em um diretório temporário (SHARED_DB_DIR).
+O resultado junta latência por turno e por agente, vazão e memória de cada modo.
+
+Uso: python benchmarks/compare_modes.py --users 10 --duration 30 [--output modos.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+LOAD_TEST = os.path.join(ROOT, 'benchmarks', 'load_test.py')
+
+SERVERS = {
+    'scheduling': ('mcp-scheduling-agent', 'scheduling_server.py', 3001),
+    'cancellation': ('mcp-cancellation-agent', 'cancellation_server.py', 3002),
+    'exam': ('mcp-exam-agent', 'exam_server.py', 3003),
+    'payment': ('mcp-payment-agent', 'payment_server.py', 3004),
+}
+
+
+def rss_mb(pid):
+    """Memória residente atual do processo (Linux); None se indisponível"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf8") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+def wait_healthy(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://localhost:{port}/health", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server na porta {port} não ficou pronto em {timeout}s")
+
+
+def start_servers(env):
+    processes = {}
+    for domain, (directory, script, _) in SERVERS.items():
+        processes[domain] = subprocess.Popen(
+            [sys.executable, script], cwd=os.path.join(ROOT, directory), env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    for _, _, port in SERVERS.values():
+        wait_healthy(port)
+    return processes
+
+
+def run_load_test(env, args):
+    command = [sys.executable, LOAD_TEST, "--users", str(args.users), "--duration", str(args.duration),
+               "--seed", str(args.seed)]
+    completed = subprocess.run(command, env=env, stdout=subprocess.PIPE, text=True, check=True)
+    return json.loads(completed.stdout)
+
+
+def run_mode(mode, args, data_dir):
+    env = dict(os.environ, MCP_LLM_BACKEND="mock", MCP_MODE=mode, SHARED_DB_DIR=data_dir)
+    print(f"[*] Modo {mode}...", file=sys.stderr)
+    servers = start_servers(env) if mode == "http" else {}
+    try:
+        report = run_load_test(env, args)
+        memory = {"host": report.get("rss_mb")}
+        memory.update({domain: rss_mb(process.pid) for domain, process in servers.items()})
+    finally:
+        for process in servers.values():
+            process.terminate()
+        for process in servers.values():
+            process.wait()
+    memory["total"] = round(sum(value for value in memory.values() if value), 1)
+    return {
+        "requests_per_s": report["requests_per_s"],
+        "error_rate": report["error_rate"],
+        "turn_latency_ms": report["turn_latency_ms"],
+        "agents": {domain: {key: agent[key] for key in ("calls", "p50", "p95", "p99", "mean")}
+                   for domain, agent in report["agents"].items()},
+        "memory_mb": memory,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara os modos http e inprocess")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--modes", default="http,inprocess")
+    parser.add_argument("--output", help="arquivo JSON com o resultado")
+    args = parser.parse_args()
+
+    results = {"config": {"users": args.users, "duration": args.duration, "seed": args.seed,
+                          "mock_latency_ms": os.getenv("MCP_MOCK_LATENCY_MS", "300")}}
+    for mode in args.modes.split(","):
+        # Cada modo começa com os dados originais
+        data_dir = tempfile.mkdtemp(prefix=f"modes_{mode}_")
+        try:
+            for name in ("appointments.json", "payments.json", "exams.json"):
+                shutil.copy(os.path.join(ROOT, 'shared_db', name), data_dir)
+            results[mode] = run_mode(mode, args, data_dir)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            file.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
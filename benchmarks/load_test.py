@@ -0,0 +1,226 @@
+"""
+Teste de carga do sistema completo (MCP Host + quatro agentes)
+Simula pacientes conversando ao mesmo tempo (agendamento, remarcação, cancelamento
+com reembolso e consulta de exames) e mede a latência por turno e por agente.
+
+Pré-requisito: os quatro servers rodando; para não depender do Azure, suba-os com
+MCP_LLM_BACKEND=mock (o host deste script usa o mesmo backend). Com MCP_MODE=inprocess
+os agentes rodam dentro deste processo e os servers não são necessários.
+
+Uso: python benchmarks/load_test.py --users 20 --duration 60 [--output resultado.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+HOST_DIR = os.path.join(ROOT, 'health-mcp-host')
+sys.path.append(HOST_DIR)
+sys.path.append(os.path.join(ROOT, 'shared_db'))
+
+import simple_db
+import tools_implementations
+from mcp_host import MCPHost
+
+SPECIALTIES = ["cardiologia", "dermatologia", "neurologia", "pediatria", "ortopedia", "clinica-geral"]
+
+
+# Conversas: listas de mensagens do paciente, geradas com os dados de cada iteração
+def agendamento(p):
+    return [
+        f"Quais horários disponíveis de {p['especialidade']}?",
+        f"Quero agendar o {p['slot_a']} para o CPF {p['cpf']}",
+        f"Quero pagar a consulta de {p['especialidade']} do dia {p['data']}, nome {p['nome']}, CPF {p['cpf']}",
+    ]
+
+
+def remarcacao(p):
+    return [
+        f"Quero agendar o {p['slot_a']} para o CPF {p['cpf']}",
+        f"Quero remarcar do {p['slot_a']} para o {p['slot_b']}, CPF {p['cpf']}",
+    ]
+
+
+def cancelamento(p):
+    return [
+        f"Quero agendar o {p['slot_a']} para o CPF {p['cpf']}",
+        f"Quero pagar a consulta de {p['especialidade']} do dia {p['data']}, nome {p['nome']}, CPF {p['cpf']}",
+        f"Quero cancelar minha consulta, CPF {p['cpf']}",
+        f"Confirmo o cancelamento do {p['slot_a']}, CPF {p['cpf']}",
+    ]
+
+
+def exames(p):
+    return [f"Quero ver meus exames, CPF {p['cpf']}"]
+
+
+SCENARIOS = {
+    "agendamento": (agendamento, 4),
+    "remarcacao": (remarcacao, 2),
+    "cancelamento": (cancelamento, 2),
+    "exames": (exames, 2),
+}
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    ordered = sorted(values)
+
+    def rank(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 2)
+    return {"p50": rank(50), "p95": rank(95), "p99": rank(99), "mean": round(sum(ordered) / len(ordered), 2)}
+
+
+class Recorder:
+    """Latências e erros por cenário e por agente"""
+
+    def __init__(self):
+        self.turns = {name: [] for name in SCENARIOS}
+        self.turn_errors = {name: 0 for name in SCENARIOS}
+        self.agents = {domain: [] for domain in tools_implementations.SERVERS}
+        self.agent_errors = {domain: 0 for domain in tools_implementations.SERVERS}
+
+    def agent_call(self, domain, elapsed_ms, result):
+        self.agents[domain].append(elapsed_ms)
+        if not isinstance(result, dict) or not result.get("success", False):
+            self.agent_errors[domain] += 1
+
+    def instrument(self):
+        """Mede cada chamada do host aos agentes (JSON e streaming)"""
+        route_to_agent = tools_implementations.route_to_agent
+        stream_from_agent = tools_implementations.stream_from_agent
+
+        async def timed_route(domain, message, session_id="default"):
+            inicio = time.perf_counter()
+            result = await route_to_agent(domain, message, session_id)
+            self.agent_call(domain, (time.perf_counter() - inicio) * 1000, result)
+            return result
+
+        async def timed_stream(domain, message, session_id="default"):
+            inicio = time.perf_counter()
+            async for event in stream_from_agent(domain, message, session_id):
+                if event.get("type") == "done":
+                    self.agent_call(domain, (time.perf_counter() - inicio) * 1000, event)
+                yield event
+
+        tools_implementations.route_to_agent = timed_route
+        tools_implementations.stream_from_agent = timed_stream
+
+    def report(self, elapsed, config):
+        all_turns = [v for values in self.turns.values() for v in values]
+        total_errors = sum(self.turn_errors.values())
+        return {
+            "config": config,
+            "duration_s": round(elapsed, 2),
+            "turns": len(all_turns),
+            "requests_per_s": round(len(all_turns) / elapsed, 2) if elapsed else 0,
+            "error_rate": round(total_errors / len(all_turns), 4) if all_turns else 0,
+            "turn_latency_ms": percentiles(all_turns),
+            # Pico de memória deste processo (no modo inprocess inclui os agentes)
+            "rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "scenarios": {
+                name: {"turns": len(values), "errors": self.turn_errors[name], **percentiles(values)}
+                for name, values in self.turns.items()
+            },
+            "agents": {
+                domain: {
+                    "calls": len(values),
+                    "errors": self.agent_errors[domain],
+                    "error_rate": round(self.agent_errors[domain] / len(values), 4) if values else 0,
+                    "requests_per_s": round(len(values) / elapsed, 2) if elapsed else 0,
+                    **percentiles(values)
+                }
+                for domain, values in self.agents.items()
+            }
+        }
+
+
+async def pick_slots():
+    """Dois slots livres quaisquer (podem ser disputados por outros usuários: faz parte do teste)"""
+    pagina = await asyncio.to_thread(simple_db.buscar_slots, limite=50)
+    slots = pagina.get("slots", [])
+    if len(slots) < 2:
+        raise RuntimeError("Agenda sem slots livres suficientes para o teste")
+    return random.sample(slots, 2)
+
+
+async def cleanup(params):
+    """Desfaz o que a conversa gravou, para a agenda não esgotar durante o teste"""
+    for slot in (params["slot_a"], params["slot_b"]):
+        await asyncio.to_thread(simple_db.liberar_slot, slot, params["cpf"])
+    while (await asyncio.to_thread(simple_db.refund, params["cpf"]))["success"]:
+        pass
+
+
+async def virtual_user(user_id, deadline, recorder):
+    nomes, pesos = zip(*((name, weight) for name, (_, weight) in SCENARIOS.items()))
+    iteration = 0
+    while time.monotonic() < deadline:
+        iteration += 1
+        scenario = random.choices(nomes, weights=pesos)[0]
+        slot_a, slot_b = await pick_slots()
+        params = {
+            "cpf": f"{90000000000 + user_id * 100000 + iteration:011d}",
+            "nome": f"Paciente Teste{user_id}",
+            "especialidade": random.choice(slot_a["specialties"] or SPECIALTIES),
+            "data": slot_a["date"],
+            "slot_a": slot_a["slot_id"],
+            "slot_b": slot_b["slot_id"],
+        }
+        # Cada conversa é uma sessão nova no host e nos agentes
+        host = MCPHost()
+        host.setup()
+        try:
+            for message in SCENARIOS[scenario][0](params):
+                inicio = time.perf_counter()
+                try:
+                    await host.process_turn(message)
+                except Exception:
+                    recorder.turn_errors[scenario] += 1
+                recorder.turns[scenario].append((time.perf_counter() - inicio) * 1000)
+        finally:
+            await cleanup(params)
+
+
+async def main(args):
+    random.seed(args.seed)
+    recorder = Recorder()
+    recorder.instrument()
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    print(f"[*] {args.users} usuários por {args.duration}s...", file=sys.stderr)
+    inicio = time.monotonic()
+    deadline = inicio + args.duration
+    # Os prints do host/agentes por turno atrapalham a leitura do relatório
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(virtual_user(i, deadline, recorder) for i in range(args.users)))
+        await tools_implementations.close_clients()
+    elapsed = time.monotonic() - inicio
+
+    config = {"users": args.users, "duration": args.duration, "seed": args.seed,
+              "mode": os.getenv("MCP_MODE", "http"),
+              "llm_backend": os.getenv("MCP_LLM_BACKEND", "azure"),
+              "mock_latency_ms": os.getenv("MCP_MOCK_LATENCY_MS", "300")}
+    report = recorder.report(elapsed, config)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if output_path:
+        with open(output_path, "w", encoding="utf8") as file:
+            file.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga do MCP Host + agentes")
+    parser.add_argument("--users", type=int, default=10, help="usuários simultâneos")
+    parser.add_argument("--duration", type=float, default=30, help="duração em segundos")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="arquivo JSON com o relatório")
+    asyncio.run(main(parser.parse_args()))
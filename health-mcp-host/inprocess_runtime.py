@@ -0,0 +1,76 @@
+"""
+Runtime em processo único (MCP_MODE=inprocess)
+Os quatro agentes rodam dentro do processo do host: execute_tool chama cada agente
+diretamente, sem HTTP nem serialização, com um só cliente LLM, um só backend do
+simple_db e um só cache de leituras da agenda (agendamento e cancelamento). As
+respostas têm o mesmo formato do /mcp/process (ver request_handler.py). Os servers
+HTTP continuam disponíveis para implantações com um processo por agente.
+"""
+import asyncio
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.append(os.path.join(ROOT, 'shared_db'))
+for agent_dir in ('mcp-scheduling-agent', 'mcp-cancellation-agent', 'mcp-exam-agent', 'mcp-payment-agent'):
+    sys.path.append(os.path.join(ROOT, agent_dir))
+
+import simple_db
+from mcp_cancellation import CancellationAgent
+from mcp_exam import ExamAgent
+from mcp_payment import PaymentAgent
+from mcp_scheduling import SchedulingAgent
+from request_handler import handle_request, handle_request_stream
+from result_cache import ResultCache
+
+AGENTS = {
+    'scheduling': SchedulingAgent,
+    'cancellation': CancellationAgent,
+    'exam': ExamAgent,
+    'payment': PaymentAgent,
+}
+
+
+class InProcessRuntime:
+    def __init__(self, client):
+        self.agents = {}
+        # Agendamento e cancelamento leem a mesma agenda: um cache só, e a escrita de um invalida o outro
+        slots_cache = ResultCache(version=simple_db.versao_dados)
+        for domain, agent_class in AGENTS.items():
+            agent = agent_class()
+            agent.setup(client)
+            if agent.executor.cache is not None and domain in ('scheduling', 'cancellation'):
+                agent.executor.cache = slots_cache
+            self.agents[domain] = agent
+
+    async def process(self, domain, message, session_id, mode, trace_id=None):
+        return await handle_request(self.agents[domain], domain.upper(), message, session_id, mode, trace_id)
+
+    async def process_stream(self, domain, message, session_id, mode, trace_id=None):
+        """Eventos do agente, gerados em uma task própria
+
+        A task tem sua cópia do contexto: o trace e os coletores do agente não vazam
+        para o host entre um evento e outro, como acontece com um servidor separado.
+        """
+        queue = asyncio.Queue()
+
+        async def produce():
+            try:
+                async for event in handle_request_stream(self.agents[domain], domain.upper(), message, session_id, mode, trace_id):
+                    await queue.put(event)
+            finally:
+                await queue.put(None)
+
+        task = asyncio.create_task(produce())
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            task.cancel()
+
+    async def health(self, domain):
+        ready, checks = await self.agents[domain].readiness()
+        return {"status": "healthy" if ready else "unhealthy", "service": domain, "checks": checks}
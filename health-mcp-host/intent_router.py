@@ -0,0 +1,153 @@
+"""
+Roteador determinístico de intenções do MCP Host
+Reconhece pedidos frequentes (cancelar consulta, ver exames, horários de uma
+especialidade) por palavras-chave e extrai documento, data e especialidade.
+Quando o pedido é claro, o host chama o agente direto, sem a completion de
+roteamento; quando há dúvida, retorna None e o fluxo normal com o LLM segue.
+"""
+import json
+import re
+import unicodedata
+import uuid
+from datetime import date, timedelta
+
+# Termos (sem acento) que indicam cada intenção
+INTENT_KEYWORDS = {
+    "cancellation_agent": ["cancelar", "cancela", "desmarcar", "cancelamento"],
+    "exam_agent": ["exame", "exames", "resultado do exame", "resultados"],
+    "scheduling_agent": ["horario", "horarios", "disponivel", "disponiveis", "disponibilidade", "vaga", "vagas", "agenda"],
+}
+
+# Pedidos que envolvem mais de um passo ou decisão ficam com o LLM
+AMBIGUOUS_KEYWORDS = ["remarcar", "reagendar", "trocar", "mudar", "pagar", "pagamento", "reembolso", "estorno", "agendar", "marcar"]
+
+SPECIALTIES = {
+    "cardiologia": ["cardiologia", "cardiologista", "cardio"],
+    "dermatologia": ["dermatologia", "dermatologista", "dermato"],
+    "neurologia": ["neurologia", "neurologista", "neuro"],
+    "pediatria": ["pediatria", "pediatra"],
+    "ortopedia": ["ortopedia", "ortopedista"],
+    "clinica-geral": ["clinica geral", "clinica-geral", "clinico geral", "clinico"],
+}
+
+CPF_RE = re.compile(r"\b\d{3}\.?\d{3}\.?\d{3}-?\d{2}\b")
+DOCUMENT_RE = re.compile(r"\b\d{5,14}\b")
+ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+BR_DATE_RE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{4}))?\b")
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return text.lower()
+
+
+def _has_word(text, keyword):
+    return re.search(rf"\b{re.escape(keyword)}\b", text) is not None
+
+
+def extract_document(text):
+    """CPF (com ou sem pontuação) ou outro número de documento"""
+    match = CPF_RE.search(text)
+    if match:
+        return re.sub(r"\D", "", match.group(0))
+    # Ignora números que fazem parte de datas
+    sem_datas = BR_DATE_RE.sub(" ", ISO_DATE_RE.sub(" ", text))
+    match = DOCUMENT_RE.search(sem_datas)
+    return match.group(0) if match else None
+
+
+def extract_date(text, today=None):
+    """Data no formato YYYY-MM-DD (aceita ISO, DD/MM/AAAA, DD/MM, hoje e amanhã)"""
+    today = today or date.today()
+    normalized = _normalize(text)
+    match = ISO_DATE_RE.search(text)
+    try:
+        if match:
+            return date(int(match.group(1)), int(match.group(2)), int(match.group(3))).isoformat()
+        match = BR_DATE_RE.search(text)
+        if match:
+            year = int(match.group(3)) if match.group(3) else today.year
+            return date(year, int(match.group(2)), int(match.group(1))).isoformat()
+    except ValueError:
+        return None
+    if _has_word(normalized, "amanha"):
+        return (today + timedelta(days=1)).isoformat()
+    if _has_word(normalized, "hoje"):
+        return today.isoformat()
+    return None
+
+
+def extract_specialty(text):
+    normalized = _normalize(text)
+    found = [name for name, terms in SPECIALTIES.items() if any(_has_word(normalized, t) for t in terms)]
+    return found[0] if len(found) == 1 else None
+
+
+class _Function:
+    def __init__(self, name, arguments):
+        self.name = name
+        self.arguments = arguments
+
+
+class FastToolCall:
+    """Tool call sintética, no mesmo formato das tool_calls do modelo"""
+
+    def __init__(self, name, message):
+        self.id = f"fast-{uuid.uuid4().hex[:12]}"
+        self.type = "function"
+        self.function = _Function(name, json.dumps({"message": message}, ensure_ascii=False))
+
+
+class IntentRouter:
+    def __init__(self):
+        self.hits = {}
+        self.fallbacks = 0
+
+    def route(self, user_input):
+        """Retorna uma FastToolCall para pedidos claros ou None para usar o LLM"""
+        tool_call = self._classify(user_input)
+        if tool_call is None:
+            self.fallbacks += 1
+        else:
+            self.hits[tool_call.function.name] = self.hits.get(tool_call.function.name, 0) + 1
+        return tool_call
+
+    def _classify(self, user_input):
+        normalized = _normalize(user_input)
+        if any(_has_word(normalized, k) for k in AMBIGUOUS_KEYWORDS):
+            return None
+
+        intents = [name for name, keywords in INTENT_KEYWORDS.items()
+                   if any(_has_word(normalized, k) for k in keywords)]
+        if len(intents) != 1:
+            return None
+        intent = intents[0]
+
+        document = extract_document(user_input)
+        when = extract_date(user_input)
+        specialty = extract_specialty(user_input)
+
+        if intent == "cancellation_agent" and document:
+            return FastToolCall(intent, f"Cancelar a consulta do paciente com documento {document}")
+        if intent == "exam_agent" and document:
+            message = f"Buscar os exames do paciente com documento {document}"
+            if when:
+                message += f" realizados em {when}"
+            return FastToolCall(intent, message)
+        if intent == "scheduling_agent" and specialty:
+            message = f"Mostrar os horários disponíveis de {specialty}"
+            if when:
+                message += f" a partir de {when}"
+            return FastToolCall(intent, message)
+        return None
+
+    def stats(self):
+        total_hits = sum(self.hits.values())
+        total = total_hits + self.fallbacks
+        return {
+            "requests": total,
+            "fast_path": total_hits,
+            "llm_fallback": self.fallbacks,
+            "hit_rate": round(total_hits / total, 3) if total else 0.0,
+            "by_intent": dict(self.hits)
+        }
@@ -2,17 +2,77 @@
 MCP Host - Orquestrador que conecta com MCP Servers
 """
 import os
+import sys
 import json
+import uuid
+import asyncio
 from dotenv import load_dotenv
-from openai import AzureOpenAI
-from tools_implementations import execute_tool
+from tools_implementations import close_clients, enable_inprocess, execute_tool, execute_tool_stream
+from intent_router import IntentRouter
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared_mcp'))
+from result_cache import ANSWER_CACHE, AnswerCache
+from session_store import SESSION_SUMMARY, SessionStore, llm_summarizer
+from llm_client import create_llm_client
+from prompt_builder import PromptBuilder
+from streaming import StreamedCompletion
+from tracing import serve_metrics, start_trace
+
+# Rodadas de chamadas a agentes por turno (ex: cancelamento seguido de reembolso)
+MAX_TOOL_ROUNDS = 3
+
+# Roteamento local de pedidos frequentes, sem a completion de escolha da tool ("0" desativa)
+FAST_PATH = os.getenv("MCP_FAST_PATH", "1") == "1"
+
+# Porta do /metrics do host (Prometheus); "0" desativa
+METRICS_PORT = int(os.getenv("MCP_METRICS_PORT", "0"))
+
+# Nome do domínio de cada tool, usado nas mensagens de fallback
+DOMAIN_NAMES = {
+    'scheduling_agent': 'agendamento',
+    'cancellation_agent': 'cancelamento', 
+    'payment_agent': 'pagamento',
+    'exam_agent': 'busca de exames'
+}
+
+class MockResponse:
+    """Resposta local no mesmo formato da mensagem do modelo"""
+    def __init__(self, content):
+        self.content = content
+        self.tool_calls = None
+
+def _fallback_message(tool_name):
+    # Cria resposta de fallback informando que o serviço está temporariamente indisponível
+    domain = DOMAIN_NAMES.get(tool_name, tool_name)
+    return f"Desculpe, o serviço de {domain} está temporariamente indisponível. Tente novamente em alguns momentos ou entre em contato conosco pelo telefone (11) 1234-5678 para assistência imediata."
+
+def _assistant_message(response):
+    """Converte a resposta do modelo em mensagem de histórico (com tool_calls, se houver)"""
+    message = {"role": "assistant", "content": response.content}
+    if response.tool_calls:
+        message["tool_calls"] = [{
+            "id": tool_call.id,
+            "type": "function",
+            "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments}
+        } for tool_call in response.tool_calls]
+    return message
+
+def _print_trace(trace):
+    etapas = " ".join(f"{name}={elapsed:.0f}ms" for name, elapsed in trace.summary().items())
+    print(f"\n[trace] {trace.trace_id} total={trace.elapsed_ms():.0f}ms {etapas} "
+          f"tokens={trace.tokens['prompt']}+{trace.tokens['completion']}")
 
 class MCPHost: 
     def __init__(self):
         self.client = None
         self.tools = []
         self.system_prompt = ""
-        self.conversation_history = []
+        self.sessions = SessionStore()
+        # Cada execução do host é uma conversa; o id é repassado aos agentes
+        self.session_id = uuid.uuid4().hex
+        self.router = IntentRouter()
+        # Respostas a perguntas gerais (preços, horários) reaproveitadas entre conversas
+        self.answers = AnswerCache() if ANSWER_CACHE else None
         
     def setup(self):
         root_env = os.path.join(os.path.dirname(__file__), '..', '.env')
@@ -21,95 +81,204 @@ class MCPHost:
         else:
             load_dotenv()
         
-        # Conecta Azure OpenAI
-        self.client = AzureOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_KEY"),
-            api_version="2024-02-01"
-        )
+        # Azure OpenAI ou o mock local, conforme MCP_LLM_BACKEND (ver llm_client.py)
+        self.client = create_llm_client()
         self.deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+        if SESSION_SUMMARY:
+            self.sessions.summarizer = llm_summarizer(self.client, self.deployment)
         
-        with open("tools_definitions.json", "r", encoding="utf8") as file:
+        with open(os.path.join(os.path.dirname(__file__), "tools_definitions.json"), "r", encoding="utf8") as file:
             self.tools = json.load(file)
         
         # Carrega prompt do sistema
-        with open("system.txt", "r", encoding="utf8") as file:
+        with open(os.path.join(os.path.dirname(__file__), "system.txt"), "r", encoding="utf8") as file:
             self.system_prompt = file.read().strip()
         
+        # Prefixo fixo (system + tools) e orçamento de tokens, ver prompt_builder.py
+        self.prompt = PromptBuilder(self.system_prompt, self.tools)
+        
+        # "http" (padrão): agentes nos servers; "inprocess": agentes no processo do host, mesmo cliente LLM
+        if os.getenv("MCP_MODE", "http") == "inprocess":
+            enable_inprocess(self.client)
+            print(f"[*] Agentes em processo único (MCP_MODE=inprocess)")
+        
         print(f"[*] MCP Host iniciado!")
         print(f"[*] Tools carregadas: {len(self.tools)}")
         print(f"[*] Domínios: agendamento, cancelamento, pagamento, exames")
         
-    def process_message(self, user_input):
-        self.conversation_history.append({"role": "user", "content": user_input})
-        messages = [{"role": "system", "content": self.system_prompt}] + self.conversation_history
+    async def process_message(self, user_input):
+        """Primeira completion do turno (gera eventos, ver _complete)"""
+        session = self.sessions.get(self.session_id)
+        session.history.append({"role": "user", "content": user_input})
+        async for event in self._complete(session):
+            yield event
+    
+    async def _complete(self, session, allow_tools=True):
+        """Completion em streaming: eventos "delta" com o texto e por fim "response" com a mensagem"""
+        messages = self.prompt.build(session, reserve=500)
         
-        completion = self.client.chat.completions.create(
+        # Na última rodada o modelo precisa responder sem chamar novas tools; as tools
+        # continuam no request para manter o prefixo igual (cache de prompt)
+        tool_choice = {} if allow_tools else {"tool_choice": "none"}
+        response = StreamedCompletion(
+            self.client,
             model=self.deployment,
             messages=messages,
             tools=self.tools,
             max_tokens=500,
-            temperature=0.3
+            temperature=0.3,
+            **tool_choice
         )
+        async for text in response:
+            yield {"type": "delta", "text": text}
         
-        response = completion.choices[0].message
+        if response.content or response.tool_calls:
+            session.history.append(_assistant_message(response))
+        self.sessions.save(session)
+        yield {"type": "response", "response": response}
+    
+    async def process_turn(self, user_input):
+        """Processa um turno completo do paciente e retorna a resposta final"""
+        content = None
+        async for event in self.process_turn_stream(user_input):
+            if event["type"] == "done":
+                content = event["content"]
+        return content
+    
+    async def process_turn_stream(self, user_input):
+        """Processa um turno gerando eventos para o paciente
+
+        "delta": trecho da resposta; "status": agente sendo consultado;
+        "done": fim do turno, com o conteúdo da resposta final e o trace id.
+        """
+        # Um trace por turno: completions do host, chamadas aos agentes e os spans devolvidos por eles
+        with start_trace() as trace:
+            async for event in self._turn(user_input):
+                if event["type"] == "done":
+                    _print_trace(trace)
+                    event = {**event, "trace_id": trace.trace_id}
+                yield event
+    
+    async def _turn(self, user_input):
+        # A resposta depende da conversa até aqui: o contexto entra na chave do cache
+        context = AnswerCache.context_key(self.sessions.get(self.session_id).messages()) if self.answers else ""
+        cached = self.answers.get(user_input, context) if self.answers else None
+        if cached:
+            session = self.sessions.get(self.session_id)
+            session.history.append({"role": "user", "content": user_input})
+            session.history.append({"role": "assistant", "content": cached})
+            self.sessions.save(session)
+            yield {"type": "delta", "text": cached}
+            yield {"type": "done", "content": cached}
+            return
         
-        if response.content:
-            self.conversation_history.append({"role": "assistant", "content": response.content})
+        tool_call = self.router.route(user_input) if FAST_PATH else None
+        if tool_call:
+            events = self.process_fast_path(user_input, tool_call)
+        else:
+            events = self.process_message(user_input)
         
-        return response
-    
-    def process_agent_message(self, agent_result, tool_name):
-        # Verifica se o agente está fora do ar ou retornou erro
-        if not agent_result or (isinstance(agent_result, dict) and not agent_result.get('success', True)):
-            error_msg = agent_result.get('error', 'Agente não respondeu') if agent_result else 'Agente não respondeu'
-            
-            # Determina o domínio do agente para criar mensagem específica
-            domain_names = {
-                'scheduling_agent': 'agendamento',
-                'cancellation_agent': 'cancelamento', 
-                'payment_agent': 'pagamento',
-                'exam_agent': 'busca de exames'
-            }
-            domain = domain_names.get(tool_name, tool_name)
-            
-            # Cria resposta de fallback informando que o serviço está temporariamente indisponível
-            fallback_message = f"Desculpe, o serviço de {domain} está temporariamente indisponível. Tente novamente em alguns momentos ou entre em contato conosco pelo telefone (11) 1234-5678 para assistência imediata."
-            
-            self.conversation_history.append({"role": "assistant", "content": fallback_message})
-            
-            # Cria uma resposta mock para retornar
-            class MockResponse:
-                def __init__(self, content):
-                    self.content = content
+        rounds = 0
+        while True:
+            response = None
+            async for event in events:
+                if event["type"] == "response":
+                    response = event["response"]
+                else:
+                    yield event
+            if not response.tool_calls:
+                break
             
-            return MockResponse(fallback_message)
+            rounds += 1
+            for call in response.tool_calls:
+                yield {"type": "status", "text": f"Consultando {DOMAIN_NAMES.get(call.function.name, call.function.name)}..."}
+            # Chamadas independentes aos agentes rodam em paralelo
+            agent_results = await asyncio.gather(
+                *(self.execute_tool_call(call) for call in response.tool_calls)
+            )
+            # Uma única resposta do modelo sobre todos os resultados
+            events = self.process_agent_results(
+                response.tool_calls, agent_results, allow_tools=rounds < MAX_TOOL_ROUNDS
+            )
         
-        # Processa normalmente se o agente respondeu com sucesso
-        result_str = json.dumps(agent_result, ensure_ascii=False, indent=2)
-        self.conversation_history.append({"role": "assistant", "content": f"Resultado do {tool_name}: {result_str}"})
-        messages = [{"role": "system", "content": self.system_prompt}] + self.conversation_history
-
-        completion = self.client.chat.completions.create(
-            model=self.deployment,
-            messages=messages,
-            tools=self.tools,
-            max_tokens=500,
-            temperature=0.3
-        )
-        response = completion.choices[0].message
-        if response.content:
-            self.conversation_history.append({"role": "assistant", "content": response.content})
-        return response
+        # Só respostas dadas sem consultar agentes (informação do system.txt) são reaproveitáveis
+        if self.answers and not tool_call and rounds == 0:
+            self.answers.put(user_input, response.content, context)
+        
+        await self.sessions.summarize(self.sessions.get(self.session_id))
+        yield {"type": "done", "content": response.content}
+    
+    async def process_fast_path(self, user_input, tool_call):
+        """Chama o agente escolhido pelo IntentRouter sem a completion de roteamento"""
+        session = self.sessions.get(self.session_id)
+        session.history.append({"role": "user", "content": user_input})
+        # Registra a chamada como se o modelo a tivesse feito, mantendo o histórico válido
+        session.history.append({
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": tool_call.id,
+                "type": "function",
+                "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments}
+            }]
+        })
+        print(f"[*] Fast path: {tool_call.function.name}")
+        yield {"type": "status", "text": f"Consultando {DOMAIN_NAMES.get(tool_call.function.name, tool_call.function.name)}..."}
+        
+        # O texto do agente é repassado ao paciente enquanto é gerado
+        agent_result = None
+        async for event in execute_tool_stream(tool_call.function.name, json.loads(tool_call.function.arguments), self.session_id):
+            if event["type"] == "delta":
+                yield event
+            elif event["type"] == "done":
+                agent_result = {key: value for key, value in event.items() if key != "type"}
+        
+        # Agente já respondeu em texto: repassa ao paciente sem nova completion
+        reply = agent_result.get("response") if agent_result and agent_result.get("success") else None
+        if isinstance(reply, str) and reply.strip():
+            session.history.append({"role": "tool", "tool_call_id": tool_call.id, "content": reply})
+            session.history.append({"role": "assistant", "content": reply})
+            self.sessions.save(session)
+            yield {"type": "response", "response": MockResponse(reply)}
+            return
+        
+        # Resultado estruturado (ou erro): uma completion para redigir a resposta
+        async for event in self.process_agent_results([tool_call], [agent_result]):
+            yield event
+    
+    async def process_agent_results(self, tool_calls, agent_results, allow_tools=True):
+        session = self.sessions.get(self.session_id)
+        
+        fallbacks = []
+        for tool_call, agent_result in zip(tool_calls, agent_results):
+            # Verifica se o agente está fora do ar ou retornou erro
+            if not agent_result or (isinstance(agent_result, dict) and not agent_result.get('success', True)):
+                content = _fallback_message(tool_call.function.name)
+                fallbacks.append(content)
+            else:
+                content = json.dumps(agent_result, ensure_ascii=False, indent=2)
+            session.history.append({"role": "tool", "tool_call_id": tool_call.id, "content": content})
+        
+        # Se nenhum agente respondeu, informa o paciente sem chamar o modelo
+        if len(fallbacks) == len(tool_calls):
+            fallback_message = "\n".join(dict.fromkeys(fallbacks))
+            session.history.append({"role": "assistant", "content": fallback_message})
+            self.sessions.save(session)
+            yield {"type": "delta", "text": fallback_message}
+            yield {"type": "response", "response": MockResponse(fallback_message)}
+            return
+        
+        async for event in self._complete(session, allow_tools):
+            yield event
 
-    def execute_tool_call(self, tool_call):
+    async def execute_tool_call(self, tool_call):
         tool_name = tool_call.function.name
         arguments = json.loads(tool_call.function.arguments)
         
         print(f"🔧 Executando tool: {tool_name}")
         print(f"📤 Parâmetros: {arguments}")
 
-        result = execute_tool(tool_name, arguments)
+        result = await execute_tool(tool_name, arguments, self.session_id)
         
         print(f"📥 Resposta do Server:")
         print(result)
@@ -120,13 +289,17 @@ class MCPHost:
         
         return result
     
-    def run(self):
+    async def run(self):
         self.setup()
+        if METRICS_PORT:
+            serve_metrics(METRICS_PORT)
+            print(f"[*] Métricas em http://localhost:{METRICS_PORT}/metrics")
         print("\n[*] Digite suas mensagens ou 'sair' para encerrar.")
         
         while True:
             try:
-                user_input = input("Você: ").strip()
+                # input() bloqueia: roda fora do event loop
+                user_input = (await asyncio.to_thread(input, "Você: ")).strip()
                 
                 if user_input.lower() == 'sair':
                     print("[*] Encerrando MCP Host. Até logo!")
@@ -137,17 +310,14 @@ class MCPHost:
                 
                 print("[*] Processando...")
                 
-                response = self.process_message(user_input)
-                
-                # Verifica se precisa executar tools
-                if response.tool_calls:
-                    for tool_call in response.tool_calls:
-                        agent_result = self.execute_tool_call(tool_call)
-                        # Processa resultado do agente e gera resposta final ao paciente
-                        final_response = self.process_agent_message(agent_result, tool_call.function.name)
-                        print(f"Assistente: {final_response.content}")
-                else:
-                    print(f"Assistente: {response.content}")
+                # A resposta é exibida conforme é gerada
+                print("Assistente: ", end="", flush=True)
+                async for event in self.process_turn_stream(user_input):
+                    if event["type"] == "delta":
+                        print(event["text"], end="", flush=True)
+                    elif event["type"] == "status":
+                        print(f"\n[*] {event['text']}", flush=True)
+                print()
                 
                 print()
                 
@@ -157,6 +327,11 @@ class MCPHost:
             except Exception as e:
                 print(f"[!] Erro: {e}")
 
+        print(f"[*] Roteamento local: {self.router.stats()}")
+        if self.answers:
+            print(f"[*] Cache de respostas: {self.answers.stats()}")
+        await close_clients()
+
 if __name__ == "__main__":
     host = MCPHost()
-    host.run()
\ No newline at end of file
+    asyncio.run(host.run())
\ No newline at end of file
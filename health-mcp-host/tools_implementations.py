@@ -1,40 +1,275 @@
-import requests
+"""
+Roteamento do MCP Host para os agentes especializados
+Usa um cliente HTTP assíncrono por domínio, com conexões keep-alive reaproveitadas,
+limite de conexões, prazo total por chamada, retry com backoff exponencial + jitter
+(somente quando é seguro repetir) e circuit breaker para agentes fora do ar.
+Cada chamada é um span "agent:<domínio>" e leva o trace id no cabeçalho X-Trace-Id.
+Com MCP_MODE=inprocess os agentes rodam no próprio processo do host (ver
+inprocess_runtime.py) e as chamadas não passam por HTTP.
+"""
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
 
-# Mapeamento de servers por domínio
+import httpx
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared_mcp'))
+from tracing import add_remote_spans, current_trace_id, span, trace_headers
+
+# Mapeamento de servers por domínio (URLs padrão; ver server_url)
 SERVERS = {
     'scheduling': 'http://localhost:3001',
-    'cancellation': 'http://localhost:3002', 
+    'cancellation': 'http://localhost:3002',
     'exam': 'http://localhost:3003',
     'payment': 'http://localhost:3004'
 }
 
-def route_to_agent(domain, message):
-    """Roteia mensagem para agente especializado"""
+AGENT_TIMEOUT = float(os.getenv("MCP_AGENT_TIMEOUT", "30"))
+AGENT_CONNECT_TIMEOUT = float(os.getenv("MCP_AGENT_CONNECT_TIMEOUT", "2"))
+AGENT_MAX_CONNECTIONS = int(os.getenv("MCP_AGENT_MAX_CONNECTIONS", "20"))
+AGENT_RETRIES = int(os.getenv("MCP_AGENT_RETRIES", "2"))
+# "structured": os agentes devolvem os resultados das tools e o host redige a resposta
+# uma única vez; "conversational": os agentes também redigem (uma completion a mais)
+AGENT_MODE = os.getenv("MCP_AGENT_MODE", "structured")
+# HTTP/2 exige o pacote h2 (pip install httpx[http2])
+HTTP2 = os.getenv("MCP_HTTP2", "0") == "1" and importlib.util.find_spec("h2") is not None
+
+BACKOFF_BASE = 0.1
+BACKOFF_MAX = 2.0
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Abre após falhas consecutivas; depois do tempo de espera deixa passar uma tentativa"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < self.reset_timeout or self._trial:
+            return False
+        self._trial = True  # meio-aberto: somente uma requisição de teste
+        return True
+
+    def is_trial(self):
+        """Chamado logo após allow(): a requisição liberada é a tentativa do meio-aberto"""
+        return self.opened_at is not None
+
+    def release_trial(self):
+        """Fim da tentativa sem sucesso nem falha registrados (ex: cancelada): libera a próxima"""
+        self._trial = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial = False
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+_clients = {}
+_breakers = {domain: CircuitBreaker() for domain in SERVERS}
+_runtime = None  # InProcessRuntime, com MCP_MODE=inprocess
+
+
+def enable_inprocess(client):
+    """Passa a chamar os agentes no próprio processo, com o cliente LLM do host (uma vez por processo)"""
+    global _runtime
+    if _runtime is None:
+        from inprocess_runtime import InProcessRuntime
+        _runtime = InProcessRuntime(client)
+    return _runtime
+
+
+def server_url(domain):
+    """URL do agente: <DOMÍNIO>_SERVER_URL (outro nó, balanceador) ou o padrão local
+
+    Lido na criação do cliente, depois do load_dotenv do host.
+    """
+    return os.getenv(f"{domain.upper()}_SERVER_URL", SERVERS[domain])
+
+
+def _client(domain):
+    """Cliente com pool de conexões próprio para cada agente"""
+    if domain not in _clients:
+        _clients[domain] = httpx.AsyncClient(
+            base_url=server_url(domain),
+            http2=HTTP2,
+            limits=httpx.Limits(max_connections=AGENT_MAX_CONNECTIONS,
+                                max_keepalive_connections=AGENT_MAX_CONNECTIONS),
+            timeout=httpx.Timeout(AGENT_TIMEOUT, connect=AGENT_CONNECT_TIMEOUT)
+        )
+    return _clients[domain]
+
+
+async def close_clients():
+    """Fecha os pools de conexão (chamar ao encerrar o host)"""
+    for client in _clients.values():
+        await client.aclose()
+    _clients.clear()
+
+
+async def _request(domain, method, path, idempotent=False, **kwargs):
+    """Requisição ao agente com prazo total, retry e circuit breaker
+
+    Falhas de conexão (requisição não chegou ao agente) sempre podem ser repetidas;
+    demais falhas só são repetidas em chamadas idempotentes.
+    """
+    breaker = _breakers[domain]
+    if not breaker.allow():
+        raise CircuitOpenError(f"Agente {domain} indisponível (circuito aberto)")
+    trial = breaker.is_trial()
+
+    deadline = time.monotonic() + AGENT_TIMEOUT
+    attempt = 0
+    try:
+        while True:
+            try:
+                response = await asyncio.wait_for(
+                    _client(domain).request(method, path, **kwargs),
+                    timeout=max(deadline - time.monotonic(), 0.001)
+                )
+                if response.status_code < 500:
+                    breaker.record_success()
+                    return response
+                error = httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+                retryable = idempotent
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                error, retryable = e, True
+            except httpx.TransportError as e:
+                error, retryable = e, idempotent
+            except asyncio.TimeoutError:
+                error, retryable = TimeoutError(f"Prazo de {AGENT_TIMEOUT}s excedido"), False
+
+            # Backoff exponencial com jitter ("full jitter")
+            backoff = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            if not retryable or attempt >= AGENT_RETRIES or time.monotonic() + backoff >= deadline:
+                breaker.record_failure()
+                raise error
+            attempt += 1
+            await asyncio.sleep(backoff)
+    finally:
+        # Tentativa cancelada (CancelledError) ou com erro inesperado não pode prender o circuito
+        if trial:
+            breaker.release_trial()
+
+
+async def route_to_agent(domain, message, session_id="default"):
+    """Roteia mensagem para agente especializado (mantendo a sessão do paciente)"""
     if domain not in SERVERS:
         return {"success": False, "error": f"Domínio desconhecido: {domain}"}
-    
+
     try:
-        response = requests.post(
-            f"{SERVERS[domain]}/mcp/process",
-            json={"message": message},
-            timeout=10
-        )
-        return response.json()
+        with span(f"agent:{domain}"):
+            if _runtime is not None:
+                result = await _runtime.process(domain, message, session_id, AGENT_MODE, current_trace_id())
+            else:
+                response = await _request(
+                    domain, "POST", "/mcp/process",
+                    json={"message": message, "session_id": session_id, "mode": AGENT_MODE},
+                    headers=trace_headers()
+                )
+                result = response.json()
+        add_remote_spans(domain, result.get("spans"))
+        return result
     except Exception as e:
         return {"success": False, "error": f"Erro ao conectar com {domain}: {str(e)}"}
 
+async def stream_from_agent(domain, message, session_id="default"):
+    """Versão em streaming de route_to_agent: gera os eventos SSE do agente
+
+    O último evento é sempre "done", no mesmo formato da resposta de /mcp/process.
+    Não há retry: parte da resposta pode já ter sido repassada ao paciente.
+    """
+    if domain not in SERVERS:
+        yield {"type": "done", "success": False, "error": f"Domínio desconhecido: {domain}"}
+        return
+
+    if _runtime is not None:
+        with span(f"agent:{domain}"):
+            async for event in _runtime.process_stream(domain, message, session_id, AGENT_MODE, current_trace_id()):
+                if event["type"] == "done":
+                    add_remote_spans(domain, event.get("spans"))
+                yield event
+        return
+
+    breaker = _breakers[domain]
+    if not breaker.allow():
+        yield {"type": "done", "success": False, "error": f"Agente {domain} indisponível (circuito aberto)"}
+        return
+    trial = breaker.is_trial()
+
+    try:
+        with span(f"agent:{domain}"):
+            async with _client(domain).stream(
+                "POST", "/mcp/process/stream",
+                json={"message": message, "session_id": session_id, "mode": AGENT_MODE},
+                headers=trace_headers()
+            ) as response:
+                if response.status_code >= 500:
+                    raise httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+                breaker.record_success()
+                async for line in response.aiter_lines():
+                    if line.startswith("data:"):
+                        event = json.loads(line[5:].strip())
+                        if event.get("type") == "done":
+                            add_remote_spans(domain, event.get("spans"))
+                        yield event
+    except Exception as e:
+        breaker.record_failure()
+        yield {"type": "done", "success": False, "error": f"Erro ao conectar com {domain}: {str(e)}"}
+    finally:
+        # Paciente desconectou (GeneratorExit/CancelledError) durante a tentativa do meio-aberto
+        if trial:
+            breaker.release_trial()
+
+async def check_agent_health(domain):
+    """Consulta /health do agente (idempotente, pode ser repetida)"""
+    if _runtime is not None:
+        return await _runtime.health(domain)
+    try:
+        response = await _request(domain, "GET", "/health", idempotent=True)
+        return response.json()
+    except Exception as e:
+        return {"status": "unavailable", "service": domain, "error": str(e)}
+
 # Funções simplificadas para os novos nomes de tools
-def scheduling_agent(message):
-    return route_to_agent('scheduling', message)
+async def scheduling_agent(message, session_id="default"):
+    return await route_to_agent('scheduling', message, session_id)
 
-def cancellation_agent(message):
-    return route_to_agent('cancellation', message)
+async def cancellation_agent(message, session_id="default"):
+    return await route_to_agent('cancellation', message, session_id)
 
-def payment_agent(message):
-    return route_to_agent('payment', message)
+async def payment_agent(message, session_id="default"):
+    return await route_to_agent('payment', message, session_id)
 
-def exam_agent(message):
-    return route_to_agent('exam', message)
+async def exam_agent(message, session_id="default"):
+    return await route_to_agent('exam', message, session_id)
+
+# Domínio de cada tool do host (usado no streaming)
+TOOL_DOMAINS = {
+    "scheduling_agent": "scheduling",
+    "cancellation_agent": "cancellation",
+    "payment_agent": "payment",
+    "exam_agent": "exam",
+}
 
 TOOL_FUNCTIONS = {
     "scheduling_agent": scheduling_agent,
@@ -43,9 +278,17 @@ TOOL_FUNCTIONS = {
     "exam_agent": exam_agent,
 }
 
-def execute_tool(tool_name, arguments):
+async def execute_tool(tool_name, arguments, session_id="default"):
     message = arguments.get("message", "")
     if tool_name in TOOL_FUNCTIONS:
-        return TOOL_FUNCTIONS[tool_name](message)
+        return await TOOL_FUNCTIONS[tool_name](message, session_id)
     else:
         return {"success": False, "error": f"Tool não encontrada: {tool_name}"}
+
+async def execute_tool_stream(tool_name, arguments, session_id="default"):
+    """Como execute_tool, mas gera os eventos do agente conforme chegam"""
+    if tool_name not in TOOL_DOMAINS:
+        yield {"type": "done", "success": False, "error": f"Tool não encontrada: {tool_name}"}
+        return
+    async for event in stream_from_agent(TOOL_DOMAINS[tool_name], arguments.get("message", ""), session_id):
+        yield event
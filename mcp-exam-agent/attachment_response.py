@@ -0,0 +1,103 @@
+"""
+Entrega de anexos de exames (PDFs, imagens) pelo exam_server
+O arquivo não passa por json.dumps nem é lido inteiro para a memória: com a extensão
+ASGI "http.response.zerocopysend" o servidor usa sendfile; sem ela, o arquivo é
+mapeado com mmap e enviado em blocos de ATTACHMENT_CHUNK bytes. Suporta Range
+(um intervalo, 206/416), If-Range, ETag/If-None-Match (304) e HEAD.
+"""
+import mmap
+import os
+import re
+
+from async_utils import run_blocking
+from fastapi.responses import Response
+
+ATTACHMENT_CHUNK = int(os.getenv("MCP_ATTACHMENT_CHUNK_KB", "1024")) * 1024
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def etag(stat):
+    """ETag derivado do tamanho e da data de modificação do arquivo"""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """(início, fim) inclusivos do cabeçalho Range, ou None para enviar o arquivo inteiro
+
+    Levanta ValueError se o intervalo não pode ser atendido (416). Vários intervalos ou
+    sintaxe desconhecida são ignorados, como permite a RFC 9110.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None or match.groups() == ("", ""):
+        return None
+    inicio, fim = match.groups()
+    if inicio == "":
+        # "bytes=-500": os últimos 500 bytes
+        tamanho = int(fim)
+        if tamanho == 0 or size == 0:
+            raise ValueError("intervalo vazio")
+        return max(size - tamanho, 0), size - 1
+    inicio = int(inicio)
+    fim = size - 1 if fim == "" else min(int(fim), size - 1)
+    if inicio >= size or fim < inicio:
+        raise ValueError("intervalo fora do arquivo")
+    return inicio, fim
+
+
+def attachment_response(path, content_type, request_headers):
+    """Resposta para o anexo em `path`, conforme os cabeçalhos condicionais e de Range"""
+    stat = os.stat(path)
+    tag = etag(stat)
+    headers = {"etag": tag, "accept-ranges": "bytes", "cache-control": "private, max-age=3600"}
+
+    if tag in [valor.strip() for valor in request_headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if if_range and if_range.strip() != tag:
+        # O cliente tem uma versão antiga: recebe o arquivo inteiro
+        range_header = None
+    try:
+        intervalo = parse_range(range_header, stat.st_size)
+    except ValueError:
+        headers["content-range"] = f"bytes */{stat.st_size}"
+        return Response(status_code=416, headers=headers)
+
+    if intervalo is None:
+        return MappedFileResponse(path, 0, stat.st_size, 200, content_type, headers)
+    inicio, fim = intervalo
+    headers["content-range"] = f"bytes {inicio}-{fim}/{stat.st_size}"
+    return MappedFileResponse(path, inicio, fim - inicio + 1, 206, content_type, headers)
+
+
+class MappedFileResponse(Response):
+    """Envia `count` bytes do arquivo a partir de `offset` (sendfile ou mmap)"""
+
+    def __init__(self, path, offset, count, status_code, content_type, headers):
+        self.path = path
+        self.offset = offset
+        self.count = count
+        super().__init__(status_code=status_code, headers={**headers, "content-length": str(count)},
+                         media_type=content_type)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        with open(self.path, "rb") as file:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": file,
+                            "offset": self.offset, "count": self.count})
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                fim = self.offset + self.count
+                for inicio in range(self.offset, fim, ATTACHMENT_CHUNK):
+                    # Fatia das páginas mapeadas, sem read() em buffer intermediário; a leitura
+                    # do disco (page faults) fica no pool de I/O e não trava o event loop
+                    bloco = await run_blocking(mapa.__getitem__, slice(inicio, min(inicio + ATTACHMENT_CHUNK, fim)))
+                    await send({"type": "http.response.body", "body": bloco,
+                                "more_body": inicio + ATTACHMENT_CHUNK < fim})
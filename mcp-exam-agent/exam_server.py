@@ -1,14 +1,25 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import sys
 import os
 from mcp_exam import ExamAgent
+import exam_store
+from async_utils import run_blocking
+from attachment_response import attachment_response
+from request_handler import handle_request, handle_request_stream
+from shared_state import WORKERS
+from streaming import sse_event
+from tracing import METRICS_CONTENT_TYPE, render_metrics
 
 app = FastAPI(title="MCP Exam Server")
 agent = ExamAgent()
 
 class MessageRequest(BaseModel):
     message: str
+    session_id: str = "default"
+    # "conversational": o agente redige a resposta; "structured": devolve os resultados das tools
+    mode: str = "conversational"
 
 @app.on_event("startup")
 async def startup():
@@ -16,20 +27,37 @@ async def startup():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "service": "exam"}
+    """Prontidão: responde 503 se o LLM, o banco ou o estado compartilhado não estiverem utilizáveis"""
+    ready, checks = await agent.readiness()
+    body = {"status": "healthy" if ready else "unhealthy", "service": "exam", "worker": os.getpid(), "checks": checks}
+    return body if ready else JSONResponse(status_code=503, content=body)
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas no formato do Prometheus (tempos por etapa, tokens, custo estimado)"""
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
 @app.post("/mcp/process")
-async def process_message(request: MessageRequest):
+async def process_message(request: MessageRequest, x_trace_id: str = Header(None)):
     """Recebe mensagem conversacional e deixa o agente decidir o que fazer"""
-    try:
-        print(f"EXAM: {request.message}")
-        result = agent.process_message(request.message)
-        print(f"EXAM: {result}")
-        return {"success": True, "response": result}
-    except Exception as e:
-        print(f"EXAM ERRO: {str(e)}")
-        return {"success": False, "error": str(e)}
+    return await handle_request(agent, "EXAM", request.message, request.session_id, request.mode, x_trace_id)
+
+@app.post("/mcp/process/stream")
+async def process_message_stream(request: MessageRequest, x_trace_id: str = Header(None)):
+    """Mesma entrada de /mcp/process, com a resposta enviada aos poucos (server-sent events)"""
+    events = handle_request_stream(agent, "EXAM", request.message, request.session_id, request.mode, x_trace_id)
+    return StreamingResponse((sse_event(event) async for event in events), media_type="text/event-stream")
+
+@app.api_route("/exams/{patient_id}/attachments/{attachment_id}", methods=["GET", "HEAD"])
+async def exam_attachment(patient_id: str, attachment_id: str, request: Request):
+    """Arquivo anexo de um exame do paciente (url devolvida por get_exam_result), com Range e ETag"""
+    anexo = await run_blocking(exam_store.exam_store().arquivo_anexo, patient_id, attachment_id)
+    if anexo is None or not os.path.isfile(anexo[0]):
+        return JSONResponse(status_code=404, content={"success": False, "error": "Anexo não encontrado"})
+    path, content_type = anexo
+    return attachment_response(path, content_type, request.headers)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=3003, log_level="info")
\ No newline at end of file
+    # Com MCP_WORKERS > 1 cada worker importa o app; sessões e cache ficam no estado compartilhado
+    uvicorn.run("exam_server:app", host="0.0.0.0", port=3003, workers=WORKERS, log_level="info")
\ No newline at end of file
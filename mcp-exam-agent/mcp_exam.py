@@ -4,9 +4,20 @@ Arquitetura Multi-Agente para Atendimento de Saúde - TCC 2025
 """
 
 import os
+import sys
 import json
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared_db'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared_mcp'))
+import exam_store
+from result_cache import ResultCache
+from tool_executor import MODE_CONVERSATIONAL, ToolExecutor
+from session_store import DEFAULT_SESSION, SESSION_SUMMARY, SessionStore, llm_summarizer
+from llm_client import create_llm_client
+from prompt_builder import PromptBuilder
+from readiness import check_readiness
+from streaming import StreamedCompletion
 
 class ExamAgent:
     def __init__(self):
@@ -14,9 +25,14 @@ class ExamAgent:
         self.tools = []
         self.system_prompt = ""
         self.deployment = ""
-        self.conversation_history = []
+        self.sessions = SessionStore(namespace="exam")
+        self.executor = ToolExecutor(
+            handlers={"get_exam_result": self.get_exam_result},
+            read_only={"get_exam_result"},
+            cache=ResultCache(namespace="exam")
+        )
 
-    def setup(self):
+    def setup(self, client=None):
         """Inicializa conexões e carrega configurações"""
         # Procura .env na raiz do projeto primeiro, depois local
         root_env = os.path.join(os.path.dirname(__file__), '..', '.env')
@@ -25,133 +41,90 @@ class ExamAgent:
         else:
             load_dotenv()
         
-        self.client = AzureOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_KEY"),
-            api_version="2024-02-01"
-        )
+        # Azure OpenAI ou o mock local, conforme MCP_LLM_BACKEND (ver llm_client.py);
+        # no modo em processo único o host passa o próprio cliente
+        self.client = client or create_llm_client()
         self.deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+        if SESSION_SUMMARY:
+            self.sessions.summarizer = llm_summarizer(self.client, self.deployment)
 
-        with open("tools.json", "r", encoding="utf8") as file:
+        with open(os.path.join(os.path.dirname(__file__), "tools.json"), "r", encoding="utf8") as file:
             tools_data = json.load(file)
             self.tools = tools_data["tools"]
         
-        with open("system.txt", "r", encoding="utf8") as file:
+        with open(os.path.join(os.path.dirname(__file__), "system.txt"), "r", encoding="utf8") as file:
             self.system_prompt = file.read().strip()
         
+        # Prefixo fixo (system + tools) e orçamento de tokens, ver prompt_builder.py
+        self.prompt = PromptBuilder(self.system_prompt, self.tools)
+        
         print(f"[*] MCP Exam Agent iniciado!")
         print(f"[*] Tools carregadas: {len(self.tools)}")
     
-    def process_message(self, agent_input):
-        self.conversation_history.append({"role": "user", "content": agent_input})
-        messages = [{"role": "system", "content": self.system_prompt}] + self.conversation_history
+    async def readiness(self):
+        """Prontidão do agente para o /health (LLM, arquivo de exames e estado compartilhado)"""
+        return await check_readiness(self.client, self.deployment, storage=exam_store.verificar)
+
+    async def process_message(self, agent_input, session_id=DEFAULT_SESSION, mode=MODE_CONVERSATIONAL):
+        result = None
+        async for event in self.process_message_stream(agent_input, session_id, mode):
+            if event["type"] == "done":
+                result = event["response"]
+        return result
+
+    async def process_message_stream(self, agent_input, session_id=DEFAULT_SESSION, mode=MODE_CONVERSATIONAL):
+        """Gera eventos "delta" (trechos de texto), "tools" e por fim "done" com a resposta"""
+        session = self.sessions.get(session_id)
+        async with session.lock:
+            async for event in self._process(session, agent_input, mode):
+                yield event
+            self.sessions.save(session)
+        await self.sessions.summarize(session)
+
+    async def _process(self, session, agent_input, mode=MODE_CONVERSATIONAL):
+        session.history.append({"role": "user", "content": agent_input})
+        messages = self.prompt.build(session, reserve=500)
         
-        completion = self.client.chat.completions.create(
+        response = StreamedCompletion(
+            self.client,
             model=self.deployment,
             messages=messages,
             tools=self.tools,
             max_tokens=500,
             temperature=0.7
         )
-        
-        response = completion.choices[0].message
+        async for text in response:
+            yield {"type": "delta", "text": text}
         
         if response.tool_calls:
-            result = self._execute_tools(response.tool_calls)
+            yield {"type": "tools", "names": [tool_call.function.name for tool_call in response.tool_calls]}
+            result = await self._execute_tools(response.tool_calls)
             # Adiciona resposta do agente ao histórico
-            self.conversation_history.append({
+            session.history.append({
                 "role": "assistant", 
                 "content": f"Executei as seguintes ações: {result}"
             })
-            return result
+            yield {"type": "done", "response": result}
+            return
         
         # Adiciona resposta ao histórico se houver conteúdo
         if response.content:
-            self.conversation_history.append({"role": "assistant", "content": response.content})
+            session.history.append({"role": "assistant", "content": response.content})
         
-        return response.content
+        yield {"type": "done", "response": response.content}
 
-    def _execute_tools(self, tool_calls):
+    async def _execute_tools(self, tool_calls):
         # Executa as ferramentas chamadas pelo modelo
-        results = []
-        
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            arguments = json.loads(tool_call.function.arguments)
-            
-            if function_name == "get_exam_result":
-                result = self.get_exam_result(**arguments)
-            else:
-                result = {"error": f"Função {function_name} não encontrada"}
-            
-            results.append(result)
+        # (leituras em paralelo, escritas em sequência; ver tool_executor.py)
+        runs = await self.executor.execute(tool_calls)
+        results = [run.result for run in runs]
         
         return results[0] if len(results) == 1 else results
     
-    
-    def get_exam_result(self, patientId, examId=None):
-        """Simula busca de resultados de exame"""
-        # Dados simulados
-        sample_exams = {
-            "12345": {
-                "HEM-001": {
-                    "examType": "hemograma-completo",
-                    "result": "Hemoglobina: 14.5 g/dL, Leucócitos: 7200/μL",
-                    "date": "2025-09-15T10:00:00"
-                },
-                "RX-002": {
-                    "examType": "raio-x-torax", 
-                    "result": "Campos pulmonares livres",
-                    "date": "2025-09-14T15:30:00"
-                }
-            }
-        }
-        
-        if patientId not in sample_exams:
-            return {
-                "success": False,
-                "message": f"Nenhum exame encontrado para paciente {patientId}"
-            }
-        
-        patient_exams = sample_exams[patientId]
-        
-        if examId:
-            if examId in patient_exams:
-                exam = patient_exams[examId]
-                return {
-                    "success": True,
-                    "message": f"Exame {examId} encontrado",
-                    "data": {
-                        "examId": examId,
-                        "patientId": patientId,
-                        "examType": exam["examType"],
-                        "result": exam["result"],
-                        "date": exam["date"]
-                    }
-                }
-            else:
-                return {
-                    "success": False,
-                    "message": f"Exame {examId} não encontrado"
-                }
-        else:
-            # Retorna todos os exames
-            all_exams = []
-            for eid, exam in patient_exams.items():
-                all_exams.append({
-                    "examId": eid,
-                    "examType": exam["examType"],
-                    "date": exam["date"]
-                })
-            
-            return {
-                "success": True,
-                "message": f"Encontrados {len(all_exams)} exame(s)",
-                "data": {
-                    "patientId": patientId,
-                    "exams": all_exams
-                }
-            }
+    def get_exam_result(self, patientId, examId=None, examType=None, dateFrom=None, dateTo=None,
+                        limit=10, cursor=None, offset=0):
+        """Busca exames do paciente no arquivo de exames (ver shared_db/exam_store.py)"""
+        return exam_store.consultar_exames(patientId, examId, examType, dateFrom, dateTo, limit, cursor, offset)
 
     def execute_tool(self, tool_name, arguments):
         """Executa uma tool específica"""
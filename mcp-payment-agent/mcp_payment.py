@@ -6,10 +6,16 @@ import json
 import sys
 import os
 from dotenv import load_dotenv
-from openai import AzureOpenAI
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared_db'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared_mcp'))
 import simple_db
+from session_store import DEFAULT_SESSION, SESSION_SUMMARY, SessionStore, llm_summarizer
+from llm_client import create_llm_client
+from prompt_builder import PromptBuilder
+from readiness import check_readiness
+from streaming import StreamedCompletion
+from tool_executor import MODE_CONVERSATIONAL, MODE_STRUCTURED, ToolExecutor, tool_history
 
 class PaymentAgent:
     def __init__(self):
@@ -17,103 +23,131 @@ class PaymentAgent:
         self.tools = []
         self.system_prompt = ""
         self.deployment = ""
-        self.conversation_history = []
+        self.sessions = SessionStore(namespace="payment")
+        self.executor = ToolExecutor(
+            handlers={
+                "processar_pagamento": self.processar_pagamento,
+                "processar_reembolso": self.processar_reembolso,
+                "consultar_pagamentos": self.consultar_pagamentos,
+            },
+            read_only={"consultar_pagamentos"}
+        )
 
-    def setup(self):
+    def setup(self, client=None):
         root_env = os.path.join(os.path.dirname(__file__), '..', '.env')
         if os.path.exists(root_env):
             load_dotenv(root_env)
         else:
             load_dotenv()
         
-        self.client = AzureOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_KEY"),
-            api_version="2024-02-01"
-        )
+        # Azure OpenAI ou o mock local, conforme MCP_LLM_BACKEND (ver llm_client.py);
+        # no modo em processo único o host passa o próprio cliente
+        self.client = client or create_llm_client()
         self.deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+        if SESSION_SUMMARY:
+            self.sessions.summarizer = llm_summarizer(self.client, self.deployment)
 
-        with open("tools.json", "r", encoding="utf8") as file:
+        with open(os.path.join(os.path.dirname(__file__), "tools.json"), "r", encoding="utf8") as file:
             tools_data = json.load(file)
             self.tools = tools_data["tools"]
         
-        with open("system.txt", "r", encoding="utf8") as file:
+        with open(os.path.join(os.path.dirname(__file__), "system.txt"), "r", encoding="utf8") as file:
             self.system_prompt = file.read().strip()
         
+        # Prefixo fixo (system + tools) e orçamento de tokens, ver prompt_builder.py
+        self.prompt = PromptBuilder(self.system_prompt, self.tools)
+        
         print(f"[*] MCP Payment Agent iniciado!")
         print(f"[*] Tools carregadas: {len(self.tools)}")
 
-    def process_message(self, agent_input):
-        self.conversation_history.append({"role": "user", "content": agent_input})
-        messages = [{"role": "system", "content": self.system_prompt}] + self.conversation_history
+    async def readiness(self):
+        """Prontidão do agente para o /health (LLM, banco compartilhado e estado compartilhado)"""
+        return await check_readiness(self.client, self.deployment, storage=simple_db.verificar)
+
+    async def process_message(self, agent_input, session_id=DEFAULT_SESSION, mode=MODE_CONVERSATIONAL):
+        result = None
+        async for event in self.process_message_stream(agent_input, session_id, mode):
+            if event["type"] == "done":
+                result = event["response"]
+        return result
+
+    async def process_message_stream(self, agent_input, session_id=DEFAULT_SESSION, mode=MODE_CONVERSATIONAL):
+        """Gera eventos "delta" (trechos de texto), "tools" e por fim "done" com a resposta"""
+        session = self.sessions.get(session_id)
+        async with session.lock:
+            async for event in self._process(session, agent_input, mode):
+                yield event
+            self.sessions.save(session)
+        await self.sessions.summarize(session)
+
+    async def _process(self, session, agent_input, mode=MODE_CONVERSATIONAL):
+        session.history.append({"role": "user", "content": agent_input})
+        messages = self.prompt.build(session, reserve=500)
         
-        completion = self.client.chat.completions.create(
+        response = StreamedCompletion(
+            self.client,
             model=self.deployment,
             messages=messages,
             tools=self.tools,
             max_tokens=500,
             temperature=0.7
         )
-        
-        response = completion.choices[0].message
+        async for text in response:
+            yield {"type": "delta", "text": text}
         
         if response.tool_calls:
-            result = self._execute_tools(response.tool_calls)
-            # Adiciona resultado da tool ao histórico para que o LLM processe
-            self.conversation_history.append({
-                "role": "assistant",
-                "content": f"Resultado das ferramentas: {json.dumps(result, ensure_ascii=False)}"
-            })
+            yield {"type": "tools", "names": [tool_call.function.name for tool_call in response.tool_calls]}
+            runs = await self._execute_tools(response.tool_calls)
+            # Resultados como mensagens "tool" ligadas ao tool_call_id de cada chamada
+            session.history.extend(tool_history(response.tool_calls, runs))
+            
+            if mode == MODE_STRUCTURED:
+                # Sem segunda completion: quem chamou (o host) redige a resposta ao paciente
+                yield {"type": "done", "response": [run.result for run in runs]}
+                return
             
             # Gera uma segunda resposta baseada nos resultados das tools
-            messages = [{
-                "role": "system", 
-                "content": self.system_prompt + "\n\nCom base nos resultados das ferramentas, forneça uma resposta clara e conversacional ao paciente."
-            }] + self.conversation_history
+            messages = self.prompt.build(session, reserve=300)
             
-            final_response = self.client.chat.completions.create(
+            # Mesmas tools da primeira chamada (prefixo igual, aproveita o cache), sem permitir novas chamadas
+            final_response = StreamedCompletion(
+                self.client,
                 model=self.deployment,
                 messages=messages,
+                tools=self.tools,
+                tool_choice="none",
                 max_tokens=300,
                 temperature=0.7
             )
+            async for text in final_response:
+                yield {"type": "delta", "text": text}
             
-            final_content = final_response.choices[0].message.content
-            self.conversation_history.append({"role": "assistant", "content": final_content})
-            return final_content
+            final_content = final_response.content
+            session.history.append({"role": "assistant", "content": final_content})
+            yield {"type": "done", "response": final_content}
+            return
 
         if response.content:
-            self.conversation_history.append({"role": "assistant", "content": response.content})
+            session.history.append({"role": "assistant", "content": response.content})
         
-        return response.content
+        yield {"type": "done", "response": response.content}
 
-    def _execute_tools(self, tool_calls):
+    async def _execute_tools(self, tool_calls):
         """Executa as ferramentas chamadas pelo LLM"""
-        results = []
+        # Leituras rodam em paralelo; escritas em sequência (ver tool_executor.py)
+        return await self.executor.execute(tool_calls)
         
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            arguments = json.loads(tool_call.function.arguments)
-            
-            if function_name == "processar_pagamento":
-                result = self.processar_pagamento(**arguments)
-            elif function_name == "processar_reembolso":
-                result = self.processar_reembolso(**arguments)
-            else:
-                result = {"error": f"Função {function_name} não encontrada"}
-            
-            results.append(result)
-        
-        return results
-        
-    def processar_pagamento(self, patient_name, document, date, specialty):
-        result = simple_db.add_payment(patient_name, document, date, specialty)
+    def processar_pagamento(self, patient_name, document, date, specialty, amount=None, idempotency_key=None):
+        result = simple_db.add_payment(patient_name, document, date, specialty, amount, idempotency_key)
         return result
 
-    def processar_reembolso(self, document):
-        result = simple_db.refund(document)
+    def processar_reembolso(self, document, payment_id=None):
+        result = simple_db.refund(document, payment_id)
         return result
 
+    def consultar_pagamentos(self, document):
+        return simple_db.saldo_paciente(document)
+
 
 def main():
     agent = PaymentAgent()
@@ -6,11 +6,18 @@ import json
 import os
 import sys
 from dotenv import load_dotenv
-from openai import AzureOpenAI
 
 # Adiciona o caminho do módulo compartilhado
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared_db'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared_mcp'))
 import simple_db
+from result_cache import ResultCache
+from session_store import DEFAULT_SESSION, SESSION_SUMMARY, SessionStore, llm_summarizer
+from llm_client import create_llm_client
+from prompt_builder import PromptBuilder
+from readiness import check_readiness
+from streaming import StreamedCompletion
+from tool_executor import MODE_CONVERSATIONAL, ToolExecutor
 
 class SchedulingAgent:
     def __init__(self):
@@ -18,9 +25,20 @@ class SchedulingAgent:
         self.tools = []
         self.system_prompt = ""
         self.deployment = ""
-        self.conversation_history = []
+        self.sessions = SessionStore(namespace="scheduling")
+        self.executor = ToolExecutor(
+            handlers={
+                "buscar_slots": simple_db.buscar_slots,
+                "buscar_proximo_horario": simple_db.buscar_proximo_horario,
+                "consultar_slots": simple_db.consultar_slots,
+                "agendar_slot": simple_db.agendar_slot,
+                "remarcar_slot": simple_db.remarcar,
+            },
+            read_only={"buscar_slots", "buscar_proximo_horario", "consultar_slots"},
+            cache=ResultCache(version=simple_db.versao_dados, namespace="scheduling")
+        )
 
-    def setup(self):
+    def setup(self, client=None):
         root_env = os.path.join(os.path.dirname(__file__), '..', '.env')
         if os.path.exists(root_env):
             load_dotenv(root_env)
@@ -28,72 +46,85 @@ class SchedulingAgent:
             load_dotenv()
         
         # Conecta Azure OpenAI
-        self.client = AzureOpenAI(
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_key=os.getenv("AZURE_OPENAI_KEY"),
-            api_version="2024-02-01"
-        )
+        # Azure OpenAI ou o mock local, conforme MCP_LLM_BACKEND (ver llm_client.py);
+        # no modo em processo único o host passa o próprio cliente
+        self.client = client or create_llm_client()
         self.deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+        if SESSION_SUMMARY:
+            self.sessions.summarizer = llm_summarizer(self.client, self.deployment)
 
         # Carrega definições de tools
-        with open("tools.json", "r", encoding="utf8") as file:
+        with open(os.path.join(os.path.dirname(__file__), "tools.json"), "r", encoding="utf8") as file:
             tools_data = json.load(file)
             self.tools = tools_data["tools"]
         
         # Carrega prompt do sistema
-        with open("system.txt", "r", encoding="utf8") as file:
+        with open(os.path.join(os.path.dirname(__file__), "system.txt"), "r", encoding="utf8") as file:
             self.system_prompt = file.read().strip()
         
+        # Prefixo fixo (system + tools) e orçamento de tokens, ver prompt_builder.py
+        self.prompt = PromptBuilder(self.system_prompt, self.tools)
+        
         print(f"[*] MCP Scheduling Agent iniciado!")
         print(f"[*] Tools carregadas: {len(self.tools)}")
 
-    def process_message(self, agent_input):
-        self.conversation_history.append({"role": "user", "content": agent_input})
-        messages = [{"role": "system", "content": self.system_prompt}] + self.conversation_history
+    async def readiness(self):
+        """Prontidão do agente para o /health (LLM, banco compartilhado e estado compartilhado)"""
+        return await check_readiness(self.client, self.deployment, storage=simple_db.verificar)
+
+    async def process_message(self, agent_input, session_id=DEFAULT_SESSION, mode=MODE_CONVERSATIONAL):
+        result = None
+        async for event in self.process_message_stream(agent_input, session_id, mode):
+            if event["type"] == "done":
+                result = event["response"]
+        return result
+
+    async def process_message_stream(self, agent_input, session_id=DEFAULT_SESSION, mode=MODE_CONVERSATIONAL):
+        """Gera eventos "delta" (trechos de texto), "tools" e por fim "done" com a resposta"""
+        session = self.sessions.get(session_id)
+        async with session.lock:
+            async for event in self._process(session, agent_input, mode):
+                yield event
+            self.sessions.save(session)
+        await self.sessions.summarize(session)
+
+    async def _process(self, session, agent_input, mode=MODE_CONVERSATIONAL):
+        session.history.append({"role": "user", "content": agent_input})
+        messages = self.prompt.build(session, reserve=500)
         
-        completion = self.client.chat.completions.create(
+        response = StreamedCompletion(
+            self.client,
             model=self.deployment,
             messages=messages,
             tools=self.tools,
             max_tokens=500,
             temperature=0.7
         )
-        
-        response = completion.choices[0].message
+        async for text in response:
+            yield {"type": "delta", "text": text}
         
         # Se há tool calls, executar
         if response.tool_calls:
-            result = self._execute_tools(response.tool_calls)
+            yield {"type": "tools", "names": [tool_call.function.name for tool_call in response.tool_calls]}
+            result = await self._execute_tools(response.tool_calls)
             # Adiciona resposta do agente ao histórico
-            self.conversation_history.append({
+            session.history.append({
                 "role": "assistant", 
                 "content": f"Executei as seguintes ações: {result}"
             })
-            return result
+            yield {"type": "done", "response": result}
+            return
         
         # Adiciona resposta ao histórico se houver conteúdo
         if response.content:
-            self.conversation_history.append({"role": "assistant", "content": response.content})
+            session.history.append({"role": "assistant", "content": response.content})
         
-        return response.content
+        yield {"type": "done", "response": response.content}
 
-    def _execute_tools(self, tool_calls):
-        results = []
-        
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            arguments = json.loads(tool_call.function.arguments)
-            
-            if function_name == "consultar_slots":  
-                result = simple_db.consultar_slots()
-            elif function_name == "agendar_slot":
-                slot_id = arguments["slot_id"]
-                patient_cpf = arguments["patient_cpf"]
-                result = simple_db.agendar_slot(slot_id, patient_cpf)
-            else:
-                result = {"error": f"Função {function_name} não encontrada"}
-            
-            results.append(result)
+    async def _execute_tools(self, tool_calls):
+        # Leituras rodam em paralelo; escritas em sequência (ver tool_executor.py)
+        runs = await self.executor.execute(tool_calls)
+        results = [run.result for run in runs]
         
         return results
 
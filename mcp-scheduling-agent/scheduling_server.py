@@ -1,14 +1,22 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import sys
 import os
 from mcp_scheduling import SchedulingAgent
+from request_handler import handle_request, handle_request_stream
+from shared_state import WORKERS
+from streaming import sse_event
+from tracing import METRICS_CONTENT_TYPE, render_metrics
 
 app = FastAPI(title="MCP Scheduling Server")
 agent = SchedulingAgent()
 
 class MessageRequest(BaseModel):
     message: str
+    session_id: str = "default"
+    # "conversational": o agente redige a resposta; "structured": devolve os resultados das tools
+    mode: str = "conversational"
 
 @app.on_event("startup")
 async def startup():
@@ -16,19 +24,27 @@ async def startup():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "service": "scheduling"}
+    """Prontidão: responde 503 se o LLM, o banco ou o estado compartilhado não estiverem utilizáveis"""
+    ready, checks = await agent.readiness()
+    body = {"status": "healthy" if ready else "unhealthy", "service": "scheduling", "worker": os.getpid(), "checks": checks}
+    return body if ready else JSONResponse(status_code=503, content=body)
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas no formato do Prometheus (tempos por etapa, tokens, custo estimado)"""
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
 @app.post("/mcp/process")
-async def process_message(request: MessageRequest):
-    try:
-        print(f"SCHEDULING: {request.message}")
-        result = agent.process_message(request.message)
-        print(f"SCHEDULING: {result}")
-        return {"success": True, "response": result}
-    except Exception as e:
-        print(f"SCHEDULING ERRO: {str(e)}")
-        return {"success": False, "error": str(e)}
+async def process_message(request: MessageRequest, x_trace_id: str = Header(None)):
+    return await handle_request(agent, "SCHEDULING", request.message, request.session_id, request.mode, x_trace_id)
+
+@app.post("/mcp/process/stream")
+async def process_message_stream(request: MessageRequest, x_trace_id: str = Header(None)):
+    """Mesma entrada de /mcp/process, com a resposta enviada aos poucos (server-sent events)"""
+    events = handle_request_stream(agent, "SCHEDULING", request.message, request.session_id, request.mode, x_trace_id)
+    return StreamingResponse((sse_event(event) async for event in events), media_type="text/event-stream")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=3001, log_level="info")
+    # Com MCP_WORKERS > 1 cada worker importa o app; sessões e cache ficam no estado compartilhado
+    uvicorn.run("scheduling_server:app", host="0.0.0.0", port=3001, workers=WORKERS, log_level="info")
@@ -0,0 +1,229 @@
+"""
+Arquivo de resultados de exames em SQLite
+Índices por paciente + data, paciente + tipo + data e pelo id do exame; as listagens
+são paginadas por cursor e não leem o laudo, que fica em uma tabela separada e é
+carregado (em trechos) só quando um exame específico é pedido. Anexos (PDFs, imagens)
+ficam em arquivos no diretório SHARED_DB_EXAM_FILES: o agente devolve só os metadados
+e um identificador, e o exam_server entrega o arquivo em /exams/{paciente}/attachments/{id}.
+Na primeira abertura, um banco vazio é populado com exams.json, se existir.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+from simple_db import DATA_DIR
+from storage import normalizar
+
+EXAMS_FILE = os.path.join(DATA_DIR, "exams.json")
+EXAMS_DB = os.getenv("SHARED_DB_EXAMS_PATH", os.path.join(DATA_DIR, "exams.db"))
+EXAM_FILES_DIR = os.getenv("SHARED_DB_EXAM_FILES", os.path.join(DATA_DIR, "exam_files"))
+# Tamanho máximo de página na listagem e de trecho do laudo devolvido por chamada
+LIMITE_MAXIMO = 50
+TRECHO_LAUDO = int(os.getenv("MCP_EXAM_RESULT_CHARS", "4000"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exams (
+    exam_id    TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    exam_type  TEXT NOT NULL,
+    type_key   TEXT,
+    date       TEXT NOT NULL,
+    result_size INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_exams_patient ON exams(patient_id, date, exam_id);
+CREATE INDEX IF NOT EXISTS idx_exams_type ON exams(patient_id, type_key, date, exam_id);
+
+-- Laudos fora da tabela principal: as listagens não passam por eles
+CREATE TABLE IF NOT EXISTS exam_results (
+    exam_id TEXT PRIMARY KEY REFERENCES exams(exam_id),
+    result  TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS exam_attachments (
+    attachment_id TEXT PRIMARY KEY,
+    exam_id       TEXT NOT NULL REFERENCES exams(exam_id),
+    file_name     TEXT NOT NULL,
+    content_type  TEXT NOT NULL,
+    size          INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_attachments_exam ON exam_attachments(exam_id);
+"""
+
+SQL_EXAMES = "SELECT exam_id, patient_id, exam_type, date, result_size FROM exams"
+SQL_POR_ID = SQL_EXAMES + " WHERE exam_id = ? AND patient_id = ?"
+SQL_TRECHO = "SELECT substr(result, ?, ?) FROM exam_results WHERE exam_id = ?"
+SQL_INSERIR = "INSERT OR REPLACE INTO exams (exam_id, patient_id, exam_type, type_key, date, result_size) VALUES (?, ?, ?, ?, ?, ?)"
+SQL_INSERIR_LAUDO = "INSERT OR REPLACE INTO exam_results (exam_id, result) VALUES (?, ?)"
+SQL_ANEXOS = "SELECT attachment_id, file_name, content_type, size FROM exam_attachments WHERE exam_id = ? ORDER BY attachment_id"
+SQL_ANEXO = ("SELECT a.file_name, a.content_type FROM exam_attachments a JOIN exams e ON e.exam_id = a.exam_id "
+             "WHERE a.attachment_id = ? AND e.patient_id = ?")
+SQL_INSERIR_ANEXO = "INSERT OR REPLACE INTO exam_attachments (attachment_id, exam_id, file_name, content_type, size) VALUES (?, ?, ?, ?, ?)"
+
+# Filtros opcionais da listagem; a ordem é do mais recente para o mais antigo
+FILTROS = {
+    "tipo": "type_key = ?",
+    "data_inicio": "date >= ?",
+    # "2025-03" inclui o mês inteiro: compara com o prefixo seguido do maior caractere
+    "data_fim": "date <= ? || char(1114111)",
+    "antes": "(date, exam_id) < (?, ?)",
+}
+
+
+def _exame(row):
+    exam_id, patient_id, exam_type, date, result_size = row
+    return {"examId": exam_id, "patientId": patient_id, "examType": exam_type, "date": date, "resultSize": result_size}
+
+
+class ExamStore:
+    def __init__(self, path=EXAMS_DB, seed_file=EXAMS_FILE, files_dir=EXAM_FILES_DIR):
+        self.path = path
+        self.files_dir = files_dir
+        self._local = threading.local()
+        self.conexao().executescript(SCHEMA)
+        if os.path.exists(seed_file):
+            with open(seed_file, "r", encoding="utf8") as file:
+                self.importar(json.load(file)["exams"], somente_se_vazio=True)
+
+    def conexao(self):
+        """Conexão da thread atual (sqlite3 não compartilha conexões entre threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def importar(self, exames, somente_se_vazio=False):
+        """Grava exames no formato de exams.json (com o laudo em "result"); retorna quantos gravou"""
+        conn = self.conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if somente_se_vazio and conn.execute("SELECT 1 FROM exams LIMIT 1").fetchone():
+                conn.execute("ROLLBACK")
+                return 0
+            for exame in exames:
+                result = exame.get("result", "")
+                conn.execute(SQL_INSERIR, (exame["examId"], exame["patientId"], exame["examType"],
+                                           normalizar(exame["examType"]), exame["date"], len(result)))
+                conn.execute(SQL_INSERIR_LAUDO, (exame["examId"], result))
+                for anexo in exame.get("attachments", []):
+                    caminho = os.path.join(self.files_dir, anexo["file"])
+                    size = os.path.getsize(caminho) if os.path.exists(caminho) else None
+                    conn.execute(SQL_INSERIR_ANEXO, (anexo["attachmentId"], exame["examId"], anexo["file"],
+                                                     anexo.get("contentType", "application/octet-stream"), size))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(exames)
+
+    def listar(self, patient_id, tipo=None, data_inicio=None, data_fim=None, limite=20, antes=None):
+        """Exames do paciente (sem laudo), do mais recente ao mais antigo
+
+        tipo chega normalizado; antes é a chave (data, exam_id) do último item da página anterior.
+        """
+        condicoes, parametros = ["patient_id = ?"], [patient_id]
+        for nome, valor in (("tipo", tipo), ("data_inicio", data_inicio), ("data_fim", data_fim), ("antes", antes)):
+            if not valor:
+                continue
+            condicoes.append(FILTROS[nome])
+            parametros += list(valor) if nome == "antes" else [valor]
+        sql = SQL_EXAMES + " WHERE " + " AND ".join(condicoes) + " ORDER BY date DESC, exam_id DESC LIMIT ?"
+        return [_exame(row) for row in self.conexao().execute(sql, parametros + [limite])]
+
+    def buscar(self, patient_id, exam_id):
+        """Metadados de um exame do paciente, ou None"""
+        row = self.conexao().execute(SQL_POR_ID, (exam_id, patient_id)).fetchone()
+        return _exame(row) if row else None
+
+    def laudo(self, exam_id, inicio=0, tamanho=TRECHO_LAUDO):
+        """Trecho do laudo a partir do caractere `inicio`"""
+        row = self.conexao().execute(SQL_TRECHO, (inicio + 1, tamanho, exam_id)).fetchone()
+        return row[0] if row else ""
+
+    def anexos(self, exam_id):
+        """Metadados dos anexos de um exame (sem abrir os arquivos)"""
+        return [{"attachmentId": attachment_id, "fileName": file_name, "contentType": content_type, "size": size}
+                for attachment_id, file_name, content_type, size in self.conexao().execute(SQL_ANEXOS, (exam_id,))]
+
+    def arquivo_anexo(self, patient_id, attachment_id):
+        """(caminho, content_type) do anexo, se pertencer a um exame do paciente; senão None"""
+        row = self.conexao().execute(SQL_ANEXO, (attachment_id, patient_id)).fetchone()
+        if row is None:
+            return None
+        base = os.path.realpath(self.files_dir)
+        caminho = os.path.realpath(os.path.join(base, row[0]))
+        # O nome vem do banco, mas não pode apontar para fora do diretório de anexos
+        if os.path.commonpath([base, caminho]) != base:
+            return None
+        return caminho, row[1]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def exam_store():
+    """Retorna o arquivo de exames (aberto uma única vez por processo)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ExamStore()
+    return _store
+
+
+def verificar():
+    """Abre o arquivo e faz uma leitura indexada (falha se o banco não responde)"""
+    exam_store().buscar("", "")
+
+
+def consultar_exames(patient_id, exam_id=None, exam_type=None, data_inicio=None, data_fim=None,
+                     limite=10, cursor=None, offset=0):
+    """Lista paginada dos exames do paciente ou, com exam_id, um exame com um trecho do laudo"""
+    store = exam_store()
+    if exam_id:
+        try:
+            offset = max(0, int(offset or 0))
+        except (TypeError, ValueError):
+            return {"success": False, "message": "Parâmetro offset inválido"}
+        exame = store.buscar(patient_id, exam_id)
+        if exame is None:
+            return {"success": False, "message": f"Exame {exam_id} não encontrado"}
+        exame["result"] = store.laudo(exam_id, offset)
+        fim = offset + len(exame["result"])
+        # Laudo maior que o trecho: o restante vem em outra chamada com next_offset
+        exame["next_offset"] = fim if fim < exame["resultSize"] else None
+        # Anexos só como referência: o arquivo é baixado do exam_server pela url
+        exame["attachments"] = [
+            {**anexo, "url": f"/exams/{patient_id}/attachments/{anexo['attachmentId']}"}
+            for anexo in store.anexos(exam_id)
+        ]
+        return {"success": True, "message": f"Exame {exam_id} encontrado", "data": exame}
+
+    try:
+        antes = tuple(cursor.split("|")) if cursor else None
+        if antes is not None and len(antes) != 2:
+            raise ValueError
+        limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    except (TypeError, ValueError):
+        return {"success": False, "message": "Parâmetros de paginação inválidos"}
+
+    # Pede um item a mais para saber se existe próxima página
+    encontrados = store.listar(patient_id, normalizar(exam_type), data_inicio, data_fim, limite + 1, antes)
+    exames = encontrados[:limite]
+    if not exames and not antes:
+        return {"success": False, "message": f"Nenhum exame encontrado para paciente {patient_id}"}
+
+    next_cursor = None
+    if len(encontrados) > limite:
+        next_cursor = f"{exames[-1]['date']}|{exames[-1]['examId']}"
+    for exame in exames:
+        del exame["patientId"]
+    return {
+        "success": True,
+        "message": f"Encontrados {len(exames)} exame(s)",
+        "data": {"patientId": patient_id, "exams": exames, "next_cursor": next_cursor}
+    }
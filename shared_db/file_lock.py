@@ -0,0 +1,65 @@
+"""
+Travas entre processos baseadas em arquivo (flock no Linux/macOS, msvcrt no Windows)
+Cada aquisição abre o seu próprio descritor, então a trava também exclui threads
+do mesmo processo. Uma mesma instância pode ser reentrada (o chamador protege a
+instância com um lock de thread). Chaves finas (slot, documento) são distribuídas
+em um número fixo de arquivos para não criar um arquivo por slot.
+"""
+import os
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCKS_DIR = os.path.join(os.path.dirname(__file__), "locks")
+
+# Quantidade de arquivos de trava por namespace (slots, pagamentos, ...)
+FAIXAS = 1024
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._nivel = 0
+
+    def __enter__(self):
+        self._nivel += 1
+        if self._nivel > 1:
+            return self
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.001)
+        return self
+
+    def __exit__(self, *exc):
+        self._nivel -= 1
+        if self._nivel > 0:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+def trava(namespace, chave, diretorio=LOCKS_DIR):
+    """Trava exclusiva para uma chave (ex: trava("slot", "SLOT-001"))"""
+    faixa = zlib.crc32(str(chave).encode('utf-8')) % FAIXAS
+    return FileLock(os.path.join(diretorio, f"{namespace}-{faixa}.lock"))
@@ -0,0 +1,59 @@
+"""
+Backend JSON: snapshots appointments.json/payments.json + write-ahead log
+"""
+from payment_store import PaymentStore
+from slot_store import SlotStore
+from storage import StorageBackend
+
+
+class JsonBackend(StorageBackend):
+    def __init__(self, db_file, payments_file):
+        self.slots = SlotStore(db_file)
+        self.payments = PaymentStore(payments_file)
+
+    def consultar_slots(self):
+        return self.slots.slots()
+
+    def buscar_slot(self, slot_id):
+        return self.slots.buscar(slot_id)
+
+    def buscar_por_paciente(self, documento):
+        return self.slots.buscar_por_paciente(documento)
+
+    def filtrar_slots(self, data_inicio=None, data_fim=None, especialidade=None, medico=None,
+                      apenas_disponiveis=True, limite=20, apos=None):
+        return self.slots.filtrar(data_inicio, data_fim, especialidade, medico,
+                                  apenas_disponiveis, limite, apos)
+
+    def proximos_livres(self, inicio, data_fim=None, hora_inicio=None, hora_fim=None,
+                        especialidade=None, medico=None, limite=5):
+        return self.slots.proximos_livres(inicio, data_fim, hora_inicio, hora_fim, especialidade, medico, limite)
+
+    def reservar(self, slot_id, documento):
+        return self.slots.reservar(slot_id, documento)
+
+    def liberar(self, slot_id, documento=None):
+        return self.slots.liberar(slot_id, documento)
+
+    def remarcar(self, slot_antigo, slot_novo, documento):
+        return self.slots.remarcar(slot_antigo, slot_novo, documento)
+
+    def adicionar_pagamento(self, payment, idempotency_key=None):
+        return self.payments.adicionar(payment, idempotency_key)
+
+    def reembolsar(self, document, payment_id=None):
+        return self.payments.reembolsar(document, payment_id)
+
+    def saldo(self, document):
+        return self.payments.saldo(document)
+
+    def totais_dia(self, date):
+        return self.payments.totais_dia(date)
+
+    def versao(self, tabela):
+        store = self.slots if tabela == "slots" else self.payments
+        return store.versao()
+
+    def compactar(self):
+        self.slots.compactar()
+        self.payments.compactar()
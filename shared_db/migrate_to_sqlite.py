@@ -0,0 +1,60 @@
+"""
+Migração única de appointments.json/payments.json (incluindo o WAL pendente) para SQLite
+Uso: python migrate_to_sqlite.py [caminho_do_banco.db]
+"""
+import json
+import sys
+
+import simple_db
+from json_backend import JsonBackend
+from sqlite_backend import SQLiteBackend, inserir_lancamento
+from storage import normalizar
+
+
+def migrar(db_file=simple_db.DB_FILE, payments_file=simple_db.PAYMENTS_FILE, sqlite_file=simple_db.SQLITE_FILE):
+    """Copia slots e pagamentos para o SQLite; retorna a quantidade migrada"""
+    origem = JsonBackend(db_file, payments_file)
+    destino = SQLiteBackend(sqlite_file)
+
+    slots = origem.consultar_slots()
+    origem.payments.atualizar()
+    # Livro de pagamentos (um payments.json no formato antigo já é convertido ao carregar)
+    lancamentos = origem.payments.data["ledger"]
+
+    with destino.transacao() as conn:
+        if conn.execute("SELECT COUNT(*) FROM slots").fetchone()[0] or \
+                conn.execute("SELECT COUNT(*) FROM ledger").fetchone()[0]:
+            raise RuntimeError(f"O banco {sqlite_file} já contém dados; migração não realizada")
+
+        for date, slots_do_dia in slots.items():
+            for slot in slots_do_dia:
+                conn.execute(
+                    "INSERT INTO slots (slot_id, date, time, doctor_id, doctor_name, doctor_key, specialties, available, patient) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (slot["slot_id"], date, slot["time"], slot.get("doctor_id"), slot.get("doctor_name"),
+                     normalizar(slot.get("doctor_name")),
+                     json.dumps(slot.get("specialties", []), ensure_ascii=False),
+                     1 if slot.get("available") else 0, slot.get("patient"))
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO slot_specialties (specialty, slot_id) VALUES (?, ?)",
+                    [(normalizar(especialidade), slot["slot_id"]) for especialidade in slot.get("specialties", [])]
+                )
+
+        # Mantém os ids, que os estornos referenciam; saldos e totais vêm dos triggers
+        for lancamento in lancamentos:
+            inserir_lancamento(conn, lancamento)
+
+    total_slots = sum(len(slots_do_dia) for slots_do_dia in slots.values())
+    return {"slots": total_slots, "payments": len(lancamentos)}
+
+
+if __name__ == "__main__":
+    destino = sys.argv[1] if len(sys.argv) > 1 else simple_db.SQLITE_FILE
+    try:
+        resultado = migrar(sqlite_file=destino)
+    except RuntimeError as e:
+        print(f"[!] {e}")
+        sys.exit(1)
+    print(f"[*] Migrados {resultado['slots']} slots e {resultado['payments']} lançamentos de pagamento para {destino}")
+    print("[*] Para usar o SQLite, defina SHARED_DB_BACKEND=sqlite")
@@ -0,0 +1,135 @@
+"""
+Livro de pagamentos residente (somente inclusão)
+Mantém payments.json em memória; pagamentos e estornos são lançamentos anexados
+ao WAL (ver wal.py), e um reembolso nunca apaga o pagamento: anexa um estorno que
+o referencia. Índices em memória por documento, por data normalizada, pagamentos
+ativos e chaves de idempotência; saldos e totais diários são atualizados a cada
+lançamento, então consultá-los não depende do tamanho do livro.
+"""
+from storage import estorno, normalizar_data
+from wal import JournaledStore
+
+
+class PaymentStore(JournaledStore):
+    def __init__(self, path, **kwargs):
+        self.por_documento = {}  # documento -> [lançamentos]
+        self.por_data = {}       # AAAA-MM-DD -> [lançamentos]
+        self.ativos = {}         # documento -> {id: pagamento sem estorno} (ordem de inclusão)
+        self.chaves = {}         # chave de idempotência -> lançamento
+        self.saldos = {}         # documento -> centavos
+        self.totais = {}         # AAAA-MM-DD -> {"pagamentos_centavos", "reembolsos_centavos", "quantidade"}
+        super().__init__(path, **kwargs)
+
+    def _indexar(self):
+        self.por_documento = {}
+        self.por_data = {}
+        self.ativos = {}
+        self.chaves = {}
+        self.saldos = {}
+        self.totais = {}
+        if "ledger" not in self.data:
+            # Formato antigo (lista "payments"): vira o livro na memória e no próximo snapshot
+            legado = self.data.pop("payments", [])
+            self.data["ledger"] = []
+            for payment in legado:
+                self._lancar(_pagamento_legado(payment))
+            return
+        for lancamento in self.data["ledger"]:
+            self._indexar_lancamento(lancamento)
+
+    def _aplicar(self, registro):
+        if registro["op"] == "lancamento":
+            self._lancar(dict(registro["entry"]))
+        # Registros gravados antes do livro (WAL de uma versão anterior)
+        elif registro["op"] == "add_payment":
+            self._lancar(_pagamento_legado(registro["payment"]))
+        elif registro["op"] == "refund":
+            pagamento = next(iter(self.ativos.get(registro["document"], {}).values()), None)
+            if pagamento is not None:
+                self._lancar(estorno(pagamento))
+
+    def _lancar(self, lancamento):
+        # O id é a posição no livro: o WAL tem a mesma ordem em todos os processos
+        lancamento["id"] = len(self.data["ledger"]) + 1
+        self.data["ledger"].append(lancamento)
+        self._indexar_lancamento(lancamento)
+
+    def _indexar_lancamento(self, lancamento):
+        document = lancamento["document"]
+        self.por_documento.setdefault(document, []).append(lancamento)
+        self.por_data.setdefault(lancamento["date"], []).append(lancamento)
+        totais = self.totais.setdefault(lancamento["date"], {"pagamentos_centavos": 0, "reembolsos_centavos": 0,
+                                                              "quantidade": 0})
+        totais["quantidade"] += 1
+        if lancamento["kind"] == "payment":
+            self.ativos.setdefault(document, {})[lancamento["id"]] = lancamento
+            self.saldos[document] = self.saldos.get(document, 0) + lancamento["amount_cents"]
+            totais["pagamentos_centavos"] += lancamento["amount_cents"]
+        else:
+            self.ativos.get(document, {}).pop(lancamento["reverses"], None)
+            self.saldos[document] = self.saldos.get(document, 0) - lancamento["amount_cents"]
+            totais["reembolsos_centavos"] += lancamento["amount_cents"]
+        if lancamento.get("idempotency_key"):
+            self.chaves[lancamento["idempotency_key"]] = lancamento
+
+    def _registrar_lancamento(self, lancamento):
+        """Anexa ao WAL; retorna (ticket, lançamento com id)"""
+        with self._lock:
+            ticket = self.registrar({"op": "lancamento", "entry": lancamento})
+            return ticket, self.data["ledger"][-1]
+
+    def adicionar(self, payment, idempotency_key=None):
+        """Registra um novo pagamento; retorna (lançamento, criado)"""
+        if not idempotency_key:
+            ticket, lancamento = self._registrar_lancamento(payment)
+        else:
+            # A trava da chave cobre a verificação e o anexo, também entre processos
+            with self.trava("idempotencia", idempotency_key):
+                self.atualizar()
+                existente = self.chaves.get(idempotency_key)
+                if existente is not None:
+                    return existente, False
+                ticket, lancamento = self._registrar_lancamento({**payment, "idempotency_key": idempotency_key})
+        self.confirmar(ticket)
+        return lancamento, True
+
+    def reembolsar(self, document, payment_id=None):
+        """Estorna o pagamento ativo mais antigo do documento (ou payment_id); retorna (estorno, pagamento) ou None"""
+        with self.trava("pagamento", document):
+            self.atualizar()
+            ativos = self.ativos.get(document, {})
+            pagamento = ativos.get(payment_id) if payment_id else next(iter(ativos.values()), None)
+            if pagamento is None:
+                return None
+            ticket, lancamento = self._registrar_lancamento(estorno(pagamento))
+        self.confirmar(ticket)
+        return lancamento, pagamento
+
+    def saldo(self, document):
+        with self._lock:
+            self.atualizar()
+            return {
+                "saldo_centavos": self.saldos.get(document, 0),
+                "lancamentos": len(self.por_documento.get(document, [])),
+                "ativos": list(self.ativos.get(document, {}).values()),
+            }
+
+    def totais_dia(self, date):
+        with self._lock:
+            self.atualizar()
+            return dict(self.totais.get(date, {"pagamentos_centavos": 0, "reembolsos_centavos": 0, "quantidade": 0}))
+
+
+def _pagamento_legado(payment):
+    """Pagamento no formato antigo ({patient_name, document, date, specialty}) como lançamento"""
+    return {
+        "kind": "payment",
+        "document": payment["document"],
+        "patient_name": payment.get("patient_name"),
+        "date": normalizar_data(payment.get("date")) or payment.get("date"),
+        "specialty": payment.get("specialty"),
+        "amount_cents": payment.get("amount_cents", 0),
+        "reverses": None,
+        "idempotency_key": None,
+        "created_at": payment.get("created_at"),
+    }
@@ -1,60 +1,155 @@
 """
 Módulo simples de acesso ao banco de dados compartilhado
-Funções: consultar, agendar, liberar, buscar por documento, add_payment e refund
+Funções: consultar, buscar (filtrada/paginada), próximo horário livre, agendar, liberar,
+remarcar (atômico), buscar por documento, add_payment, refund, saldo_paciente e totais_do_dia (livro de pagamentos somente inclusão)
+O armazenamento é plugável (JSON + write-ahead log ou SQLite), ver storage.py
 """
 import json
 import os
+import threading
 from datetime import datetime
 
-DB_FILE = os.path.join(os.path.dirname(__file__), "appointments.json")
-PAYMENTS_FILE = os.path.join(os.path.dirname(__file__), "payments.json")
+from storage import criar_backend, nome_backend, normalizar, normalizar_data, normalizar_hora
+
+# Diretório dos dados (SHARED_DB_DIR permite apontar para outra base, ex: benchmarks)
+DATA_DIR = os.getenv("SHARED_DB_DIR", os.path.dirname(__file__))
+DB_FILE = os.path.join(DATA_DIR, "appointments.json")
+PAYMENTS_FILE = os.path.join(DATA_DIR, "payments.json")
+# Valor lançado quando o pagamento não informa o valor da consulta
+VALOR_PADRAO = float(os.getenv("SHARED_DB_DEFAULT_AMOUNT", "0"))
+# Tamanho máximo de página em buscar_slots (evita mandar a agenda inteira ao LLM)
+LIMITE_MAXIMO = 50
+
+SQLITE_FILE = os.getenv("SHARED_DB_SQLITE_PATH", os.path.join(DATA_DIR, "health.db"))
+
+# Backend escolhido por SHARED_DB_BACKEND: "json" (snapshot + WAL, ver json_backend.py)
+# ou "sqlite" (ver sqlite_backend.py). Os dados ficam residentes/indexados no backend.
+_backend = None
+_backend_lock = threading.Lock()
+
+def _storage():
+    """Retorna o backend de armazenamento (criado uma única vez por processo)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = criar_backend(nome_backend(), DB_FILE, PAYMENTS_FILE, SQLITE_FILE)
+    return _backend
+
+def compactar():
+    """Manutenção do backend (snapshot + WAL vazio no JSON, checkpoint no SQLite)"""
+    _storage().compactar()
+
+def versao_dados(tabela):
+    """Versão atual de "slots" ou "pagamentos" (muda a cada escrita, em qualquer processo)"""
+    return _storage().versao(tabela)
+
+def verificar():
+    """Carrega o backend e faz uma leitura indexada (falha se o banco não responde)"""
+    storage = _storage()
+    storage.buscar_slot("")
+    storage.versao("slots")
 
 def consultar_slots():
     """Retorna todos os slots do banco"""
-    with open(DB_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return data["available_slots"]
+    return _storage().consultar_slots()
+
+def buscar_slots(data_inicio=None, data_fim=None, especialidade=None, medico=None,
+                 apenas_disponiveis=True, limite=10, cursor=None):
+    """Consulta filtrada e paginada da agenda (datas no formato YYYY-MM-DD)"""
+    try:
+        apos = tuple(cursor.split("|")) if cursor else None
+        if apos is not None and len(apos) != 3:
+            raise ValueError
+        limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    except (TypeError, ValueError):
+        return {"success": False, "error": "Parâmetros de paginação inválidos"}
+    
+    # Pede um item a mais para saber se existe próxima página
+    encontrados = _storage().filtrar_slots(
+        data_inicio, data_fim, normalizar(especialidade), normalizar(medico),
+        apenas_disponiveis, limite + 1, apos
+    )
+    pagina = encontrados[:limite]
+    
+    slots = [{
+        "date": date,
+        "slot_id": slot["slot_id"],
+        "time": slot["time"],
+        "doctor_id": slot["doctor_id"],
+        "doctor_name": slot["doctor_name"],
+        "specialties": slot["specialties"],
+        "available": slot["available"]
+    } for date, slot in pagina]
+    
+    next_cursor = None
+    if len(encontrados) > limite:
+        next_cursor = "|".join([slots[-1]["date"], slots[-1]["time"], slots[-1]["slot_id"]])
+    
+    return {"success": True, "total": len(slots), "slots": slots, "next_cursor": next_cursor}
+
+def buscar_proximo_horario(especialidade=None, medico=None, data_inicio=None, data_fim=None,
+                           hora_inicio=None, hora_fim=None, limite=5):
+    """Primeiros horários livres a partir de agora (ou de data_inicio), com janela de horário por dia"""
+    agora = datetime.now()
+    inicio = normalizar_data(data_inicio) if data_inicio else agora.date().isoformat()
+    fim = normalizar_data(data_fim) if data_fim else None
+    janela = (normalizar_hora(hora_inicio), normalizar_hora(hora_fim))
+    if inicio is None or (data_fim and fim is None) or (hora_inicio and janela[0] is None) or \
+            (hora_fim and janela[1] is None):
+        return {"success": False, "error": "Parâmetros inválidos (datas AAAA-MM-DD, horários HH:MM)"}
+    try:
+        limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    except (TypeError, ValueError):
+        return {"success": False, "error": "Parâmetros inválidos (limite)"}
+    
+    # Hoje, só horários que ainda não passaram
+    hora_minima = agora.strftime("%H:%M") if inicio == agora.date().isoformat() else ""
+    encontrados = _storage().proximos_livres(
+        (inicio, hora_minima), fim, janela[0], janela[1], normalizar(especialidade), normalizar(medico), limite
+    )
+    
+    slots = [{
+        "date": date,
+        "slot_id": slot["slot_id"],
+        "time": slot["time"],
+        "doctor_id": slot["doctor_id"],
+        "doctor_name": slot["doctor_name"],
+        "specialties": slot["specialties"]
+    } for date, slot in encontrados]
+    
+    return {"success": True, "total": len(slots), "slots": slots}
 
 def agendar_slot(slot_id, patient_cpf):
-    """Marca um slot como ocupado por um paciente"""
-    with open(DB_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    # Procura o slot e marca como ocupado
-    for date, slots in data["available_slots"].items():
-        for slot in slots:
-            if slot["slot_id"] == slot_id:
-                slot["available"] = False
-                slot["patient"] = patient_cpf
-                
-                # Salva as mudanças
-                with open(DB_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                
-                return {"success": True, "message": "Slot agendado"}
+    """Marca um slot como ocupado por um paciente (somente se ainda estiver livre)"""
+    status = _storage().reservar(slot_id, patient_cpf)
+    
+    if status == "agendado":
+        return {"success": True, "message": "Slot agendado"}
+    if status == "ja_agendado":
+        return {"success": True, "message": "Slot já estava agendado para este paciente"}
+    if status == "ocupado":
+        return {"success": False, "error": "Slot já está ocupado por outro paciente"}
     
     return {"success": False, "error": "Slot não encontrado"}
 
 def buscar_por_documento(documento):
     """Busca slot ocupado por um documento específico"""
-    with open(DB_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    # Procura o paciente em todas as datas
-    for date, slots in data["available_slots"].items():
-        for slot in slots:
-            if slot.get("patient") == documento:
-                return {
-                    "success": True,
-                    "found": True,
-                    "data": {
-                        "date": date,
-                        "slot_id": slot["slot_id"],
-                        "time": slot["time"],
-                        "doctor_name": slot["doctor_name"],
-                        "specialties": slot["specialties"]
-                    }
-                }
+    encontrados = _storage().buscar_por_paciente(documento)
+    
+    if encontrados:
+        date, slot = encontrados[0]
+        return {
+            "success": True,
+            "found": True,
+            "data": {
+                "date": date,
+                "slot_id": slot["slot_id"],
+                "time": slot["time"],
+                "doctor_name": slot["doctor_name"],
+                "specialties": slot["specialties"]
+            }
+        }
     
     return {
         "success": True,
@@ -62,62 +157,130 @@ def buscar_por_documento(documento):
         "message": f"Nenhum agendamento encontrado para o documento {documento}"
     }
 
-def liberar_slot(slot_id):
-    """Libera um slot ocupado"""
-    with open(DB_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    # Procura o slot e libera
-    for date, slots in data["available_slots"].items():
-        for slot in slots:
-            if slot["slot_id"] == slot_id:
-                slot["available"] = True
-                slot["patient"] = None
-                
-                # Salva as mudanças
-                with open(DB_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                
-                return {"success": True, "message": "Slot liberado"}
+def liberar_slot(slot_id, documento=None):
+    """Libera um slot ocupado (se documento for informado, só libera o slot desse paciente)"""
+    status = _storage().liberar(slot_id, documento)
+    
+    if status == "liberado":
+        return {"success": True, "message": "Slot liberado"}
+    if status == "outro_paciente":
+        return {"success": False, "error": "Slot não pertence a este paciente"}
+    
+    return {"success": False, "error": "Slot não encontrado"}
+
+def remarcar(slot_novo, patient_cpf, slot_antigo=None):
+    """Troca o agendamento do paciente para slot_novo numa única operação (libera e agenda juntos)
+
+    Sem slot_antigo, usa o agendamento atual do paciente (só quando ele tem um único agendamento).
+    """
+    if not slot_antigo:
+        agendados = [slot["slot_id"] for _, slot in _storage().buscar_por_paciente(patient_cpf)]
+        # Nova tentativa de uma remarcação já feita: o único agendamento do paciente já é o novo slot
+        if agendados == [slot_novo]:
+            return {"success": True, "message": f"Consulta já estava remarcada para {slot_novo}"}
+        if not agendados:
+            return {"success": False, "error": f"Nenhum agendamento encontrado para o documento {patient_cpf}"}
+        if len(agendados) > 1:
+            return {"success": False, "error": f"O paciente tem {len(agendados)} agendamentos ({', '.join(agendados)}): "
+                                               "informe slot_antigo"}
+        slot_antigo = agendados[0]
+    
+    status = _storage().remarcar(slot_antigo, slot_novo, patient_cpf)
+    
+    if status == "remarcado":
+        return {"success": True, "message": f"Consulta remarcada de {slot_antigo} para {slot_novo}"}
+    if status == "ja_remarcado":
+        return {"success": True, "message": f"Consulta já estava remarcada para {slot_novo}"}
+    if status == "mesmo_slot":
+        return {"success": False, "error": "O novo horário é o mesmo do agendamento atual"}
+    if status == "outro_paciente":
+        return {"success": False, "error": f"Slot {slot_antigo} não pertence a este paciente"}
+    if status == "ocupado":
+        return {"success": False, "error": f"Slot {slot_novo} já está ocupado; o agendamento atual foi mantido"}
     
     return {"success": False, "error": "Slot não encontrado"}
 
-def add_payment(patient_name, document, date, specialty):
-    """Adiciona um pagamento simples ao banco de dados"""
-    with open(PAYMENTS_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+def add_payment(patient_name, document, date, specialty, amount=None, idempotency_key=None):
+    """Lança um pagamento no livro (com idempotency_key, uma nova tentativa não duplica o pagamento)"""
+    data_pagamento = normalizar_data(date)
+    if data_pagamento is None:
+        return {"success": False, "error": f"Data inválida: {date} (use AAAA-MM-DD ou DD/MM/AAAA)"}
+    try:
+        amount_cents = round(float(VALOR_PADRAO if amount is None else amount) * 100)
+        if amount_cents < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return {"success": False, "error": f"Valor inválido: {amount}"}
     
-    # Cria novo pagamento simples
     new_payment = {
-        "patient_name": patient_name,
+        "kind": "payment",
         "document": document,
-        "date": date,
-        "specialty": specialty
+        "patient_name": patient_name,
+        "date": data_pagamento,
+        "specialty": specialty,
+        "amount_cents": amount_cents,
+        "reverses": None,
+        "created_at": datetime.now().isoformat(timespec="seconds")
     }
     
-    # Adiciona ao array
-    data["payments"].append(new_payment)
+    lancamento, criado = _storage().adicionar_pagamento(new_payment, idempotency_key)
     
-    # Salva as mudanças
-    with open(PAYMENTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    
-    return {"success": True, "message": f"Pagamento de {patient_name} processado"}
+    if not criado:
+        return {"success": True, "message": f"Pagamento de {lancamento['patient_name']} já registrado",
+                "payment": _pagamento(lancamento)}
+    return {"success": True, "message": f"Pagamento de {patient_name} processado", "payment": _pagamento(lancamento)}
 
-def refund(document):
-    """Remove pagamento do banco (reembolso)"""
-    with open(PAYMENTS_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+def refund(document, payment_id=None):
+    """Estorna o pagamento ativo mais antigo do documento (ou payment_id); o pagamento continua no livro"""
+    # O LLM pode mandar o id como texto ("1"): os dois backends recebem o mesmo inteiro
+    try:
+        payment_id = int(payment_id) if payment_id not in (None, "") else None
+    except (TypeError, ValueError):
+        return {"success": False, "error": f"ID de pagamento inválido: {payment_id}"}
+    resultado = _storage().reembolsar(document, payment_id)
     
-    # Busca e remove pagamento por documento
-    for i, payment in enumerate(data["payments"]):
-        if payment["document"] == document:
-            removed_payment = data["payments"].pop(i)
-            
-            # Salva as mudanças
-            with open(PAYMENTS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            return {"success": True, "message": f"Reembolso processado para {removed_payment['patient_name']}"}
+    if resultado:
+        lancamento, pagamento = resultado
+        return {"success": True, "message": f"Reembolso processado para {pagamento['patient_name']}",
+                "refund_id": lancamento["id"], "payment": _pagamento(pagamento)}
     
-    return {"success": False, "error": f"Nenhum pagamento encontrado para o documento {document}"}
\ No newline at end of file
+    return {"success": False, "error": f"Nenhum pagamento encontrado para o documento {document}"}
+
+def saldo_paciente(document):
+    """Total pago (pagamentos menos estornos) e pagamentos ativos do documento"""
+    saldo = _storage().saldo(document)
+    return {
+        "success": True,
+        "data": {
+            "document": document,
+            "balance": saldo["saldo_centavos"] / 100,
+            "entries": saldo["lancamentos"],
+            "active_payments": [_pagamento(pagamento) for pagamento in saldo["ativos"]]
+        }
+    }
+
+def totais_do_dia(date):
+    """Pagamentos, estornos e valor líquido lançados em uma data"""
+    data = normalizar_data(date)
+    if data is None:
+        return {"success": False, "error": f"Data inválida: {date} (use AAAA-MM-DD ou DD/MM/AAAA)"}
+    totais = _storage().totais_dia(data)
+    return {
+        "success": True,
+        "data": {
+            "date": data,
+            "payments": totais["pagamentos_centavos"] / 100,
+            "refunds": totais["reembolsos_centavos"] / 100,
+            "net": (totais["pagamentos_centavos"] - totais["reembolsos_centavos"]) / 100,
+            "entries": totais["quantidade"]
+        }
+    }
+
+def _pagamento(lancamento):
+    return {
+        "payment_id": lancamento["id"],
+        "patient_name": lancamento["patient_name"],
+        "date": lancamento["date"],
+        "specialty": lancamento["specialty"],
+        "amount": lancamento["amount_cents"] / 100
+    }
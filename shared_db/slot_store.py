@@ -0,0 +1,359 @@
+"""
+Armazenamento residente dos slots com índices em memória
+Carrega o appointments.json uma vez e mantém índices por slot_id, paciente,
+data, especialidade e médico. Mutações vão para o WAL (ver wal.py) e o
+snapshot só é relido quando muda no disco. Agendamentos usam compare-and-set
+sob uma trava por slot, então vários processos podem agendar ao mesmo tempo.
+Os horários livres também ficam ordenados por dia, no geral e por especialidade e
+médico (ver Disponibilidade), para achar o próximo horário sem varrer a agenda.
+"""
+import json
+from bisect import bisect_left, insort
+from contextlib import ExitStack
+from functools import lru_cache
+
+from storage import normalizar
+from wal import JournaledStore
+
+# Os mesmos nomes de especialidade e médico se repetem em milhares de slots
+_chave = lru_cache(maxsize=4096)(normalizar)
+
+
+def _estrutura(estruturas, chave):
+    """Disponibilidade da chave, criada na primeira vez (sem instanciar uma a cada consulta)"""
+    disponibilidade = estruturas.get(chave)
+    if disponibilidade is None:
+        disponibilidade = estruturas[chave] = Disponibilidade()
+    return disponibilidade
+
+
+class SlotStore(JournaledStore):
+    def __init__(self, path, **kwargs):
+        self.por_id = {}             # slot_id -> (data, slot)
+        self.por_paciente = {}       # documento -> {slot_id: None} (ordem de inserção)
+        self.por_data = {}           # data -> [slot_id] ordenados por horário
+        self.por_especialidade = {}  # especialidade normalizada -> {slot_id: None} (ordem cronológica)
+        self.por_medico = {}         # doctor_id e nome normalizados -> {slot_id: None} (ordem cronológica)
+        self.ordem_especialidade = {}  # especialidade normalizada -> [slot_id] ordenados por (data, hora, slot_id)
+        self.ordem_medico = {}         # doctor_id e nome normalizados -> [slot_id] ordenados
+        self.datas = []              # datas ordenadas (busca por intervalo com bisect)
+        self.livres = Disponibilidade()          # horários livres de todos os médicos
+        self.livres_especialidade = {}           # especialidade normalizada -> Disponibilidade
+        self.livres_medico = {}                  # doctor_id e nome normalizados -> Disponibilidade
+        super().__init__(path, **kwargs)
+
+    def _indexar(self):
+        self.por_id = {}
+        self.por_paciente = {}
+        self.por_data = {}
+        self.por_especialidade = {}
+        self.por_medico = {}
+        self.livres = Disponibilidade()
+        self.livres_especialidade = {}
+        self.livres_medico = {}
+        agenda = self.data["available_slots"]
+        self.datas = sorted(agenda)
+        # Uma passada em ordem cronológica: os índices ordenados são montados só com anexos
+        for date in self.datas:
+            slots = sorted(agenda[date], key=lambda slot: (slot["time"], slot["slot_id"]))
+            self.por_data[date] = [slot["slot_id"] for slot in slots]
+            for slot in slots:
+                self._indexar_slot(date, slot)
+        # Data e horário de um slot não mudam: a ordem cronológica da carga vale até a próxima carga
+        self.ordem_especialidade = {chave: list(ids) for chave, ids in self.por_especialidade.items()}
+        self.ordem_medico = {chave: list(ids) for chave, ids in self.por_medico.items()}
+
+    def _chaves(self, slot):
+        """Especialidades e médico (doctor_id e nome) normalizados do slot"""
+        especialidades = [_chave(especialidade) for especialidade in slot.get("specialties", [])]
+        medicos = {_chave(slot.get("doctor_id")), _chave(slot.get("doctor_name"))} - {None}
+        return especialidades, medicos
+
+    def _disponibilidades(self, slot):
+        """Estruturas de horários livres em que o slot entra (geral, especialidades, médico)"""
+        especialidades, medicos = self._chaves(slot)
+        estruturas = [self.livres]
+        for especialidade in especialidades:
+            estruturas.append(_estrutura(self.livres_especialidade, especialidade))
+        for medico in medicos:
+            estruturas.append(_estrutura(self.livres_medico, medico))
+        return estruturas
+
+    def _indexar_slot(self, date, slot):
+        slot_id = slot["slot_id"]
+        self.por_id[slot_id] = (date, slot)
+        especialidades, medicos = self._chaves(slot)
+        for especialidade in especialidades:
+            self.por_especialidade.setdefault(especialidade, {})[slot_id] = None
+        for medico in medicos:
+            self.por_medico.setdefault(medico, {})[slot_id] = None
+        if slot.get("patient"):
+            self.por_paciente.setdefault(slot["patient"], {})[slot_id] = None
+        if slot["available"]:
+            # Datas e horários chegam em ordem (ver _indexar): anexa sem busca binária
+            self.livres.anexar(date, slot["time"], slot_id)
+            for especialidade in especialidades:
+                _estrutura(self.livres_especialidade, especialidade).anexar(date, slot["time"], slot_id)
+            for medico in medicos:
+                _estrutura(self.livres_medico, medico).anexar(date, slot["time"], slot_id)
+
+    def _desindexar_paciente(self, slot_id, documento):
+        slots = self.por_paciente.get(documento)
+        if slots is not None:
+            slots.pop(slot_id, None)
+            if not slots:
+                del self.por_paciente[documento]
+
+    def _aplicar(self, registro):
+        if registro["op"] == "remarcar":
+            # Um único registro no WAL: libera o slot antigo e agenda o novo juntos
+            self._aplicar({"op": "liberar", "slot_id": registro["slot_id"]})
+            self._aplicar({"op": "agendar", "slot_id": registro["novo_slot_id"], "patient": registro["patient"]})
+            return
+        date, slot = self.por_id[registro["slot_id"]]
+        estava_livre = slot["available"]
+        if slot.get("patient"):
+            self._desindexar_paciente(slot["slot_id"], slot["patient"])
+        if registro["op"] == "agendar":
+            slot["available"] = False
+            slot["patient"] = registro["patient"]
+            self.por_paciente.setdefault(registro["patient"], {})[slot["slot_id"]] = None
+        elif registro["op"] == "liberar":
+            slot["available"] = True
+            slot["patient"] = None
+        if slot["available"] != estava_livre:
+            for disponibilidade in self._disponibilidades(slot):
+                if slot["available"]:
+                    disponibilidade.adicionar(date, slot["time"], slot["slot_id"])
+                else:
+                    disponibilidade.remover(date, slot["time"], slot["slot_id"])
+
+    def slots(self):
+        """Retorna uma cópia do dicionário data -> lista de slots
+
+        É uma cópia: alterar o resultado não pode mexer nos dados e índices residentes.
+        """
+        with self._lock:
+            self.atualizar()
+            return json.loads(json.dumps(self.data["available_slots"]))
+
+    def buscar(self, slot_id):
+        """Retorna (data, slot) ou None"""
+        with self._lock:
+            self.atualizar()
+            return self.por_id.get(slot_id)
+
+    def buscar_por_paciente(self, documento):
+        """Retorna os slots do paciente como lista de (data, slot), ordenada por data e hora"""
+        with self._lock:
+            self.atualizar()
+            encontrados = [self.por_id[slot_id] for slot_id in self.por_paciente.get(documento, {})]
+        return sorted(encontrados, key=lambda item: (item[0], item[1]["time"]))
+
+    def filtrar(self, data_inicio=None, data_fim=None, especialidade=None, medico=None,
+                apenas_disponiveis=True, limite=20, apos=None):
+        """Consulta filtrada usando os índices; retorna até `limite` itens (data, slot) ordenados"""
+        with self._lock:
+            self.atualizar()
+            return self._filtrar(data_inicio, data_fim, especialidade, medico, apenas_disponiveis, limite, apos)
+
+    def _filtrar(self, data_inicio, data_fim, especialidade, medico, apenas_disponiveis, limite, apos):
+
+        def aceita(date, slot):
+            if apenas_disponiveis and not slot["available"]:
+                return False
+            if data_inicio and date < data_inicio or data_fim and date > data_fim:
+                return False
+            return apos is None or (date, slot["time"], slot["slot_id"]) > apos
+
+        candidatos = []
+        if especialidade:
+            candidatos.append((self.livres_especialidade if apenas_disponiveis else self.ordem_especialidade,
+                               especialidade, self.por_especialidade))
+        if medico:
+            candidatos.append((self.livres_medico if apenas_disponiveis else self.ordem_medico, medico, self.por_medico))
+        if candidatos:
+            estruturas = [(ordenados.get(chave), indice.get(chave, {})) for ordenados, chave, indice in candidatos]
+            if any(ordenada is None for ordenada, _ in estruturas):
+                return []
+            # Percorre a menor estrutura ordenada a partir do início (ou do cursor) e confere os demais índices
+            ordenada, _ = min(estruturas, key=lambda e: e[0].total if apenas_disponiveis else len(e[0]))
+            outros = [indice for o, indice in estruturas if o is not ordenada]
+            inicio = max((data_inicio or "", "", ""), apos or ())
+            resultado = []
+            for slot_id in self._a_partir(ordenada, inicio, data_fim):
+                item = self.por_id[slot_id]
+                if all(slot_id in indice for indice in outros) and aceita(*item):
+                    resultado.append(item)
+                    if len(resultado) == limite:
+                        break
+            return resultado
+
+        # Sem filtro por especialidade/médico: percorre as datas em ordem a partir do início
+        inicio = max(filter(None, [data_inicio, apos[0] if apos else None]), default="")
+        resultado = []
+        for date in self.datas[bisect_left(self.datas, inicio):]:
+            if data_fim and date > data_fim:
+                break
+            for slot_id in self.por_data[date]:
+                item = self.por_id[slot_id]
+                if aceita(*item):
+                    resultado.append(item)
+                    if len(resultado) == limite:
+                        return resultado
+        return resultado
+
+    def _a_partir(self, ordenada, inicio, data_fim):
+        """slot_ids de uma Disponibilidade ou lista ordenada, a partir de inicio = (data, hora, slot_id)"""
+        if isinstance(ordenada, Disponibilidade):
+            for date, slot_id in ordenada.a_partir(inicio[:2], data_fim):
+                yield slot_id
+            return
+        ordem = lambda slot_id: (self.por_id[slot_id][0], self.por_id[slot_id][1]["time"], slot_id)
+        for i in range(bisect_left(ordenada, inicio, key=ordem), len(ordenada)):
+            slot_id = ordenada[i]
+            if data_fim and self.por_id[slot_id][0] > data_fim:
+                return
+            yield slot_id
+
+    def proximos_livres(self, inicio, data_fim=None, hora_inicio=None, hora_fim=None,
+                        especialidade=None, medico=None, limite=5):
+        """Primeiros slots livres a partir de inicio = (data, hora); retorna até `limite` itens (data, slot)"""
+        with self._lock:
+            self.atualizar()
+            candidatos = []
+            if especialidade:
+                candidatos.append((self.livres_especialidade.get(especialidade), self.por_especialidade.get(especialidade, {})))
+            if medico:
+                candidatos.append((self.livres_medico.get(medico), self.por_medico.get(medico, {})))
+            if any(disponibilidade is None for disponibilidade, _ in candidatos):
+                return []
+            # Percorre a menor estrutura e confere os demais filtros pelos índices de slot_id
+            disponibilidade, _ = min(candidatos, key=lambda c: c[0].total, default=(self.livres, None))
+            outros = [indice for d, indice in candidatos if d is not disponibilidade]
+            resultado = []
+            for date, slot_id in disponibilidade.a_partir(inicio, data_fim, hora_inicio, hora_fim):
+                if all(slot_id in indice for indice in outros):
+                    resultado.append(self.por_id[slot_id])
+                    if len(resultado) == limite:
+                        break
+            return resultado
+
+    def reservar(self, slot_id, documento):
+        """Agenda o slot somente se ainda estiver livre (compare-and-set sob trava do slot)
+
+        Retorna "agendado", "ja_agendado" (mesmo paciente), "ocupado" ou "nao_encontrado".
+        """
+        with self.trava("slot", slot_id):
+            self.atualizar()
+            item = self.por_id.get(slot_id)
+            if item is None:
+                return "nao_encontrado"
+            slot = item[1]
+            if not slot["available"]:
+                return "ja_agendado" if slot.get("patient") == documento else "ocupado"
+            ticket = self.registrar({"op": "agendar", "slot_id": slot_id, "patient": documento})
+        self.confirmar(ticket)
+        return "agendado"
+
+    def liberar(self, slot_id, documento=None):
+        """Libera o slot; se documento for informado, só libera se o slot for dele
+
+        Retorna "liberado", "outro_paciente" ou "nao_encontrado".
+        """
+        with self.trava("slot", slot_id):
+            self.atualizar()
+            item = self.por_id.get(slot_id)
+            if item is None:
+                return "nao_encontrado"
+            if documento is not None and item[1].get("patient") != documento:
+                return "outro_paciente"
+            ticket = self.registrar({"op": "liberar", "slot_id": slot_id})
+        self.confirmar(ticket)
+        return "liberado"
+
+    def remarcar(self, slot_antigo, slot_novo, documento):
+        """Troca o slot do paciente de uma vez: libera o antigo e agenda o novo (ou nenhum dos dois)
+
+        Trava os dois slots em ordem fixa (dois remarcar cruzados não se bloqueiam) e grava um
+        único registro no WAL. Retorna "remarcado", "ja_remarcado", "mesmo_slot", "nao_encontrado",
+        "outro_paciente" (o slot antigo não é do paciente) ou "ocupado" (o novo não está livre).
+        """
+        if slot_antigo == slot_novo:
+            return "mesmo_slot"
+        # Os dois slots podem cair no mesmo arquivo de trava: cada arquivo é travado uma vez
+        travas = {trava.path: trava for trava in (self.trava("slot", slot_antigo), self.trava("slot", slot_novo))}
+        with ExitStack() as pilha:
+            for path in sorted(travas):
+                pilha.enter_context(travas[path])
+            self.atualizar()
+            antigo, novo = self.por_id.get(slot_antigo), self.por_id.get(slot_novo)
+            if antigo is None or novo is None:
+                return "nao_encontrado"
+            if not novo[1]["available"]:
+                # Nova tentativa de uma remarcação já feita
+                if novo[1].get("patient") == documento and antigo[1].get("patient") != documento:
+                    return "ja_remarcado"
+                return "ocupado"
+            if antigo[1].get("patient") != documento:
+                return "outro_paciente"
+            ticket = self.registrar({"op": "remarcar", "slot_id": slot_antigo, "novo_slot_id": slot_novo,
+                                     "patient": documento})
+        self.confirmar(ticket)
+        return "remarcado"
+
+
+class Disponibilidade:
+    """Horários livres separados por dia: data -> [(hora, slot_id)] ordenados
+
+    Agendar ou liberar um slot só mexe na lista do dia dele; a busca pula direto para
+    a primeira data e, em cada dia, para o primeiro horário da janela (bisect).
+    """
+
+    def __init__(self):
+        self.dias = {}
+        self.datas = []  # datas com algum horário livre, ordenadas
+        self.total = 0
+
+    def adicionar(self, date, time, slot_id):
+        dia = self.dias.get(date)
+        if dia is None:
+            dia = self.dias[date] = []
+            insort(self.datas, date)
+        insort(dia, (time, slot_id))
+        self.total += 1
+
+    def anexar(self, date, time, slot_id):
+        """Inclusão na carga, que percorre datas e horários em ordem crescente"""
+        dia = self.dias.get(date)
+        if dia is None:
+            dia = self.dias[date] = []
+            self.datas.append(date)
+        dia.append((time, slot_id))
+        self.total += 1
+
+    def remover(self, date, time, slot_id):
+        dia = self.dias.get(date, [])
+        i = bisect_left(dia, (time, slot_id))
+        if i == len(dia) or dia[i] != (time, slot_id):
+            return
+        del dia[i]
+        self.total -= 1
+        if not dia:
+            del self.dias[date]
+            del self.datas[bisect_left(self.datas, date)]
+
+    def a_partir(self, inicio, data_fim=None, hora_inicio=None, hora_fim=None):
+        """Gera (data, slot_id) em ordem cronológica a partir de inicio = (data, hora)"""
+        data_inicio, hora_agora = inicio
+        for i in range(bisect_left(self.datas, data_inicio), len(self.datas)):
+            date = self.datas[i]
+            if data_fim and date > data_fim:
+                return
+            dia = self.dias[date]
+            piso = max(hora_inicio or "", hora_agora if date == data_inicio else "")
+            for j in range(bisect_left(dia, (piso,)), len(dia)):
+                time, slot_id = dia[j]
+                if hora_fim and time > hora_fim:
+                    break
+                yield date, slot_id
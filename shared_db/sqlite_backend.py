@@ -0,0 +1,346 @@
+"""
+Backend SQLite do banco compartilhado
+Modo WAL (leitores concorrentes com um escritor), uma conexão por thread e
+consultas com SQL fixo, que o sqlite3 mantém preparadas no cache de statements.
+"""
+import json
+import sqlite3
+import threading
+
+from storage import StorageBackend, estorno, normalizar_data
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS slots (
+    slot_id     TEXT PRIMARY KEY,
+    date        TEXT NOT NULL,
+    time        TEXT NOT NULL,
+    doctor_id   TEXT,
+    doctor_name TEXT,
+    doctor_key  TEXT,
+    specialties TEXT NOT NULL DEFAULT '[]',
+    available   INTEGER NOT NULL DEFAULT 1,
+    patient     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_slots_date ON slots(date, time);
+CREATE INDEX IF NOT EXISTS idx_slots_patient ON slots(patient) WHERE patient IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_slots_doctor ON slots(doctor_id, date, time);
+CREATE INDEX IF NOT EXISTS idx_slots_doctor_key ON slots(doctor_key, date, time);
+-- Só os horários livres, em ordem cronológica (busca do próximo horário)
+CREATE INDEX IF NOT EXISTS idx_slots_livres ON slots(date, time, slot_id) WHERE available = 1;
+
+CREATE TABLE IF NOT EXISTS slot_specialties (
+    specialty TEXT NOT NULL,
+    slot_id   TEXT NOT NULL REFERENCES slots(slot_id),
+    PRIMARY KEY (specialty, slot_id)
+) WITHOUT ROWID;
+
+-- Livro de pagamentos: somente inclusão; um reembolso é um estorno que referencia o pagamento
+CREATE TABLE IF NOT EXISTS ledger (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind            TEXT NOT NULL CHECK (kind IN ('payment', 'refund')),
+    document        TEXT NOT NULL,
+    patient_name    TEXT,
+    date            TEXT NOT NULL,
+    specialty       TEXT,
+    amount_cents    INTEGER NOT NULL DEFAULT 0,
+    reverses        INTEGER UNIQUE REFERENCES ledger(id),
+    idempotency_key TEXT UNIQUE,
+    created_at      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ledger_document ON ledger(document, id);
+CREATE INDEX IF NOT EXISTS idx_ledger_date ON ledger(date, id);
+
+CREATE TRIGGER IF NOT EXISTS ledger_sem_update BEFORE UPDATE ON ledger
+BEGIN SELECT RAISE(ABORT, 'livro de pagamentos é somente inclusão'); END;
+CREATE TRIGGER IF NOT EXISTS ledger_sem_delete BEFORE DELETE ON ledger
+BEGIN SELECT RAISE(ABORT, 'livro de pagamentos é somente inclusão'); END;
+
+-- Saldo por documento e totais por dia, atualizados na mesma transação de cada lançamento
+CREATE TABLE IF NOT EXISTS ledger_saldos (
+    document       TEXT PRIMARY KEY,
+    saldo_centavos INTEGER NOT NULL DEFAULT 0,
+    lancamentos    INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ledger_totais (
+    date                TEXT PRIMARY KEY,
+    pagamentos_centavos INTEGER NOT NULL DEFAULT 0,
+    reembolsos_centavos INTEGER NOT NULL DEFAULT 0,
+    quantidade          INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS ledger_agregados AFTER INSERT ON ledger
+BEGIN
+    INSERT INTO ledger_saldos (document, saldo_centavos, lancamentos)
+    VALUES (NEW.document, CASE NEW.kind WHEN 'payment' THEN NEW.amount_cents ELSE -NEW.amount_cents END, 1)
+    ON CONFLICT(document) DO UPDATE SET saldo_centavos = saldo_centavos + excluded.saldo_centavos,
+                                        lancamentos = lancamentos + 1;
+    INSERT INTO ledger_totais (date, pagamentos_centavos, reembolsos_centavos, quantidade)
+    VALUES (NEW.date, CASE NEW.kind WHEN 'payment' THEN NEW.amount_cents ELSE 0 END,
+            CASE NEW.kind WHEN 'refund' THEN NEW.amount_cents ELSE 0 END, 1)
+    ON CONFLICT(date) DO UPDATE SET pagamentos_centavos = pagamentos_centavos + excluded.pagamentos_centavos,
+                                    reembolsos_centavos = reembolsos_centavos + excluded.reembolsos_centavos,
+                                    quantidade = quantidade + 1;
+END;
+
+-- Contador de alterações por tabela (invalidação de cache entre processos)
+CREATE TABLE IF NOT EXISTS versoes (
+    tabela TEXT PRIMARY KEY,
+    versao INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO versoes (tabela, versao) VALUES ('slots', 0), ('pagamentos', 0);
+"""
+
+SQL_SLOTS = "SELECT slot_id, date, time, doctor_id, doctor_name, specialties, available, patient FROM slots"
+SQL_TODOS = SQL_SLOTS + " ORDER BY date, time, slot_id"
+SQL_POR_ID = SQL_SLOTS + " WHERE slot_id = ?"
+SQL_POR_PACIENTE = SQL_SLOTS + " WHERE patient = ? ORDER BY date, time"
+
+# Filtros opcionais da consulta paginada (ver filtrar_slots)
+FILTROS = {
+    "data_inicio": "date >= ?",
+    "data_fim": "date <= ?",
+    "especialidade": "slot_id IN (SELECT slot_id FROM slot_specialties WHERE specialty = ?)",
+    "medico": "(doctor_key = ? OR doctor_id = ?)",
+    "apos": "(date, time, slot_id) > (?, ?, ?)",
+}
+
+# Filtros da busca do próximo horário livre (ver proximos_livres)
+FILTROS_PROXIMOS = {
+    "data_fim": "date <= ?",
+    "hora_inicio": "time >= ?",
+    "hora_fim": "time <= ?",
+    # EXISTS correlacionado: o SQLite percorre os horários livres em ordem e para no limite,
+    # em vez de partir de todos os slots da especialidade e ordenar
+    "especialidade": "EXISTS (SELECT 1 FROM slot_specialties e WHERE e.specialty = ? AND e.slot_id = slots.slot_id)",
+    "medico": FILTROS["medico"],
+}
+
+SQL_RESERVAR = "UPDATE slots SET available = 0, patient = ? WHERE slot_id = ? AND available = 1"
+SQL_LIBERAR = "UPDATE slots SET available = 1, patient = NULL WHERE slot_id = ?"
+SQL_LIBERAR_DO_PACIENTE = SQL_LIBERAR + " AND patient = ?"
+COLUNAS_LANCAMENTO = ("id", "kind", "document", "patient_name", "date", "specialty", "amount_cents",
+                      "reverses", "idempotency_key", "created_at")
+SQL_LANCAMENTOS = f"SELECT {', '.join(COLUNAS_LANCAMENTO)} FROM ledger"
+SQL_INSERIR_LANCAMENTO = (f"INSERT INTO ledger ({', '.join(COLUNAS_LANCAMENTO)}) "
+                          f"VALUES ({', '.join('?' * len(COLUNAS_LANCAMENTO))})")
+SQL_POR_CHAVE = SQL_LANCAMENTOS + " WHERE idempotency_key = ?"
+# Pagamentos do documento sem estorno (o índice único em reverses torna o NOT EXISTS uma busca pontual)
+SQL_ATIVOS = (SQL_LANCAMENTOS + " p WHERE p.document = ? AND p.kind = 'payment' "
+              "AND NOT EXISTS (SELECT 1 FROM ledger r WHERE r.reverses = p.id)")
+SQL_PRIMEIRO_ATIVO = SQL_ATIVOS + " ORDER BY p.id LIMIT 1"
+SQL_ATIVO_POR_ID = SQL_ATIVOS + " AND p.id = ?"
+SQL_SALDO = "SELECT saldo_centavos, lancamentos FROM ledger_saldos WHERE document = ?"
+SQL_TOTAIS = "SELECT pagamentos_centavos, reembolsos_centavos, quantidade FROM ledger_totais WHERE date = ?"
+SQL_VERSAO = "SELECT versao FROM versoes WHERE tabela = ?"
+SQL_INCREMENTAR_VERSAO = "UPDATE versoes SET versao = versao + 1 WHERE tabela = ?"
+
+
+def _lancamento(row):
+    return dict(zip(COLUNAS_LANCAMENTO, row))
+
+
+def inserir_lancamento(conn, lancamento):
+    """Insere no livro (dentro da transação de quem chama); retorna o lançamento com id"""
+    cursor = conn.execute(SQL_INSERIR_LANCAMENTO, [lancamento.get(coluna) for coluna in COLUNAS_LANCAMENTO])
+    return {**lancamento, "id": cursor.lastrowid}
+
+
+def _slot(row):
+    """Converte uma linha da tabela slots em (data, slot) no mesmo formato do JSON"""
+    slot_id, date, time, doctor_id, doctor_name, specialties, available, patient = row
+    return date, {
+        "slot_id": slot_id,
+        "time": time,
+        "doctor_id": doctor_id,
+        "doctor_name": doctor_name,
+        "specialties": json.loads(specialties),
+        "available": bool(available),
+        "patient": patient
+    }
+
+
+class SQLiteBackend(StorageBackend):
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self.conexao().executescript(SCHEMA)
+        self._migrar_pagamentos_antigos()
+
+    def _migrar_pagamentos_antigos(self):
+        """Bancos criados antes do livro têm a tabela payments: os pagamentos viram lançamentos"""
+        existe = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'payments'"
+        if self.conexao().execute(existe).fetchone() is None:
+            return
+        with self.transacao() as conn:
+            # Outro processo pode ter migrado entre a verificação e a transação
+            if conn.execute(existe).fetchone() is None:
+                return
+            for patient_name, document, date, specialty in conn.execute(
+                    "SELECT patient_name, document, date, specialty FROM payments ORDER BY id").fetchall():
+                inserir_lancamento(conn, {
+                    "kind": "payment", "document": document, "patient_name": patient_name,
+                    "date": normalizar_data(date) or date, "specialty": specialty, "amount_cents": 0,
+                })
+            conn.execute("DROP TABLE payments")
+            conn.execute(SQL_INCREMENTAR_VERSAO, ("pagamentos",))
+
+    def conexao(self):
+        """Conexão da thread atual (sqlite3 não compartilha conexões entre threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30, cached_statements=256)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def transacao(self):
+        """Transação de escrita: BEGIN IMMEDIATE ... COMMIT/ROLLBACK"""
+        return _Transacao(self.conexao())
+
+    def consultar_slots(self):
+        slots = {}
+        for row in self.conexao().execute(SQL_TODOS):
+            date, slot = _slot(row)
+            slots.setdefault(date, []).append(slot)
+        return slots
+
+    def buscar_slot(self, slot_id):
+        row = self.conexao().execute(SQL_POR_ID, (slot_id,)).fetchone()
+        return _slot(row) if row else None
+
+    def buscar_por_paciente(self, documento):
+        return [_slot(row) for row in self.conexao().execute(SQL_POR_PACIENTE, (documento,))]
+
+    def filtrar_slots(self, data_inicio=None, data_fim=None, especialidade=None, medico=None,
+                      apenas_disponiveis=True, limite=20, apos=None):
+        condicoes, parametros = [], []
+        for nome, valor in (("data_inicio", data_inicio), ("data_fim", data_fim),
+                            ("especialidade", especialidade), ("medico", medico), ("apos", apos)):
+            if not valor:
+                continue
+            condicoes.append(FILTROS[nome])
+            if nome == "medico":
+                # Aceita o nome normalizado ("dr-silva") ou o doctor_id ("dr_silva")
+                parametros += [valor, valor.replace("-", "_")]
+            elif nome == "apos":
+                parametros += list(valor)
+            else:
+                parametros.append(valor)
+        if apenas_disponiveis:
+            condicoes.append("available = 1")
+        sql = SQL_SLOTS
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        sql += " ORDER BY date, time, slot_id LIMIT ?"
+        return [_slot(row) for row in self.conexao().execute(sql, parametros + [limite])]
+
+    def proximos_livres(self, inicio, data_fim=None, hora_inicio=None, hora_fim=None,
+                        especialidade=None, medico=None, limite=5):
+        condicoes, parametros = ["available = 1", "(date, time) >= (?, ?)"], list(inicio)
+        for nome, valor in (("data_fim", data_fim), ("hora_inicio", hora_inicio), ("hora_fim", hora_fim),
+                            ("especialidade", especialidade), ("medico", medico)):
+            if not valor:
+                continue
+            condicoes.append(FILTROS_PROXIMOS[nome])
+            parametros += [valor, valor.replace("-", "_")] if nome == "medico" else [valor]
+        sql = SQL_SLOTS + " WHERE " + " AND ".join(condicoes) + " ORDER BY date, time, slot_id LIMIT ?"
+        return [_slot(row) for row in self.conexao().execute(sql, parametros + [limite])]
+
+    def reservar(self, slot_id, documento):
+        with self.transacao() as conn:
+            if conn.execute(SQL_RESERVAR, (documento, slot_id)).rowcount == 1:
+                conn.execute(SQL_INCREMENTAR_VERSAO, ("slots",))
+                return "agendado"
+            row = conn.execute(SQL_POR_ID, (slot_id,)).fetchone()
+        if row is None:
+            return "nao_encontrado"
+        return "ja_agendado" if _slot(row)[1]["patient"] == documento else "ocupado"
+
+    def liberar(self, slot_id, documento=None):
+        with self.transacao() as conn:
+            if documento is None:
+                alterados = conn.execute(SQL_LIBERAR, (slot_id,)).rowcount
+            else:
+                alterados = conn.execute(SQL_LIBERAR_DO_PACIENTE, (slot_id, documento)).rowcount
+            if alterados == 1:
+                conn.execute(SQL_INCREMENTAR_VERSAO, ("slots",))
+                return "liberado"
+            existe = conn.execute(SQL_POR_ID, (slot_id,)).fetchone() is not None
+        return "outro_paciente" if existe else "nao_encontrado"
+
+    def remarcar(self, slot_antigo, slot_novo, documento):
+        if slot_antigo == slot_novo:
+            return "mesmo_slot"
+        # Uma transação: libera e agenda juntos, ou nada muda
+        with self.transacao() as conn:
+            antigo = conn.execute(SQL_POR_ID, (slot_antigo,)).fetchone()
+            novo = conn.execute(SQL_POR_ID, (slot_novo,)).fetchone()
+            if antigo is None or novo is None:
+                return "nao_encontrado"
+            antigo, novo = _slot(antigo)[1], _slot(novo)[1]
+            if not novo["available"]:
+                if novo["patient"] == documento and antigo["patient"] != documento:
+                    return "ja_remarcado"
+                return "ocupado"
+            if antigo["patient"] != documento:
+                return "outro_paciente"
+            conn.execute(SQL_LIBERAR_DO_PACIENTE, (slot_antigo, documento))
+            conn.execute(SQL_RESERVAR, (documento, slot_novo))
+            conn.execute(SQL_INCREMENTAR_VERSAO, ("slots",))
+        return "remarcado"
+
+    def adicionar_pagamento(self, payment, idempotency_key=None):
+        with self.transacao() as conn:
+            if idempotency_key:
+                row = conn.execute(SQL_POR_CHAVE, (idempotency_key,)).fetchone()
+                if row is not None:
+                    return _lancamento(row), False
+            lancamento = inserir_lancamento(conn, {**payment, "idempotency_key": idempotency_key or None})
+            conn.execute(SQL_INCREMENTAR_VERSAO, ("pagamentos",))
+        return lancamento, True
+
+    def reembolsar(self, document, payment_id=None):
+        with self.transacao() as conn:
+            if payment_id:
+                row = conn.execute(SQL_ATIVO_POR_ID, (document, payment_id)).fetchone()
+            else:
+                row = conn.execute(SQL_PRIMEIRO_ATIVO, (document,)).fetchone()
+            if row is None:
+                return None
+            pagamento = _lancamento(row)
+            lancamento = inserir_lancamento(conn, estorno(pagamento))
+            conn.execute(SQL_INCREMENTAR_VERSAO, ("pagamentos",))
+        return lancamento, pagamento
+
+    def saldo(self, document):
+        conn = self.conexao()
+        row = conn.execute(SQL_SALDO, (document,)).fetchone()
+        saldo_centavos, lancamentos = row if row else (0, 0)
+        ativos = [_lancamento(row) for row in conn.execute(SQL_ATIVOS + " ORDER BY p.id", (document,))]
+        return {"saldo_centavos": saldo_centavos, "lancamentos": lancamentos, "ativos": ativos}
+
+    def totais_dia(self, date):
+        row = self.conexao().execute(SQL_TOTAIS, (date,)).fetchone()
+        pagamentos, reembolsos, quantidade = row if row else (0, 0, 0)
+        return {"pagamentos_centavos": pagamentos, "reembolsos_centavos": reembolsos, "quantidade": quantidade}
+
+    def versao(self, tabela):
+        row = self.conexao().execute(SQL_VERSAO, (tabela,)).fetchone()
+        return row[0] if row else None
+
+    def compactar(self):
+        """Transfere o WAL do SQLite para o arquivo principal"""
+        self.conexao().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+class _Transacao:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
@@ -0,0 +1,156 @@
+"""
+Interface dos backends de armazenamento do banco compartilhado
+O simple_db expõe sempre as mesmas funções; o backend é escolhido pela variável
+SHARED_DB_BACKEND ("json", padrão, ou "sqlite").
+"""
+import os
+import re
+import unicodedata
+from datetime import date, datetime
+
+
+class StorageBackend:
+    """Operações que todo backend precisa implementar"""
+
+    def consultar_slots(self):
+        """Retorna o dicionário data -> lista de slots"""
+        raise NotImplementedError
+
+    def buscar_slot(self, slot_id):
+        """Retorna (data, slot) ou None"""
+        raise NotImplementedError
+
+    def buscar_por_paciente(self, documento):
+        """Retorna os slots do paciente como lista de (data, slot), ordenada por data e hora"""
+        raise NotImplementedError
+
+    def filtrar_slots(self, data_inicio=None, data_fim=None, especialidade=None, medico=None,
+                      apenas_disponiveis=True, limite=20, apos=None):
+        """Slots que atendem aos filtros, ordenados por (data, hora, slot_id)
+
+        especialidade e medico chegam normalizados (ver normalizar); apos é a chave
+        (data, hora, slot_id) do último item da página anterior.
+        Retorna lista de (data, slot) com no máximo `limite` itens.
+        """
+        raise NotImplementedError
+
+    def proximos_livres(self, inicio, data_fim=None, hora_inicio=None, hora_fim=None,
+                        especialidade=None, medico=None, limite=5):
+        """Primeiros slots livres a partir de inicio = (data, hora), em ordem cronológica
+
+        hora_inicio/hora_fim ("HH:MM") limitam o horário em cada dia; especialidade e
+        medico chegam normalizados. Retorna lista de (data, slot) com no máximo `limite` itens.
+        """
+        raise NotImplementedError
+
+    def reservar(self, slot_id, documento):
+        """Compare-and-set: "agendado", "ja_agendado", "ocupado" ou "nao_encontrado" """
+        raise NotImplementedError
+
+    def liberar(self, slot_id, documento=None):
+        """Retorna "liberado", "outro_paciente" ou "nao_encontrado" """
+        raise NotImplementedError
+
+    def remarcar(self, slot_antigo, slot_novo, documento):
+        """Libera slot_antigo e agenda slot_novo para o documento numa única operação atômica
+
+        Retorna "remarcado", "ja_remarcado", "mesmo_slot", "nao_encontrado", "outro_paciente" ou "ocupado".
+        """
+        raise NotImplementedError
+
+    def adicionar_pagamento(self, payment, idempotency_key=None):
+        """Anexa o lançamento de pagamento ao livro; retorna (lançamento, criado)
+
+        Com idempotency_key já usada, não grava nada e retorna o lançamento original com criado=False.
+        """
+        raise NotImplementedError
+
+    def reembolsar(self, document, payment_id=None):
+        """Anexa um estorno do pagamento ativo mais antigo do documento (ou de payment_id)
+
+        Retorna (estorno, pagamento) ou None se não há pagamento ativo.
+        """
+        raise NotImplementedError
+
+    def saldo(self, document):
+        """{"saldo_centavos", "lancamentos", "ativos": [pagamentos sem estorno]} do documento"""
+        raise NotImplementedError
+
+    def totais_dia(self, date):
+        """{"pagamentos_centavos", "reembolsos_centavos", "quantidade"} da data (AAAA-MM-DD)"""
+        raise NotImplementedError
+
+    def versao(self, tabela):
+        """Marca que muda sempre que "slots" ou "pagamentos" são alterados (por qualquer processo)
+
+        Usada para invalidar caches de leitura; None se o backend não souber informar.
+        """
+        return None
+
+    def compactar(self):
+        """Manutenção periódica (snapshot do WAL, checkpoint, ...)"""
+
+
+def normalizar(texto):
+    """Chave de busca: sem acentos, minúscula, separada por hífen ("Clínica Geral" -> "clinica-geral")"""
+    if not texto:
+        return None
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", texto.lower()).strip("-") or None
+
+
+# Formatos aceitos nas datas de pagamento; o livro guarda sempre AAAA-MM-DD
+FORMATOS_DATA = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%d.%m.%Y")
+
+
+def normalizar_data(texto):
+    """Data em AAAA-MM-DD ("30/09/2025" -> "2025-09-30"); None se não reconhecida"""
+    if not texto:
+        return None
+    texto = str(texto).strip().split("T")[0].split(" ")[0]
+    for formato in FORMATOS_DATA:
+        try:
+            return datetime.strptime(texto, formato).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def normalizar_hora(texto):
+    """Horário em HH:MM ("14h" -> "14:00", "9:30" -> "09:30"); None se não reconhecido"""
+    if not texto:
+        return None
+    match = re.fullmatch(r"(\d{1,2})(?:\s*(?:[:h])\s*(\d{2})?)?", str(texto).strip().lower())
+    if match is None or int(match.group(1)) > 23 or int(match.group(2) or 0) > 59:
+        return None
+    return f"{int(match.group(1)):02d}:{match.group(2) or '00'}"
+
+
+def estorno(pagamento):
+    """Lançamento que reverte um pagamento; o pagamento original continua no livro"""
+    return {
+        "kind": "refund",
+        "document": pagamento["document"],
+        "patient_name": pagamento["patient_name"],
+        "date": date.today().isoformat(),
+        "specialty": pagamento["specialty"],
+        "amount_cents": pagamento["amount_cents"],
+        "reverses": pagamento["id"],
+        "idempotency_key": None,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def criar_backend(nome, db_file, payments_file, sqlite_file):
+    """Instancia o backend pelo nome"""
+    if nome == "sqlite":
+        from sqlite_backend import SQLiteBackend
+        return SQLiteBackend(sqlite_file)
+    if nome == "json":
+        from json_backend import JsonBackend
+        return JsonBackend(db_file, payments_file)
+    raise ValueError(f"Backend desconhecido: {nome}")
+
+
+def nome_backend():
+    return os.getenv("SHARED_DB_BACKEND", "json").lower()
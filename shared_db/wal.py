@@ -0,0 +1,257 @@
+"""
+Write-ahead log (WAL) do banco compartilhado
+Cada mutação é anexada como uma linha JSON no arquivo .wal, com commit em grupo
+(um único fsync cobre todos os escritores que chegaram enquanto o anterior
+gravava). Periodicamente o estado é compactado em um snapshot escrito via
+arquivo temporário + rename, e o WAL recomeça vazio.
+
+Vários processos podem compartilhar os mesmos arquivos: o anexo ao WAL e a
+compactação acontecem sob uma trava curta do arquivo (ver file_lock.py), e
+cada processo aplica incrementalmente os registros escritos pelos outros.
+"""
+import json
+import os
+import threading
+
+from file_lock import FileLock, trava
+
+# Quantidade de registros no WAL antes de compactar em um novo snapshot
+COMPACTAR_A_CADA = int(os.getenv("SHARED_DB_COMPACT_EVERY", "1000"))
+
+
+def escrever_atomico(path, data):
+    """Grava JSON em arquivo temporário e substitui o destino com rename atômico"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_diretorio(os.path.dirname(path))
+
+
+def _fsync_diretorio(diretorio):
+    # Garante que o rename sobreviva a uma queda (não suportado no Windows)
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(diretorio or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._escritos = 0
+        self._sincronizados = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def _abrir(self):
+        # Chamado com _sync_lock e _lock: nenhum fsync está usando o fd que será fechado
+        if self._fd is not None:
+            if self._sincronizados < self._escritos:
+                # Registros já escritos no arquivo antigo continuam com a garantia de fsync
+                os.fsync(self._fd)
+                self._sincronizados = self._escritos
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _precisa_abrir(self):
+        # Outro processo pode ter compactado e substituído o arquivo
+        return self._fd is None or os.fstat(self._fd).st_ino != self.identidade()
+
+    def _escrever(self, linha):
+        os.write(self._fd, linha)
+        self._escritos += 1
+        return self._escritos, os.fstat(self._fd).st_size
+
+    def identidade(self):
+        """Identifica o arquivo atual do WAL (muda a cada compactação)"""
+        try:
+            return os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def tamanho(self):
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def geracao(self):
+        """Lê a geração gravada no cabeçalho do WAL (None se não existe)"""
+        try:
+            with open(self.path, 'rb') as f:
+                cabecalho = f.readline()
+        except FileNotFoundError:
+            return None
+        if not cabecalho.endswith(b"\n"):
+            return None
+        return json.loads(cabecalho).get("geracao")
+
+    def ler(self, offset=0):
+        """Lê os registros completos a partir do offset; retorna (registros, novo_offset)"""
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            conteudo = f.read()
+        # Uma linha sem \n no final é uma escrita interrompida: é ignorada
+        fim = conteudo.rfind(b"\n") + 1
+        registros = []
+        for linha in conteudo[:fim].splitlines():
+            registro = json.loads(linha)
+            if "geracao" not in registro:
+                registros.append(registro)
+        return registros, offset + fim
+
+    def descartar_incompleto(self, offset):
+        """Remove uma linha final incompleta (escrita interrompida por queda)"""
+        if self.tamanho() > offset:
+            os.truncate(self.path, offset)
+
+    def append(self, registro):
+        """Anexa o registro sem fsync; retorna (ticket, offset_final) para sincronizar depois"""
+        linha = (json.dumps(registro, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._lock:
+            if not self._precisa_abrir():
+                return self._escrever(linha)
+        # Reabrir fecha o fd antigo, que um fsync em andamento pode estar usando:
+        # espera por ele com as travas na mesma ordem de sincronizar e reiniciar
+        with self._sync_lock, self._lock:
+            if self._precisa_abrir():
+                self._abrir()
+            return self._escrever(linha)
+
+    def sincronizar(self, ticket):
+        """Commit em grupo: um fsync torna duráveis todos os registros escritos até ele"""
+        with self._sync_lock:
+            if self._sincronizados >= ticket:
+                return
+            with self._lock:
+                alvo = self._escritos
+                fd = self._fd
+            os.fsync(fd)
+            self._sincronizados = alvo
+
+    def reiniciar(self, geracao):
+        """Substitui o WAL por um arquivo novo contendo apenas o cabeçalho da geração"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write((json.dumps({"geracao": geracao}) + "\n").encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        with self._sync_lock, self._lock:
+            os.replace(tmp_path, self.path)
+            _fsync_diretorio(os.path.dirname(self.path))
+            self._abrir()
+            self._sincronizados = self._escritos
+
+
+class JournaledStore:
+    """Estado em memória = snapshot JSON + registros do WAL ainda não compactados"""
+
+    def __init__(self, path, compactar_a_cada=COMPACTAR_A_CADA):
+        self.path = path
+        self.wal = WriteAheadLog(os.path.splitext(path)[0] + ".wal")
+        self.compactar_a_cada = compactar_a_cada
+        self.locks_dir = os.path.join(os.path.dirname(path), "locks")
+        self._trava_arquivo = FileLock(os.path.join(self.locks_dir, os.path.basename(path) + ".lock"))
+        self.data = None
+        self._assinatura = None
+        self._offset = 0
+        self._registros_no_wal = 0
+        self._lock = threading.RLock()
+
+    # Subclasses implementam como indexar o snapshot e aplicar um registro
+    def _indexar(self):
+        raise NotImplementedError
+
+    def _aplicar(self, registro):
+        raise NotImplementedError
+
+    def _assinatura_arquivos(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size, self.wal.identidade())
+
+    def versao(self):
+        """Muda a cada registro anexado ou compactação, em qualquer processo (sem ler os dados)"""
+        return self._assinatura_arquivos() + (self.wal.tamanho(),)
+
+    def atualizar(self):
+        """Sincroniza a memória com o disco: recarrega o snapshot ou aplica só o final do WAL"""
+        with self._lock:
+            if self._assinatura_arquivos() != self._assinatura or self.wal.tamanho() < self._offset:
+                self._carregar()
+            else:
+                self._repetir_wal()
+
+    def _carregar(self):
+        if not self._ler_estado():
+            # Geração divergente ou linha final incompleta: confirma sob a trava,
+            # já que pode ser apenas outro processo no meio de uma escrita
+            with self._trava_arquivo:
+                if not self._ler_estado():
+                    self._reparar()
+        self._assinatura = self._assinatura_arquivos()
+
+    def _ler_estado(self):
+        """Carrega snapshot + WAL; retorna False se o WAL precisa de reparo"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self.data = json.load(f)
+        self._indexar()
+        self._offset = 0
+        self._registros_no_wal = 0
+        if self.wal.geracao() != self.data.get("geracao_wal", 0):
+            return False
+        self._repetir_wal()
+        return self._offset == self.wal.tamanho()
+
+    def _reparar(self):
+        geracao = self.data.get("geracao_wal", 0)
+        if self.wal.geracao() != geracao:
+            # WAL ausente ou de uma geração já compactada no snapshot (queda na compactação)
+            self.wal.reiniciar(geracao)
+            self._offset = self.wal.tamanho()
+        else:
+            self.wal.descartar_incompleto(self._offset)
+
+    def _repetir_wal(self):
+        registros, self._offset = self.wal.ler(self._offset)
+        for registro in registros:
+            self._aplicar(registro)
+        self._registros_no_wal += len(registros)
+
+    def trava(self, namespace, chave):
+        """Trava entre processos para uma chave fina (slot, documento)"""
+        return trava(namespace, chave, self.locks_dir)
+
+    def registrar(self, registro):
+        """Aplica o registro em memória e anexa ao WAL; retorna o ticket de commit"""
+        with self._lock, self._trava_arquivo:
+            # Aplica antes o que outros processos anexaram, mantendo a ordem do WAL
+            self.atualizar()
+            ticket, self._offset = self.wal.append(registro)
+            self._aplicar(registro)
+            self._registros_no_wal += 1
+            return ticket
+
+    def confirmar(self, ticket):
+        """Aguarda o fsync do registro (fora do lock, permitindo commit em grupo)"""
+        self.wal.sincronizar(ticket)
+        if self._registros_no_wal >= self.compactar_a_cada:
+            self.compactar()
+
+    def compactar(self):
+        """Grava um novo snapshot com o estado atual e recomeça o WAL"""
+        with self._lock, self._trava_arquivo:
+            self.atualizar()
+            geracao = self.data.get("geracao_wal", 0) + 1
+            self.data["geracao_wal"] = geracao
+            escrever_atomico(self.path, self.data)
+            self.wal.reiniciar(geracao)
+            self._offset = self.wal.tamanho()
+            self._registros_no_wal = 0
+            self._assinatura = self._assinatura_arquivos()
@@ -0,0 +1,20 @@
+"""
+Utilitários assíncronos compartilhados pelos agentes MCP
+Chamadas bloqueantes (banco compartilhado, arquivos) rodam em um pool de threads
+limitado, para não travar o event loop do FastAPI.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Quantidade máxima de operações bloqueantes simultâneas por processo
+IO_THREADS = int(os.getenv("MCP_IO_THREADS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="mcp-io")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Executa func(*args, **kwargs) no pool de I/O e aguarda o resultado"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,173 @@
+"""
+Cliente LLM usado pelo MCP Host e pelos agentes
+MCP_LLM_BACKEND escolhe a implementação: "azure" (padrão, Azure OpenAI) ou "mock",
+um substituto local e determinístico para testes de carga sem acesso ao Azure.
+O mock escolhe a tool por palavras-chave, preenche os argumentos a partir do texto
+(documento, slot, data, especialidade), segue o fluxo cancelamento -> reembolso do
+host e simula a latência do modelo (MCP_MOCK_LATENCY_MS, MCP_MOCK_TOKEN_MS).
+"""
+import asyncio
+import json
+import os
+import re
+import unicodedata
+import uuid
+from datetime import date
+from types import SimpleNamespace
+
+
+def create_llm_client():
+    """Cliente com a interface chat.completions.create do SDK da OpenAI
+
+    Lê o ambiente na chamada (depois do load_dotenv do setup).
+    """
+    backend = os.getenv("MCP_LLM_BACKEND", "azure").lower()
+    if backend == "mock":
+        return MockLLMClient(
+            latency_ms=float(os.getenv("MCP_MOCK_LATENCY_MS", "300")),
+            token_ms=float(os.getenv("MCP_MOCK_TOKEN_MS", "5"))
+        )
+    if backend == "azure":
+        from openai import AsyncAzureOpenAI
+        return AsyncAzureOpenAI(
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            api_key=os.getenv("AZURE_OPENAI_KEY"),
+            api_version="2024-02-01"
+        )
+    raise ValueError(f"Backend de LLM desconhecido: {backend}")
+
+
+# Regras do mock, em ordem de prioridade: a primeira tool oferecida cujo termo
+# aparece no texto e cujos argumentos obrigatórios puderam ser extraídos é chamada
+TOOL_KEYWORDS = [
+    ("payment_agent", ["pagar", "pagamento", "reembolso", "estorno"]),
+    # Remarcação vai direto ao agendamento (remarcar_slot), sem passar pelo cancelamento
+    ("scheduling_agent", ["remarcar", "reagendar"]),
+    ("cancellation_agent", ["cancelar", "cancelamento", "desmarcar"]),
+    ("exam_agent", ["exame", "exames"]),
+    ("scheduling_agent", ["agendar", "marcar", "horario", "horarios", "disponiveis", "consulta"]),
+    ("processar_reembolso", ["reembolso", "estorno"]),
+    ("processar_pagamento", ["pagar", "pagamento"]),
+    ("remarcar_slot", ["remarcar", "reagendar"]),
+    ("liberar_slot", ["cancelar", "cancelamento", "desmarcar", "liberar"]),
+    ("buscar_por_documento", ["cancelar", "cancelamento", "consulta", "agendamento"]),
+    ("agendar_slot", ["agendar", "marcar", "reservar"]),
+    ("buscar_proximo_horario", ["proximo", "primeiro", "mais cedo"]),
+    ("buscar_slots", ["horario", "horarios", "disponiveis", "vaga", "vagas", "agenda"]),
+    ("get_exam_result", ["exame", "exames", "resultado"]),
+]
+
+SPECIALTIES = ["cardiologia", "dermatologia", "neurologia", "pediatria", "ortopedia", "clinica-geral"]
+
+DOCUMENT_RE = re.compile(r"\b\d{3}\.?\d{3}\.?\d{3}-?\d{2}\b|\b\d{5,14}\b")
+SLOT_RE = re.compile(r"\bSLOT-[\w-]+", re.IGNORECASE)
+DATE_RE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+NAME_RE = re.compile(r"\bnome\s*(?:é|:)?\s*([A-ZÀ-Ú][\wÀ-ú]+(?:\s+[A-ZÀ-Ú][\wÀ-ú]+)*)")
+
+
+def _normalize(text):
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+
+
+def _extract(param, text, tool_name):
+    """Valor de um argumento a partir do texto, ou None"""
+    if param in ("document", "documento", "patient_cpf", "patientId", "cpf"):
+        match = DOCUMENT_RE.search(SLOT_RE.sub(" ", DATE_RE.sub(" ", text)))
+        return re.sub(r"\D", "", match.group(0)) if match else None
+    if param in ("slot_id", "slot_novo", "slot_antigo"):
+        slots = SLOT_RE.findall(text)
+        # Em "remarcar do SLOT-A para o SLOT-B": o antigo é o primeiro, o novo é o último
+        if not slots or (param == "slot_antigo" and len(slots) < 2):
+            return None
+        return slots[-1] if param == "slot_novo" else slots[0]
+    if param in ("especialidade", "specialty"):
+        normalized = _normalize(text)
+        return next((s for s in SPECIALTIES if s.replace("-", " ") in normalized.replace("-", " ")), None)
+    if param in ("date", "data_inicio", "dateFrom"):
+        match = DATE_RE.search(text)
+        return match.group(0) if match else (date.today().isoformat() if param == "date" else None)
+    if param == "patient_name":
+        match = NAME_RE.search(text)
+        return match.group(1) if match else "Paciente"
+    if param == "message":
+        return text
+    return None
+
+
+def _arguments(tool, text):
+    """Argumentos da tool; None se falta algum obrigatório"""
+    parameters = tool["function"].get("parameters", {})
+    arguments = {}
+    for param in parameters.get("properties", {}):
+        value = _extract(param, text, tool["function"]["name"])
+        if value is not None:
+            arguments[param] = value
+    if any(param not in arguments for param in parameters.get("required", [])):
+        return None
+    return arguments
+
+
+def _tool_call(name, arguments):
+    return SimpleNamespace(
+        id=f"call_{uuid.uuid4().hex[:12]}",
+        type="function",
+        function=SimpleNamespace(name=name, arguments=json.dumps(arguments, ensure_ascii=False))
+    )
+
+
+def _turn(messages):
+    """Mensagens do turno atual (a partir da última mensagem do usuário)"""
+    inicio = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=0)
+    return messages[inicio:]
+
+
+class MockLLMClient:
+    def __init__(self, latency_ms=300, token_ms=5):
+        self.latency = latency_ms / 1000
+        self.token_latency = token_ms / 1000
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.calls = 0
+
+    async def create(self, model=None, messages=(), tools=None, tool_choice=None, stream=False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        content, tool_calls = self._respond(list(messages), tools if tool_choice != "none" else None)
+        if stream:
+            return self._stream(content, tool_calls)
+        message = SimpleNamespace(role="assistant", content=content, tool_calls=tool_calls)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")])
+
+    def _respond(self, messages, tools):
+        turn = _turn(messages)
+        user_text = (turn[0].get("content") or "") if turn else ""
+        called = [call["function"]["name"] for m in turn for call in m.get("tool_calls") or []]
+        tool_results = [m.get("content") or "" for m in turn if m.get("role") == "tool"]
+        offered = {tool["function"]["name"]: tool for tool in tools or []}
+
+        if not tool_results and offered:
+            normalized = _normalize(user_text)
+            for name, keywords in TOOL_KEYWORDS:
+                if name in offered and any(k in normalized for k in keywords):
+                    arguments = _arguments(offered[name], user_text)
+                    if arguments is not None:
+                        return None, [_tool_call(name, arguments)]
+            return "Mock: pode me informar seu nome, documento e o que precisa?", None
+
+        # Fluxo do host: cancelamento seguido de reembolso
+        if tool_results and offered and "cancellation_agent" in called and '"success": false' not in tool_results[-1]:
+            conversa = " ".join(m.get("content") or "" for m in messages if m.get("role") == "user")
+            documento = _extract("document", conversa, "payment_agent")
+            if documento and "payment_agent" in offered and "payment_agent" not in called:
+                return None, [_tool_call("payment_agent", {"message": f"Reembolso do documento {documento}"})]
+
+        resumo = " | ".join(result[:200] for result in tool_results) or "sem resultados"
+        return f"Mock: resultado das operações: {resumo}", None
+
+    async def _stream(self, content, tool_calls):
+        for i, tool_call in enumerate(tool_calls or []):
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None, tool_calls=[
+                SimpleNamespace(index=i, id=tool_call.id, function=tool_call.function)
+            ]))])
+        for word in re.findall(r"\S+\s*", content or ""):
+            await asyncio.sleep(self.token_latency)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word, tool_calls=None))])
@@ -0,0 +1,106 @@
+"""
+Montagem dos prompts enviados ao modelo pelo MCP Host e pelos agentes
+O prefixo (system prompt + schemas das tools) é montado uma vez e enviado sempre
+igual, no início da requisição, para aproveitar o cache de prompt do provedor;
+resumo e histórico vêm depois dele. Os tokens são contados localmente (tiktoken,
+se instalado, ou estimativa por caracteres) e o histórico é cortado em turnos
+inteiros para caber no orçamento configurado.
+"""
+import contextvars
+import json
+import os
+from contextlib import contextmanager
+
+from tracing import record_tokens
+
+PROMPT_MAX_TOKENS = int(os.getenv("MCP_PROMPT_MAX_TOKENS", "8000"))
+TOKENIZER = os.getenv("MCP_TOKENIZER", "cl100k_base")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding(TOKENIZER)
+except Exception:  # tiktoken ausente ou sem o arquivo da codificação
+    _encoding = None
+
+_usage = contextvars.ContextVar("prompt_usage", default=None)
+
+
+def count_text(text):
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def count_tokens(messages):
+    """Tokens de uma lista de mensagens (conteúdo + tool_calls + overhead por mensagem)"""
+    total = 0
+    for message in messages:
+        total += 4 + count_text(str(message.get("content") or ""))
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call["function"]
+            total += count_text(function["name"]) + count_text(function["arguments"])
+    return total
+
+
+@contextmanager
+def collect_usage():
+    """Coleta os tokens de cada prompt montado dentro do bloco (por requisição)"""
+    usage = []
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def _turn_starts(history):
+    return [i for i, message in enumerate(history) if message.get("role") == "user"]
+
+
+class PromptBuilder:
+    def __init__(self, system_prompt, tools=None, max_tokens=PROMPT_MAX_TOKENS):
+        self.max_tokens = max_tokens
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.tools = tools or []
+        # O prefixo não muda entre requisições: conta uma vez só
+        self.prefix_tokens = count_tokens([self.system_message]) + \
+            count_text(json.dumps(self.tools, ensure_ascii=False))
+
+    def build(self, session, reserve=500):
+        """Mensagens para a completion: prefixo fixo + histórico que cabe no orçamento
+
+        reserve é o espaço deixado para a resposta (max_tokens da completion).
+        Turnos antigos são omitidos só nesta requisição; o histórico da sessão
+        continua sob controle do SessionStore (janela e resumo).
+        """
+        prefix = self.prefix_tokens
+        history = session.messages()
+        available = self.max_tokens - prefix - reserve
+        history_tokens = count_tokens(history)
+        dropped = 0
+        while history_tokens > available:
+            starts = _turn_starts(history)
+            # Mantém sempre o turno atual (e o resumo, que fica antes do primeiro turno)
+            if len(starts) < 2:
+                break
+            inicio = 1 if history and history[0].get("role") == "system" else 0
+            removed = history[inicio:starts[1]]
+            del history[inicio:starts[1]]
+            dropped += len(removed)
+            history_tokens -= count_tokens(removed)
+
+        report = {
+            "prefix_tokens": prefix,
+            "history_tokens": history_tokens,
+            "total_tokens": prefix + history_tokens,
+            "dropped_messages": dropped
+        }
+        usage = _usage.get()
+        if usage is not None:
+            usage.append(report)
+        record_tokens("prompt", prefix + history_tokens)
+        print(f"[tokens] prefixo={prefix} histórico={history_tokens} total={prefix + history_tokens}"
+              + (f" (omitidas {dropped} mensagens)" if dropped else ""))
+        return [self.system_message] + history
@@ -0,0 +1,59 @@
+"""
+Verificações de prontidão usadas no /health dos agentes
+O agente só está pronto se o cliente LLM responde, o banco compartilhado responde
+e, com vários workers, o estado compartilhado está acessível. A verificação do LLM
+é uma completion de 1 token, guardada por MCP_HEALTH_LLM_TTL segundos para não
+gerar uma chamada paga a cada consulta do balanceador.
+"""
+import asyncio
+import os
+import time
+
+from async_utils import run_blocking
+from shared_state import state_store
+
+HEALTH_LLM_TTL = int(os.getenv("MCP_HEALTH_LLM_TTL", "60"))
+HEALTH_TIMEOUT = float(os.getenv("MCP_HEALTH_TIMEOUT", "5"))
+
+_llm_checks = {}  # id do cliente -> (verificado_em, resultado)
+
+
+async def check_llm(client, deployment):
+    if client is None:
+        return {"ok": False, "error": "Cliente LLM não configurado (setup não executado)"}
+    cached = _llm_checks.get(id(client))
+    if cached and time.monotonic() - cached[0] < HEALTH_LLM_TTL:
+        return cached[1]
+
+    inicio = time.perf_counter()
+    try:
+        await asyncio.wait_for(client.chat.completions.create(
+            model=deployment,
+            messages=[{"role": "user", "content": "ping"}],
+            max_tokens=1
+        ), timeout=HEALTH_TIMEOUT)
+        result = {"ok": True, "elapsed_ms": round((time.perf_counter() - inicio) * 1000, 1)}
+    except Exception as e:
+        result = {"ok": False, "error": str(e) or type(e).__name__}
+    _llm_checks[id(client)] = (time.monotonic(), result)
+    return result
+
+
+def _check(func):
+    inicio = time.perf_counter()
+    try:
+        func()
+        return {"ok": True, "elapsed_ms": round((time.perf_counter() - inicio) * 1000, 1)}
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+
+
+async def check_readiness(client, deployment, storage=None):
+    """Retorna (pronto, verificações); storage é uma função síncrona que falha se o banco não responde"""
+    checks = {"llm": await check_llm(client, deployment)}
+    if storage is not None:
+        checks["storage"] = await run_blocking(_check, storage)
+    state = state_store()
+    if state is not None:
+        checks["state"] = await run_blocking(_check, state.verificar)
+    return all(check["ok"] for check in checks.values()), checks
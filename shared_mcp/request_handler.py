@@ -0,0 +1,42 @@
+"""
+Atendimento de uma mensagem enviada a um agente
+Usado pelos servers HTTP (/mcp/process e /mcp/process/stream) e pelo runtime em
+processo único do host (MCP_MODE=inprocess), para que as duas formas de implantação
+devolvam a mesma resposta: resultado, tempos das tools, tokens do prompt e spans.
+"""
+from prompt_builder import collect_usage
+from tool_executor import collect_timings
+from tracing import span, start_trace
+
+
+async def handle_request(agent, name, message, session_id, mode, trace_id=None):
+    """Resposta no formato de /mcp/process; erros viram {"success": False, "error": ...}"""
+    try:
+        print(f"{name}: {message}")
+        # O trace id vem do host (X-Trace-Id); os spans voltam na resposta
+        with start_trace(trace_id) as trace, span("request"):
+            with collect_timings() as tool_timings, collect_usage() as prompt_tokens:
+                result = await agent.process_message(message, session_id, mode)
+        print(f"{name}: {result}")
+        return {"success": True, "response": result, "tool_timings": tool_timings, "prompt_tokens": prompt_tokens,
+                "trace_id": trace.trace_id, "spans": trace.spans}
+    except Exception as e:
+        print(f"{name} ERRO: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+
+async def handle_request_stream(agent, name, message, session_id, mode, trace_id=None):
+    """Eventos de /mcp/process/stream; o último é sempre "done", no formato de handle_request"""
+    try:
+        print(f"{name} (stream): {message}")
+        with start_trace(trace_id) as trace, span("request"):
+            with collect_timings() as tool_timings, collect_usage() as prompt_tokens:
+                async for event in agent.process_message_stream(message, session_id, mode):
+                    if event["type"] == "done":
+                        print(f"{name}: {event['response']}")
+                        event = {**event, "success": True, "tool_timings": tool_timings, "prompt_tokens": prompt_tokens,
+                                 "trace_id": trace.trace_id, "spans": trace.spans}
+                    yield event
+    except Exception as e:
+        print(f"{name} ERRO: {str(e)}")
+        yield {"type": "done", "success": False, "error": str(e)}
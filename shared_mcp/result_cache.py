@@ -0,0 +1,241 @@
+"""
+Caches de leitura dos agentes e do MCP Host
+ResultCache guarda resultados de tools somente leitura (LRU + TTL), com chave pelos
+argumentos normalizados. Cada resultado é marcado com uma tag ("slots", "exames", ...):
+escritas no mesmo processo invalidam a tag na hora, e a versão dos dados informada
+pelo simple_db invalida o que outros processos alteraram. Com namespace e estado
+compartilhado (ver shared_state.py) as entradas e as invalidações valem para todos
+os workers do agente.
+AnswerCache guarda respostas finais do host para perguntas gerais (preços, horário
+de funcionamento), buscadas por similaridade, nunca para mensagens com dados pessoais.
+A chave inclui o contexto da conversa (ver AnswerCache.context_key): uma pergunta de
+continuação ("qual o valor?") só reaproveita respostas dadas depois da mesma conversa.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+
+from shared_state import state_store
+
+CACHE_TTL = int(os.getenv("MCP_CACHE_TTL", "60"))
+CACHE_MAX = int(os.getenv("MCP_CACHE_MAX", "1024"))
+ANSWER_CACHE = os.getenv("MCP_ANSWER_CACHE", "0") == "1"
+ANSWER_CACHE_TTL = int(os.getenv("MCP_ANSWER_CACHE_TTL", "3600"))
+ANSWER_SIMILARITY = float(os.getenv("MCP_ANSWER_SIMILARITY", "0.8"))
+
+# Tag dos dados lidos por cada tool somente leitura
+TOOL_TAGS = {
+    "buscar_slots": "slots",
+    "buscar_proximo_horario": "slots",
+    "consultar_slots": "slots",
+    "buscar_por_documento": "slots",
+    "get_exam_result": "exames",
+}
+
+# Tools cujo resultado depende do horário atual (ex: buscar_proximo_horario descarta os
+# horários de hoje que já passaram): o minuto atual entra na chave
+CLOCK_DEPENDENT = {"buscar_proximo_horario"}
+
+# Tags invalidadas por cada tool que altera dados
+INVALIDATES = {
+    "agendar_slot": ["slots"],
+    "liberar_slot": ["slots"],
+    "remarcar_slot": ["slots"],
+    "add_payment": ["pagamentos"],
+    "refund": ["pagamentos"],
+}
+
+
+def _normalize_args(arguments):
+    """Chave estável: ignora argumentos vazios, espaços nas pontas e a ordem das chaves"""
+    limpos = {}
+    for nome, valor in (arguments or {}).items():
+        if isinstance(valor, str):
+            valor = valor.strip()
+        if valor is None or valor == "":
+            continue
+        limpos[nome] = valor
+    return json.dumps(limpos, sort_keys=True, ensure_ascii=False)
+
+
+def _cacheable(result):
+    """Erros não são guardados (o próximo pedido tenta de novo)"""
+    return not (isinstance(result, dict) and (result.get("success") is False or "error" in result))
+
+
+class ResultCache:
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX, version=None, namespace=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = version        # função(tag) -> versão dos dados, ou None
+        self.namespace = namespace
+        self.state = state_store() if namespace else None
+        self._entries = OrderedDict()  # (tool, args) -> (expira_em, marca, resultado)
+        self._generations = {}         # tag -> contador de invalidações locais
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _stamp(self, tag):
+        versao = self.version(tag) if self.version else None
+        if self.state is not None:
+            # Mesmo formato da marca lida do banco (tuplas viram listas no JSON)
+            return json.loads(json.dumps([self.state.geracao(self.namespace, tag), versao]))
+        with self._lock:
+            return self._generations.get(tag, 0), versao
+
+    def call(self, tool, handler, arguments):
+        """Executa handler(**arguments) ou devolve o resultado guardado; retorna (resultado, hit)
+
+        Resultados guardados são compartilhados entre chamadas e não devem ser alterados.
+        """
+        tag = TOOL_TAGS.get(tool)
+        if tag is None or self.ttl <= 0:
+            return handler(**arguments), False
+
+        key = (tool, _normalize_args(arguments))
+        if tool in CLOCK_DEPENDENT:
+            key += (datetime.now().strftime("%Y-%m-%d %H:%M"),)
+        # Marca lida antes da execução: uma escrita concorrente deixa a entrada já vencida
+        stamp = self._stamp(tag)
+        if self.state is not None:
+            return self._call_shared(tool, tag, key, stamp, handler, arguments)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now and entry[1] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2], True
+            self.misses += 1
+
+        result = handler(**arguments)
+        if _cacheable(result):
+            with self._lock:
+                self._entries[key] = (now + self.ttl, stamp, result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return result, False
+
+    def _call_shared(self, tool, tag, key, stamp, handler, arguments):
+        """call() com as entradas no estado compartilhado (horário de parede: vale entre processos)"""
+        chave = json.dumps(key, ensure_ascii=False)
+        now = time.time()
+        entry = self.state.ler_cache(self.namespace, chave)
+        if entry and entry[0] > now and entry[1] == stamp:
+            self.hits += 1
+            return entry[2], True
+        self.misses += 1
+
+        result = handler(**arguments)
+        if _cacheable(result):
+            self.state.gravar_cache(self.namespace, chave, tag, now + self.ttl, stamp, result, self.max_entries)
+        return result, False
+
+    def invalidate(self, tool):
+        """Chamado após uma tool de escrita: descarta as leituras das tags afetadas"""
+        tags = INVALIDATES.get(tool, [])
+        if not tags:
+            return
+        if self.state is not None:
+            self.state.invalidar(self.namespace, tags)
+            return
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key in [k for k in self._entries if TOOL_TAGS.get(k[0]) in tags]:
+                del self._entries[key]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": self.state.contar_cache(self.namespace) if self.state is not None else len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+
+# Perguntas gerais, sem dados do paciente
+_PERSONAL_RE = re.compile(r"\d{3}|\b(meu|minha|meus|minhas|cpf|documento|rg|sou|eu)\b")
+_QUESTION_RE = re.compile(r"\?\s*$|^(qual|quais|quanto|quantos|quando|onde|como|que|o que|voces|aceita|atende|tem)\b")
+_STOPWORDS = {"a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "um", "uma",
+              "para", "por", "com", "que", "qual", "quais", "voces", "vcs", "se", "ao"}
+
+
+def _tokens(text):
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+    return {token for token in re.findall(r"[a-z0-9]+", text) if token not in _STOPWORDS}
+
+
+class AnswerCache:
+    def __init__(self, ttl=ANSWER_CACHE_TTL, threshold=ANSWER_SIMILARITY, max_entries=CACHE_MAX):
+        self.ttl = ttl
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (contexto, pergunta normalizada) -> (tokens, expira_em, resposta)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def is_general(text):
+        """Pergunta curta, sem documento/números nem referência ao próprio paciente"""
+        normalized = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower().strip()
+        if _PERSONAL_RE.search(normalized) or not _QUESTION_RE.search(normalized):
+            return False
+        return len(_tokens(normalized)) >= 2
+
+    @staticmethod
+    def context_key(messages):
+        """Identifica a conversa antes da pergunta (resumo + histórico); "" numa conversa nova"""
+        if not messages:
+            return ""
+        conteudo = json.dumps([[m.get("role"), m.get("content")] for m in messages], ensure_ascii=False, default=str)
+        return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+    def get(self, question, context=""):
+        """Resposta de uma pergunta parecida (similaridade de Jaccard) feita no mesmo contexto, ou None"""
+        if not self.is_general(question):
+            return None
+        tokens = _tokens(question)
+        now = time.monotonic()
+        best, best_score = None, 0.0
+        for key, (entry_tokens, expires, answer) in list(self._entries.items()):
+            if expires <= now:
+                del self._entries[key]
+                continue
+            if key[0] != context:
+                continue
+            score = len(tokens & entry_tokens) / len(tokens | entry_tokens)
+            if score > best_score:
+                best, best_score = key, score
+        if best is not None and best_score >= self.threshold:
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best][2]
+        self.misses += 1
+        return None
+
+    def put(self, question, answer, context=""):
+        if not answer or not self.is_general(question):
+            return
+        tokens = _tokens(question)
+        self._entries[(context, " ".join(sorted(tokens)))] = (tokens, time.monotonic() + self.ttl, answer)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
@@ -0,0 +1,148 @@
+"""
+Histórico de conversa por sessão para o MCP Host e os agentes
+Cada sessão (session_id do MessageRequest) tem seu próprio histórico, com expiração
+por inatividade (TTL) e janela limitada por turnos e tokens. Turnos antigos podem
+ser resumidos pelo LLM em vez de simplesmente descartados.
+Nos agentes (namespace informado) as sessões podem ficar no estado compartilhado
+entre workers (ver shared_state.py).
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from prompt_builder import count_tokens
+from shared_state import state_store
+
+SESSION_TTL = int(os.getenv("MCP_SESSION_TTL", "1800"))
+SESSION_MAX_TURNS = int(os.getenv("MCP_SESSION_MAX_TURNS", "10"))
+SESSION_MAX_TOKENS = int(os.getenv("MCP_SESSION_MAX_TOKENS", "3000"))
+SESSION_MAX = int(os.getenv("MCP_SESSION_MAX", "10000"))
+SESSION_SUMMARY = os.getenv("MCP_SESSION_SUMMARY", "0") == "1"
+
+DEFAULT_SESSION = "default"
+
+
+def estimate_tokens(messages):
+    """Tokens do histórico, com a mesma contagem usada na montagem do prompt"""
+    return count_tokens(messages)
+
+
+class Session:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.history = []
+        self.summary = ""
+        self.dropped = []
+        self.last_access = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.version = 0  # versão gravada no estado compartilhado
+
+    def messages(self):
+        """Histórico a enviar ao modelo (resumo dos turnos antigos + janela atual)"""
+        if not self.summary:
+            return list(self.history)
+        return [{"role": "system", "content": f"Resumo da conversa anterior: {self.summary}"}] + self.history
+
+
+class SessionStore:
+    def __init__(self, ttl=SESSION_TTL, max_turns=SESSION_MAX_TURNS, max_tokens=SESSION_MAX_TOKENS,
+                 max_sessions=SESSION_MAX, summarizer=None, namespace=None):
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.max_sessions = max_sessions
+        self.summarizer = summarizer
+        self.namespace = namespace
+        # Estado compartilhado entre workers (None: sessões só na memória do processo)
+        self.state = state_store() if namespace else None
+        self._sessions = OrderedDict()  # ordenado do acesso mais antigo para o mais recente
+
+    def get(self, session_id=DEFAULT_SESSION):
+        """Retorna a sessão (criando se necessário) e remove as expiradas"""
+        self._evict()
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(session_id)
+            self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        session.last_access = time.monotonic()
+        if self.state is not None:
+            self._refresh(session)
+        return session
+
+    def _refresh(self, session):
+        """Relê a sessão se outro worker gravou uma versão diferente da que este processo conhece"""
+        versao = self.state.versao_sessao(self.namespace, session.session_id, self.ttl)
+        if versao is None or versao == session.version:
+            return
+        session.version, dados = self.state.carregar_sessao(self.namespace, session.session_id)
+        session.history = dados["history"]
+        session.summary = dados["summary"]
+        session.dropped = dados["dropped"]
+
+    def _persist(self, session):
+        if self.state is None:
+            return
+        session.version = self.state.salvar_sessao(self.namespace, session.session_id, {
+            "history": session.history,
+            "summary": session.summary,
+            "dropped": session.dropped
+        }, self.ttl)
+
+    def _evict(self):
+        limite = time.monotonic() - self.ttl
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_access >= limite and len(self._sessions) < self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+    def save(self, session):
+        """Aplica a janela de turnos/tokens; turnos removidos aguardam resumo se houver summarizer"""
+        dropped = _trim(session.history, self.max_turns, self.max_tokens)
+        if dropped and self.summarizer:
+            session.dropped.extend(dropped)
+        self._persist(session)
+
+    async def summarize(self, session):
+        """Incorpora ao resumo da sessão os turnos que saíram da janela"""
+        if not session.dropped or not self.summarizer:
+            return
+        dropped, session.dropped = session.dropped, []
+        session.summary = await self.summarizer(session.summary, dropped)
+        self._persist(session)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+def _trim(history, max_turns, max_tokens):
+    """Remove turnos inteiros (a partir de uma mensagem "user") do início do histórico"""
+    dropped = []
+    while history:
+        inicios = [i for i, message in enumerate(history) if message.get("role") == "user"]
+        if len(inicios) <= max_turns and estimate_tokens(history) <= max_tokens:
+            break
+        if len(inicios) < 2:
+            break  # mantém sempre o turno atual
+        dropped.extend(history[:inicios[1]])
+        del history[:inicios[1]]
+    return dropped
+
+
+def llm_summarizer(client, deployment):
+    """Cria um summarizer que usa o próprio modelo do agente para resumir turnos antigos"""
+    async def summarize(summary, messages):
+        texto = "\n".join(f"{m['role']}: {m.get('content') or ''}" for m in messages)
+        completion = await client.chat.completions.create(
+            model=deployment,
+            messages=[
+                {"role": "system", "content": "Resuma a conversa em poucas frases, mantendo nomes, documentos, datas, slots e decisões."},
+                {"role": "user", "content": f"Resumo atual: {summary or '(vazio)'}\n\nNovas mensagens:\n{texto}"}
+            ],
+            max_tokens=200,
+            temperature=0
+        )
+        return completion.choices[0].message.content or summary
+    return summarize
@@ -0,0 +1,169 @@
+"""
+Estado compartilhado entre os workers de um agente
+Com vários workers uvicorn (MCP_WORKERS) cada requisição pode cair em um processo
+diferente, então sessões e cache de leituras saem da memória do processo para um
+arquivo SQLite local em modo WAL (MCP_STATE_BACKEND=sqlite, padrão quando há mais
+de um worker). Cada sessão tem um número de versão: o worker só relê a sessão
+quando outro worker a alterou. Com "memory" (padrão com um worker) nada é gravado.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+WORKERS = int(os.getenv("MCP_WORKERS", "1"))
+STATE_BACKEND = os.getenv("MCP_STATE_BACKEND", "sqlite" if WORKERS > 1 else "memory")
+STATE_PATH = os.getenv("MCP_STATE_PATH", os.path.join(os.path.dirname(__file__), '..', 'shared_db', 'mcp_state.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessoes (
+    namespace     TEXT NOT NULL,
+    session_id    TEXT NOT NULL,
+    versao        INTEGER NOT NULL,
+    dados         TEXT NOT NULL,
+    atualizado_em REAL NOT NULL,
+    PRIMARY KEY (namespace, session_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sessoes_atualizado ON sessoes(atualizado_em);
+
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    chave     TEXT NOT NULL,
+    tag       TEXT NOT NULL,
+    expira_em REAL NOT NULL,
+    marca     TEXT NOT NULL,
+    valor     TEXT NOT NULL,
+    PRIMARY KEY (namespace, chave)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_cache_tag ON cache(namespace, tag);
+
+-- Invalidações do cache por tag (substitui o contador local de cada processo)
+CREATE TABLE IF NOT EXISTS geracoes (
+    namespace TEXT NOT NULL,
+    tag       TEXT NOT NULL,
+    geracao   INTEGER NOT NULL,
+    PRIMARY KEY (namespace, tag)
+) WITHOUT ROWID;
+"""
+
+SQL_VERSAO_SESSAO = "SELECT versao FROM sessoes WHERE namespace = ? AND session_id = ? AND atualizado_em >= ?"
+SQL_CARREGAR_SESSAO = "SELECT versao, dados FROM sessoes WHERE namespace = ? AND session_id = ?"
+SQL_SALVAR_SESSAO = """
+INSERT INTO sessoes (namespace, session_id, versao, dados, atualizado_em) VALUES (?, ?, 1, ?, ?)
+ON CONFLICT (namespace, session_id) DO UPDATE
+SET versao = versao + 1, dados = excluded.dados, atualizado_em = excluded.atualizado_em
+RETURNING versao
+"""
+SQL_REMOVER_SESSOES = "DELETE FROM sessoes WHERE atualizado_em < ?"
+SQL_GERACAO = "SELECT geracao FROM geracoes WHERE namespace = ? AND tag = ?"
+SQL_INCREMENTAR_GERACAO = """
+INSERT INTO geracoes (namespace, tag, geracao) VALUES (?, ?, 1)
+ON CONFLICT (namespace, tag) DO UPDATE SET geracao = geracao + 1
+"""
+SQL_LER_CACHE = "SELECT expira_em, marca, valor FROM cache WHERE namespace = ? AND chave = ?"
+SQL_GRAVAR_CACHE = "INSERT OR REPLACE INTO cache (namespace, chave, tag, expira_em, marca, valor) VALUES (?, ?, ?, ?, ?, ?)"
+SQL_LIMPAR_TAG = "DELETE FROM cache WHERE namespace = ? AND tag = ?"
+SQL_LIMPAR_EXCEDENTE = """
+DELETE FROM cache WHERE namespace = ? AND chave IN (
+    SELECT chave FROM cache WHERE namespace = ? ORDER BY expira_em DESC LIMIT -1 OFFSET ?
+)
+"""
+SQL_CONTAR_CACHE = "SELECT COUNT(*) FROM cache WHERE namespace = ?"
+
+# Limpeza das sessões expiradas a cada N gravações
+LIMPEZA_A_CADA = 200
+
+
+class SharedState:
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._gravacoes = 0
+        self.conexao().executescript(SCHEMA)
+
+    def conexao(self):
+        """Conexão da thread atual (sqlite3 não compartilha conexões entre threads)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def verificar(self):
+        """Consulta trivial, usada no /health"""
+        self.conexao().execute("SELECT 1").fetchone()
+
+    # Sessões
+
+    def versao_sessao(self, namespace, session_id, ttl):
+        """Versão gravada da sessão, ou None se não existe ou expirou"""
+        row = self.conexao().execute(SQL_VERSAO_SESSAO, (namespace, session_id, time.time() - ttl)).fetchone()
+        return row[0] if row else None
+
+    def carregar_sessao(self, namespace, session_id):
+        """(versão, dados) da sessão, ou None"""
+        row = self.conexao().execute(SQL_CARREGAR_SESSAO, (namespace, session_id)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def salvar_sessao(self, namespace, session_id, dados, ttl):
+        """Grava a sessão e retorna a nova versão"""
+        conn = self.conexao()
+        versao = conn.execute(
+            SQL_SALVAR_SESSAO, (namespace, session_id, json.dumps(dados, ensure_ascii=False, default=str), time.time())
+        ).fetchone()[0]
+        self._gravacoes += 1
+        if self._gravacoes % LIMPEZA_A_CADA == 0:
+            conn.execute(SQL_REMOVER_SESSOES, (time.time() - ttl,))
+        return versao
+
+    # Cache de leituras (ver result_cache.py)
+
+    def geracao(self, namespace, tag):
+        row = self.conexao().execute(SQL_GERACAO, (namespace, tag)).fetchone()
+        return row[0] if row else 0
+
+    def invalidar(self, namespace, tags):
+        """Incrementa a geração das tags e descarta as entradas delas, numa transação"""
+        conn = self.conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for tag in tags:
+                conn.execute(SQL_INCREMENTAR_GERACAO, (namespace, tag))
+                conn.execute(SQL_LIMPAR_TAG, (namespace, tag))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def ler_cache(self, namespace, chave):
+        """(expira_em, marca, valor) da entrada, ou None"""
+        row = self.conexao().execute(SQL_LER_CACHE, (namespace, chave)).fetchone()
+        return (row[0], json.loads(row[1]), json.loads(row[2])) if row else None
+
+    def gravar_cache(self, namespace, chave, tag, expira_em, marca, valor, max_entries):
+        conn = self.conexao()
+        conn.execute(SQL_GRAVAR_CACHE, (namespace, chave, tag, expira_em, json.dumps(marca),
+                                        json.dumps(valor, ensure_ascii=False, default=str)))
+        conn.execute(SQL_LIMPAR_EXCEDENTE, (namespace, namespace, max_entries))
+
+    def contar_cache(self, namespace):
+        return self.conexao().execute(SQL_CONTAR_CACHE, (namespace,)).fetchone()[0]
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def state_store():
+    """SharedState do processo, ou None com MCP_STATE_BACKEND=memory"""
+    global _state
+    if STATE_BACKEND != "sqlite":
+        return None
+    if _state is None:
+        with _state_lock:
+            if _state is None:
+                _state = SharedState()
+    return _state
@@ -0,0 +1,74 @@
+"""
+Streaming de completions e eventos SSE
+StreamedCompletion faz a chamada com stream=True: iterar gera os trechos de texto
+conforme chegam e, ao final, content e tool_calls ficam disponíveis no mesmo formato
+da mensagem sem streaming. Os agentes geram eventos ("delta", "done", ...) que os
+servers enviam como server-sent events em /mcp/process/stream.
+Cada completion é um span "llm" do trace atual, com os tokens gerados contados.
+"""
+import json
+
+from prompt_builder import count_text
+from tracing import record_tokens, span
+
+
+class _Function:
+    def __init__(self):
+        self.name = ""
+        self.arguments = ""
+
+
+class _ToolCall:
+    def __init__(self):
+        self.id = None
+        self.type = "function"
+        self.function = _Function()
+
+
+class StreamedCompletion:
+    def __init__(self, client, **kwargs):
+        self.client = client
+        self.kwargs = kwargs
+        self.content = None
+        self.tool_calls = None
+
+    def __aiter__(self):
+        return self._stream()
+
+    async def _stream(self):
+        parts = []
+        calls = {}  # índice -> tool call montada a partir dos fragmentos
+        with span("llm"):
+            stream = await self.client.chat.completions.create(stream=True, **self.kwargs)
+            async for chunk in stream:
+                # O Azure envia um chunk inicial sem choices (resultado do filtro de conteúdo)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    parts.append(delta.content)
+                    yield delta.content
+                for fragment in delta.tool_calls or []:
+                    call = calls.setdefault(fragment.index, _ToolCall())
+                    if fragment.id:
+                        call.id = fragment.id
+                    if fragment.function:
+                        call.function.name += fragment.function.name or ""
+                        call.function.arguments += fragment.function.arguments or ""
+        self.content = "".join(parts) or None
+        self.tool_calls = [calls[i] for i in sorted(calls)] or None
+        record_tokens("completion", count_text(self.content) + sum(
+            count_text(call.function.name) + count_text(call.function.arguments) for call in self.tool_calls or []
+        ))
+
+    async def result(self):
+        """Consome o stream sem repassar os trechos; retorna a própria mensagem completa"""
+        async for _ in self:
+            pass
+        return self
+
+
+def sse_event(event):
+    """Formata um evento do agente como server-sent event"""
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    return f"event: {event['type']}\ndata: {data}\n\n"
@@ -0,0 +1,117 @@
+"""
+Executor das tools chamadas pelo modelo dentro de um agente
+Tools somente leitura consecutivas rodam em paralelo; tools que alteram dados rodam
+uma de cada vez, na ordem em que o modelo as pediu. Com um ResultCache, leituras
+repetidas são servidas do cache e cada escrita invalida o que alterou. O tempo de
+cada tool é medido e pode ser coletado por requisição com collect_timings().
+"""
+import asyncio
+import contextvars
+import json
+import time
+from contextlib import contextmanager
+
+from async_utils import run_blocking
+from tracing import span
+
+_timings = contextvars.ContextVar("tool_timings", default=None)
+
+# Modos de resposta dos agentes (campo mode do MessageRequest)
+MODE_CONVERSATIONAL = "conversational"  # o agente redige a resposta com uma segunda completion
+MODE_STRUCTURED = "structured"          # o agente devolve os resultados das tools; quem chamou redige
+
+
+@contextmanager
+def collect_timings():
+    """Coleta os tempos das tools executadas dentro do bloco (por requisição)"""
+    timings = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+class ToolRun:
+    def __init__(self, tool_call_id, name, arguments):
+        self.tool_call_id = tool_call_id
+        self.name = name
+        self.arguments = arguments
+        self.result = None
+        self.cached = False
+        self.elapsed_ms = 0.0
+
+
+class ToolExecutor:
+    def __init__(self, handlers, read_only=(), cache=None):
+        self.handlers = handlers          # nome da tool -> função síncrona(**arguments)
+        self.read_only = set(read_only)   # tools que não alteram dados
+        self.cache = cache                # ResultCache opcional (ver result_cache.py)
+
+    async def execute(self, tool_calls):
+        """Executa as tool calls e retorna os ToolRun na mesma ordem recebida"""
+        runs = [ToolRun(tool_call.id, tool_call.function.name, tool_call.function.arguments)
+                for tool_call in tool_calls]
+
+        # Agrupa leituras consecutivas; cada escrita forma seu próprio grupo
+        grupo = []
+        for run in runs:
+            if run.name in self.read_only:
+                grupo.append(run)
+                continue
+            await self._run_group(grupo)
+            grupo = []
+            await self._run(run)
+        await self._run_group(grupo)
+
+        timings = _timings.get()
+        if timings is not None:
+            timings.extend({
+                "tool": run.name,
+                "read_only": run.name in self.read_only,
+                "cached": run.cached,
+                "elapsed_ms": round(run.elapsed_ms, 2)
+            } for run in runs)
+        return runs
+
+    async def _run_group(self, grupo):
+        if grupo:
+            await asyncio.gather(*(self._run(run) for run in grupo))
+
+    async def _run(self, run):
+        inicio = time.perf_counter()
+        handler = self.handlers.get(run.name)
+        if handler is None:
+            run.result = {"error": f"Função {run.name} não encontrada"}
+        else:
+            # Span "tool:<nome>": inclui o acesso ao banco (simple_db) feito pela tool
+            with span(f"tool:{run.name}"):
+                try:
+                    arguments = json.loads(run.arguments or "{}")
+                    if self.cache is not None and run.name in self.read_only:
+                        run.result, run.cached = await run_blocking(self.cache.call, run.name, handler, arguments)
+                    else:
+                        run.result = await run_blocking(handler, **arguments)
+                except Exception as e:
+                    run.result = {"success": False, "error": f"Erro ao executar {run.name}: {str(e)}"}
+            if self.cache is not None and run.name not in self.read_only:
+                self.cache.invalidate(run.name)
+        run.elapsed_ms = (time.perf_counter() - inicio) * 1000
+        print(f"[tool] {run.name}: {run.elapsed_ms:.1f} ms{' (cache)' if run.cached else ''}")
+
+
+def tool_history(tool_calls, runs):
+    """Mensagens de histórico da rodada: assistant com as tool_calls e uma mensagem "tool" por resultado"""
+    return [{
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [{
+            "id": tool_call.id,
+            "type": "function",
+            "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments}
+        } for tool_call in tool_calls]
+    }] + [{
+        "role": "tool",
+        "tool_call_id": run.tool_call_id,
+        "content": json.dumps(run.result, ensure_ascii=False, default=str)
+    } for run in runs]
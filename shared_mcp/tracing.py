@@ -0,0 +1,208 @@
+"""
+Rastreamento de requisições e métricas do MCP Host e dos agentes
+Cada turno do paciente recebe um trace id, repassado aos agentes no cabeçalho
+X-Trace-Id; cada etapa (completion, chamada HTTP a um agente, tool/banco) vira um
+span com seu tempo. Os agentes devolvem seus spans na resposta e o host os junta
+ao trace do turno. Tempos, tokens e custo estimado também alimentam contadores
+em memória, expostos no formato texto do Prometheus em /metrics.
+"""
+import contextvars
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+TRACE_HEADER = "X-Trace-Id"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Preço por 1k tokens (USD), usado só para estimar o custo; ajuste ao modelo do deployment
+COST_PROMPT_PER_1K = float(os.getenv("MCP_COST_PROMPT_PER_1K", "0.00015"))
+COST_COMPLETION_PER_1K = float(os.getenv("MCP_COST_COMPLETION_PER_1K", "0.0006"))
+
+# Limites dos buckets do histograma de tempo (segundos)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.spans = []
+        self.tokens = {"prompt": 0, "completion": 0}
+
+    def add(self, name, elapsed_ms, **attrs):
+        self.spans.append({"name": name, "elapsed_ms": round(elapsed_ms, 2), **attrs})
+
+    def add_remote(self, origin, spans):
+        """Spans devolvidos por um agente, prefixados com o domínio (ex: payment/llm)"""
+        for span in spans or []:
+            self.spans.append({**span, "name": f"{origin}/{span['name']}"})
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def summary(self):
+        """Tempo total por nome de span, na ordem em que apareceram"""
+        totals = {}
+        for span in self.spans:
+            totals[span["name"]] = totals.get(span["name"], 0) + span["elapsed_ms"]
+        return {name: round(total, 2) for name, total in totals.items()}
+
+
+@contextmanager
+def start_trace(trace_id=None):
+    """Trace da requisição atual; trace_id vem do cabeçalho de quem chamou, se houver"""
+    trace = Trace(trace_id)
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def current_trace_id():
+    trace = _trace.get()
+    return trace.trace_id if trace else None
+
+
+def trace_headers():
+    """Cabeçalhos para propagar o trace atual numa chamada HTTP"""
+    trace_id = current_trace_id()
+    return {TRACE_HEADER: trace_id} if trace_id else {}
+
+
+def add_remote_spans(origin, spans):
+    trace = _trace.get()
+    if trace is not None:
+        trace.add_remote(origin, spans)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Mede o bloco: registra no trace atual e no histograma mcp_span_seconds"""
+    inicio = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - inicio
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(name, elapsed * 1000, **({**attrs, "error": True} if error else attrs))
+        METRICS.observe("mcp_span_seconds", elapsed, span=name)
+        if error:
+            METRICS.inc("mcp_span_errors_total", span=name)
+
+
+def record_tokens(kind, tokens):
+    """Conta tokens ("prompt" ou "completion") e o custo estimado"""
+    if not tokens:
+        return
+    price = COST_PROMPT_PER_1K if kind == "prompt" else COST_COMPLETION_PER_1K
+    METRICS.inc("mcp_llm_tokens_total", tokens, kind=kind)
+    METRICS.inc("mcp_llm_cost_usd_total", tokens / 1000 * price)
+    trace = _trace.get()
+    if trace is not None:
+        trace.tokens[kind] += tokens
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    """Contadores e histogramas em memória (por processo)"""
+
+    HELP = {
+        "mcp_span_seconds": ("histogram", "Tempo de cada etapa (llm, agente, tool, request)"),
+        "mcp_span_errors_total": ("counter", "Etapas encerradas com exceção"),
+        "mcp_llm_tokens_total": ("counter", "Tokens enviados (prompt) e gerados (completion)"),
+        "mcp_llm_cost_usd_total": ("counter", "Custo estimado das completions em USD"),
+    }
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}    # (nome, labels) -> valor
+        self._histograms = {}  # (nome, labels) -> [contagem por bucket..., soma, total]
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            data = self._histograms.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, limite in enumerate(self.buckets):
+                if value <= limite:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self):
+        """Métricas no formato texto do Prometheus"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        lines = []
+        declared = set()
+
+        def declare(name):
+            if name not in declared:
+                declared.add(name)
+                kind, help_text = self.HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            declare(name)
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), data in histograms:
+            declare(name)
+            for limite, count in zip(self.buckets, data):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', f'{limite:g}'),))} {count}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {data[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {data[-2]:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {data[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def render_metrics():
+    return METRICS.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port):
+    """/metrics em uma thread própria, para processos sem servidor HTTP (o MCP Host)"""
+    server = HTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="mcp-metrics", daemon=True).start()
+    return server
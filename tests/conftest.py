@@ -0,0 +1,35 @@
+"""
+Configuração comum dos testes: caminhos dos módulos e dados de exemplo em um diretório temporário
+"""
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+for pasta in ('shared_db', 'shared_mcp', 'health-mcp-host', 'mcp-exam-agent'):
+    sys.path.append(os.path.join(ROOT, pasta))
+
+SHARED_DB = os.path.join(ROOT, 'shared_db')
+
+
+@pytest.fixture
+def dados(tmp_path):
+    """Cópia de appointments.json e payments.json; retorna os caminhos (agenda, pagamentos, sqlite)"""
+    for nome in ("appointments.json", "payments.json"):
+        shutil.copy(os.path.join(SHARED_DB, nome), str(tmp_path))
+    return (str(tmp_path / "appointments.json"), str(tmp_path / "payments.json"), str(tmp_path / "health.db"))
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, dados, monkeypatch):
+    """Backend JSON ou SQLite (migrado dos mesmos dados) usado pelo simple_db durante o teste"""
+    import simple_db
+    from storage import criar_backend
+    if request.param == "sqlite":
+        from migrate_to_sqlite import migrar
+        migrar(*dados)
+    storage = criar_backend(request.param, *dados)
+    monkeypatch.setattr(simple_db, "_backend", storage)
+    return storage
@@ -0,0 +1,40 @@
+"""
+Testes do cache de respostas do host (shared_mcp/result_cache.py, AnswerCache)
+"""
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'shared_mcp'))
+from result_cache import AnswerCache
+
+PRECO_CARDIOLOGIA = [
+    {"role": "user", "content": "Vocês atendem cardiologia?"},
+    {"role": "assistant", "content": "Sim, a consulta de cardiologia custa R$ 300."},
+]
+PRECO_PEDIATRIA = [
+    {"role": "user", "content": "Vocês atendem pediatria?"},
+    {"role": "assistant", "content": "Sim, a consulta de pediatria custa R$ 200."},
+]
+
+
+def test_mesma_pergunta_com_outro_contexto_nao_usa_o_cache():
+    cache = AnswerCache()
+    cache.put("Qual o valor da consulta?", "R$ 300", AnswerCache.context_key(PRECO_CARDIOLOGIA))
+
+    assert cache.get("Qual o valor da consulta?", AnswerCache.context_key(PRECO_PEDIATRIA)) is None
+    assert cache.get("Qual o valor da consulta?", AnswerCache.context_key([])) is None
+    assert cache.get("Qual o valor da consulta?", AnswerCache.context_key(PRECO_CARDIOLOGIA)) == "R$ 300"
+
+
+def test_conversas_novas_compartilham_respostas_gerais():
+    cache = AnswerCache()
+    cache.put("Qual o horário de funcionamento?", "Das 8h às 18h", AnswerCache.context_key([]))
+
+    assert cache.get("qual o horario de funcionamento", AnswerCache.context_key([])) == "Das 8h às 18h"
+
+
+def test_perguntas_com_dados_pessoais_nao_sao_guardadas():
+    cache = AnswerCache()
+    cache.put("Qual o valor da minha consulta?", "R$ 300")
+
+    assert cache.get("Qual o valor da minha consulta?") is None
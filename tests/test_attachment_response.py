@@ -0,0 +1,104 @@
+"""
+Testes da entrega de anexos de exames (attachment_response.py): Range, If-Range, ETag e HEAD
+"""
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import attachment_response
+from attachment_response import attachment_response as responder, etag, parse_range
+
+CONTEUDO = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.fixture
+def anexo(tmp_path):
+    path = tmp_path / "laudo.pdf"
+    path.write_bytes(CONTEUDO)
+    return str(path)
+
+
+def _enviar(resposta, method="GET", extensions=None):
+    """Executa a resposta ASGI; retorna (status, cabeçalhos, corpo, mensagens)"""
+    mensagens = []
+
+    async def send(mensagem):
+        mensagens.append(mensagem)
+
+    asyncio.run(resposta({"type": "http", "method": method, "extensions": extensions or {}}, None, send))
+    cabecalhos = {nome.decode(): valor.decode() for nome, valor in mensagens[0]["headers"]}
+    corpo = b"".join(m.get("body", b"") for m in mensagens[1:])
+    return mensagens[0]["status"], cabecalhos, corpo, mensagens
+
+
+@pytest.mark.parametrize("cabecalho, intervalo", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    (None, None),
+    ("bytes=-", None),
+    ("bytes=0-9,20-29", None),        # vários intervalos: arquivo inteiro
+    ("items=0-9", None),
+])
+def test_parse_range(cabecalho, intervalo):
+    assert parse_range(cabecalho, 1000) == intervalo
+
+
+@pytest.mark.parametrize("cabecalho, tamanho", [
+    ("bytes=1000-", 1000),
+    ("bytes=50-10", 1000),
+    ("bytes=-0", 1000),
+    ("bytes=-10", 0),
+])
+def test_intervalo_que_nao_pode_ser_atendido(cabecalho, tamanho):
+    with pytest.raises(ValueError):
+        parse_range(cabecalho, tamanho)
+
+
+def test_etag_muda_com_o_arquivo(anexo):
+    antes = etag(os.stat(anexo))
+    os.utime(anexo, ns=(0, os.stat(anexo).st_mtime_ns + 1000))
+
+    assert antes.startswith('"') and antes.endswith('"')
+    assert etag(os.stat(anexo)) != antes
+
+
+def test_arquivo_inteiro_e_304(anexo, monkeypatch):
+    monkeypatch.setattr(attachment_response, "ATTACHMENT_CHUNK", 4096)
+    status, cabecalhos, corpo, mensagens = _enviar(responder(anexo, "application/pdf", {}))
+
+    assert status == 200 and corpo == CONTEUDO and len(mensagens) == 1 + 3
+    assert cabecalhos["content-length"] == str(len(CONTEUDO)) and cabecalhos["accept-ranges"] == "bytes"
+
+    resposta = responder(anexo, "application/pdf", {"if-none-match": f'"outro", {cabecalhos["etag"]}'})
+    assert resposta.status_code == 304
+
+
+def test_range_e_if_range(anexo):
+    tag = etag(os.stat(anexo))
+
+    status, cabecalhos, corpo, _ = _enviar(responder(anexo, "application/pdf", {"range": "bytes=100-199", "if-range": tag}))
+    assert status == 206 and corpo == CONTEUDO[100:200]
+    assert cabecalhos["content-range"] == f"bytes 100-199/{len(CONTEUDO)}" and cabecalhos["content-length"] == "100"
+
+    # Versão antiga no cliente: o Range é ignorado
+    status, _, corpo, _ = _enviar(responder(anexo, "application/pdf", {"range": "bytes=100-199", "if-range": '"antigo"'}))
+    assert status == 200 and corpo == CONTEUDO
+
+    resposta = responder(anexo, "application/pdf", {"range": f"bytes={len(CONTEUDO)}-"})
+    assert resposta.status_code == 416 and resposta.headers["content-range"] == f"bytes */{len(CONTEUDO)}"
+
+
+def test_head_e_zerocopysend(anexo):
+    status, cabecalhos, corpo, _ = _enviar(responder(anexo, "application/pdf", {}), method="HEAD")
+    assert status == 200 and corpo == b"" and cabecalhos["content-length"] == str(len(CONTEUDO))
+
+    _, _, _, mensagens = _enviar(responder(anexo, "application/pdf", {"range": "bytes=-10"}),
+                                 extensions={"http.response.zerocopysend": {}})
+    assert mensagens[1]["type"] == "http.response.zerocopysend"
+    assert (mensagens[1]["offset"], mensagens[1]["count"]) == (len(CONTEUDO) - 10, 10)
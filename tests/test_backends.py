@@ -0,0 +1,49 @@
+"""
+Testes de paridade entre os backends JSON e SQLite (mesmas operações, mesmos resultados)
+"""
+import random
+
+from migrate_to_sqlite import migrar
+from storage import criar_backend, normalizar
+
+# Especialidade e médico chegam normalizados ao backend, como faz o simple_db
+FILTROS = [
+    {},
+    {"especialidade": "cardiologia"},
+    {"medico": normalizar("Dr. Silva")},
+    {"medico": normalizar("dr_silva"), "especialidade": normalizar("Clínica Geral"), "apenas_disponiveis": False},
+    {"data_inicio": "2025-09-27", "data_fim": "2025-09-30"},
+    {"apenas_disponiveis": False, "limite": 3, "apos": ("2025-09-26", "10:00", "SLOT-002")},
+]
+
+
+def _resumo(itens):
+    return [(date, slot["slot_id"], slot["available"], slot.get("patient")) for date, slot in itens]
+
+
+def test_json_e_sqlite_respondem_igual(dados):
+    migrar(*dados)
+    backends = [criar_backend("json", *dados), criar_backend("sqlite", *dados)]
+    slot_ids = sorted(slot["slot_id"] for slots in backends[0].consultar_slots().values() for slot in slots)
+    rnd = random.Random(7)
+
+    for _ in range(200):
+        slot_id, documento = rnd.choice(slot_ids + ["SLOT-X"]), rnd.choice(["111", "222", None])
+        if rnd.random() < 0.6:
+            status = [b.reservar(slot_id, documento or "333") for b in backends]
+        else:
+            status = [b.liberar(slot_id, documento) for b in backends]
+        assert status[0] == status[1], (slot_id, documento)
+
+    json_backend, sqlite_backend = backends
+    for filtros in FILTROS:
+        argumentos = {"limite": 50, **filtros}
+        assert _resumo(json_backend.filtrar_slots(**argumentos)) == _resumo(sqlite_backend.filtrar_slots(**argumentos))
+    for documento in ("111", "222", "333", "999"):
+        assert _resumo(json_backend.buscar_por_paciente(documento)) == _resumo(sqlite_backend.buscar_por_paciente(documento))
+    proximos = {"inicio": ("2025-09-26", "09:30"), "hora_fim": "15:00", "especialidade": "cardiologia", "limite": 5}
+    assert _resumo(json_backend.proximos_livres(**proximos)) == _resumo(sqlite_backend.proximos_livres(**proximos))
+    # A agenda inteira tem os mesmos slots por dia (o JSON mantém a ordem do arquivo)
+    agendas = [{date: sorted(slots, key=lambda slot: slot["slot_id"]) for date, slots in b.consultar_slots().items()}
+               for b in backends]
+    assert agendas[0] == agendas[1]
@@ -0,0 +1,116 @@
+"""
+Testes do circuit breaker e do retry das chamadas do host aos agentes (tools_implementations.py)
+"""
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+import tools_implementations
+from tools_implementations import CircuitBreaker, CircuitOpenError, _request
+
+
+class Relogio:
+    """Substitui time em tools_implementations com um relógio controlado pelo teste"""
+    agora = 1000.0
+
+    @classmethod
+    def monotonic(cls):
+        return cls.agora
+
+
+class AgenteFalso:
+    """Cliente HTTP que devolve, em ordem, as respostas/exceções programadas"""
+
+    def __init__(self, *respostas):
+        self.respostas = list(respostas)
+        self.chamadas = 0
+
+    async def request(self, method, path, **kwargs):
+        self.chamadas += 1
+        resposta = self.respostas.pop(0)
+        if isinstance(resposta, Exception):
+            raise resposta
+        return httpx.Response(resposta, request=httpx.Request(method, "http://agente" + path))
+
+
+@pytest.fixture
+def agente(monkeypatch):
+    """Instala um AgenteFalso e um breaker novo para o domínio "scheduling", sem espera no backoff"""
+    def instalar(*respostas):
+        falso = AgenteFalso(*respostas)
+        monkeypatch.setattr(tools_implementations, "_client", lambda domain: falso)
+        return falso
+    monkeypatch.setitem(tools_implementations._breakers, "scheduling", CircuitBreaker(failure_threshold=2))
+    monkeypatch.setattr(tools_implementations, "BACKOFF_BASE", 0)
+    monkeypatch.setattr(tools_implementations, "AGENT_RETRIES", 2)
+    return instalar
+
+
+def test_circuito_abre_e_deixa_passar_uma_tentativa(monkeypatch):
+    monkeypatch.setattr(tools_implementations, "time", Relogio)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    monkeypatch.setattr(Relogio, "agora", Relogio.agora + 30)
+    assert breaker.allow() and breaker.is_trial()
+    assert not breaker.allow()          # só uma tentativa no meio-aberto
+
+    breaker.release_trial()             # tentativa cancelada libera a próxima
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and not breaker.is_trial() and breaker.failures == 0
+
+
+def test_falha_na_tentativa_reabre_o_circuito(monkeypatch):
+    monkeypatch.setattr(tools_implementations, "time", Relogio)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+
+    monkeypatch.setattr(Relogio, "agora", Relogio.agora + 30)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+
+def test_falha_de_conexao_e_repetida(agente):
+    falso = agente(httpx.ConnectError("recusada"), httpx.ConnectTimeout("sem resposta"), 200)
+
+    resposta = asyncio.run(_request("scheduling", "POST", "/chat"))
+
+    assert resposta.status_code == 200 and falso.chamadas == 3
+    assert tools_implementations._breakers["scheduling"].failures == 0
+
+
+def test_erro_5xx_so_e_repetido_em_chamada_idempotente(agente):
+    falso = agente(503, 200)
+    assert asyncio.run(_request("scheduling", "GET", "/health", idempotent=True)).status_code == 200
+    assert falso.chamadas == 2
+
+    falso = agente(503, 200)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(_request("scheduling", "POST", "/chat"))
+    assert falso.chamadas == 1
+
+    falso = agente(httpx.ReadError("conexão caiu"), 200)
+    with pytest.raises(httpx.ReadError):
+        asyncio.run(_request("scheduling", "POST", "/chat"))
+    assert falso.chamadas == 1
+
+
+def test_tentativas_esgotadas_abrem_o_circuito(agente):
+    falso = agente(*[httpx.ConnectError("recusada")] * 6)
+
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(_request("scheduling", "POST", "/chat"))
+    assert falso.chamadas == 6          # 1 + AGENT_RETRIES por chamada
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(_request("scheduling", "POST", "/chat"))
+    assert falso.chamadas == 6
@@ -0,0 +1,70 @@
+"""
+Testes do roteador determinístico de intenções do host (intent_router.py)
+"""
+import json
+from datetime import date
+
+import pytest
+
+from intent_router import IntentRouter, extract_date, extract_document, extract_specialty
+
+
+def _mensagem(tool_call):
+    return json.loads(tool_call.function.arguments)["message"]
+
+
+@pytest.mark.parametrize("pedido, agente, mensagem", [
+    ("Quero cancelar minha consulta, CPF 123.456.789-09", "cancellation_agent",
+     "Cancelar a consulta do paciente com documento 12345678909"),
+    ("Resultado do exame do documento 98765 de 26/09/2025", "exam_agent",
+     "Buscar os exames do paciente com documento 98765 realizados em 2025-09-26"),
+    ("Tem horários de cardiologista a partir de 2025-10-01?", "scheduling_agent",
+     "Mostrar os horários disponíveis de cardiologia a partir de 2025-10-01"),
+    ("Vagas de clínico geral", "scheduling_agent", "Mostrar os horários disponíveis de clinica-geral"),
+])
+def test_pedido_claro_vai_direto_ao_agente(pedido, agente, mensagem):
+    tool_call = IntentRouter().route(pedido)
+
+    assert tool_call.type == "function" and tool_call.id.startswith("fast-")
+    assert tool_call.function.name == agente
+    assert _mensagem(tool_call) == mensagem
+
+
+@pytest.mark.parametrize("pedido", [
+    "Quero remarcar minha consulta, CPF 12345678909",     # mais de um passo
+    "Preciso pagar a consulta de cardiologia",
+    "Quero cancelar minha consulta",                      # sem documento
+    "Ver meus exames",
+    "Tem horário disponível?",                            # sem especialidade
+    "Horários de cardiologia ou neurologia",              # especialidade ambígua
+    "Cancelar e ver resultados, documento 98765",         # duas intenções
+    "Bom dia!",
+])
+def test_pedido_com_duvida_fica_com_o_llm(pedido):
+    assert IntentRouter().route(pedido) is None
+
+
+def test_extracao_de_documento_data_e_especialidade():
+    hoje = date(2025, 9, 30)
+
+    assert extract_document("exames de 2025-09-26 do 98765") == "98765"
+    assert extract_document("consulta dia 26/09") is None
+    assert extract_date("amanhã", today=hoje) == "2025-10-01"
+    assert extract_date("dia 05/10", today=hoje) == "2025-10-05"
+    assert extract_date("dia 31/02/2025", today=hoje) is None
+    assert extract_specialty("Dermatologista") == "dermatologia"
+
+
+def test_estatisticas_contam_atalhos_e_fallbacks():
+    router = IntentRouter()
+    router.route("Cancelar consulta do documento 98765")
+    router.route("Cancelar consulta do documento 12345")
+    router.route("Quero remarcar")
+
+    assert router.stats() == {
+        "requests": 3,
+        "fast_path": 2,
+        "llm_fallback": 1,
+        "hit_rate": 0.667,
+        "by_intent": {"cancellation_agent": 2},
+    }
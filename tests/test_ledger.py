@@ -0,0 +1,49 @@
+"""
+Testes do livro de pagamentos (simple_db: add_payment, refund, saldo_paciente, totais_do_dia)
+"""
+from datetime import date
+
+import simple_db
+
+DOCUMENTO = "55566677788"
+
+
+def test_pagamento_com_chave_de_idempotencia_nao_duplica(backend):
+    primeiro = simple_db.add_payment("Ana", DOCUMENTO, "01/10/2025", "cardiologia", 300, idempotency_key="k1")
+    repetido = simple_db.add_payment("Ana", DOCUMENTO, "01/10/2025", "cardiologia", 300, idempotency_key="k1")
+
+    assert primeiro["success"] and repetido["success"]
+    assert repetido["payment"]["payment_id"] == primeiro["payment"]["payment_id"]
+    assert simple_db.saldo_paciente(DOCUMENTO)["data"]["balance"] == 300
+    assert simple_db.totais_do_dia("2025-10-01")["data"]["entries"] == 1
+
+
+def test_reembolso_lanca_estorno_e_atualiza_saldo_e_totais(backend):
+    primeiro = simple_db.add_payment("Ana", DOCUMENTO, "2025-10-01", "cardiologia", 300)["payment"]
+    segundo = simple_db.add_payment("Ana", DOCUMENTO, "2025-10-01", "dermatologia", 150.5)["payment"]
+
+    # id como texto, como o LLM costuma mandar
+    reembolso = simple_db.refund(DOCUMENTO, str(segundo["payment_id"]))
+    assert reembolso["success"] and reembolso["payment"]["payment_id"] == segundo["payment_id"]
+    assert not simple_db.refund(DOCUMENTO, segundo["payment_id"])["success"]
+    assert not simple_db.refund(DOCUMENTO, "abc")["success"]
+
+    saldo = simple_db.saldo_paciente(DOCUMENTO)["data"]
+    assert saldo["balance"] == 300
+    assert saldo["entries"] == 3
+    assert [p["payment_id"] for p in saldo["active_payments"]] == [primeiro["payment_id"]]
+
+    # O estorno é lançado na data do reembolso; o dia do pagamento não muda
+    totais = simple_db.totais_do_dia("01/10/2025")["data"]
+    assert (totais["payments"], totais["refunds"], totais["net"], totais["entries"]) == (450.5, 0, 450.5, 2)
+    hoje = simple_db.totais_do_dia(date.today().isoformat())["data"]
+    assert (hoje["refunds"], hoje["entries"]) == (150.5, 1)
+
+
+def test_reembolso_sem_id_estorna_o_pagamento_mais_antigo(backend):
+    primeiro = simple_db.add_payment("Ana", DOCUMENTO, "2025-10-01", "cardiologia", 300)["payment"]
+    simple_db.add_payment("Ana", DOCUMENTO, "2025-10-02", "dermatologia", 100)
+
+    assert simple_db.refund(DOCUMENTO)["payment"]["payment_id"] == primeiro["payment_id"]
+    assert simple_db.saldo_paciente(DOCUMENTO)["data"]["balance"] == 100
+    assert simple_db.totais_do_dia("2025-10-02")["data"]["refunds"] == 0
@@ -0,0 +1,48 @@
+"""
+Testes da busca paginada da agenda (simple_db.buscar_slots com next_cursor)
+"""
+import pytest
+
+import simple_db
+
+
+def _todas_as_paginas(**filtros):
+    ids, cursor = [], None
+    while True:
+        pagina = simple_db.buscar_slots(limite=3, cursor=cursor, **filtros)
+        assert pagina["success"] and len(pagina["slots"]) <= 3
+        ids += [slot["slot_id"] for slot in pagina["slots"]]
+        cursor = pagina["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("filtros", [
+    {},
+    {"especialidade": "Cardiologia"},
+    {"medico": "Dr. Silva", "apenas_disponiveis": False},
+    {"especialidade": "clinica-geral", "data_inicio": "2025-09-27", "data_fim": "2025-10-05"},
+])
+def test_paginas_juntas_sao_a_busca_inteira(backend, filtros):
+    inteira = [slot["slot_id"] for slot in simple_db.buscar_slots(limite=50, **filtros)["slots"]]
+
+    assert len(inteira) > 3
+    assert _todas_as_paginas(**filtros) == inteira
+
+
+def test_cursor_continua_depois_de_um_agendamento(backend):
+    primeira = simple_db.buscar_slots(limite=3)
+    seguinte = [slot["slot_id"] for slot in simple_db.buscar_slots(limite=4, cursor=primeira["next_cursor"])["slots"]]
+
+    # Ocupar um slot já mostrado não desloca a próxima página; ocupar um da próxima o retira dela
+    simple_db.agendar_slot(primeira["slots"][0]["slot_id"], "111")
+    simple_db.agendar_slot(seguinte[0], "111")
+    pagina = simple_db.buscar_slots(limite=3, cursor=primeira["next_cursor"])
+
+    assert [slot["slot_id"] for slot in pagina["slots"]] == seguinte[1:]
+
+
+def test_cursor_invalido_e_limite_maximo(backend):
+    assert not simple_db.buscar_slots(cursor="2025-09-26|09:00")["success"]
+    assert not simple_db.buscar_slots(limite="dez")["success"]
+    assert simple_db.buscar_slots(limite=1000, apenas_disponiveis=False)["total"] <= simple_db.LIMITE_MAXIMO
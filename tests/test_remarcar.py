@@ -0,0 +1,79 @@
+"""
+Testes da remarcação atômica (simple_db.remarcar e SlotStore.remarcar)
+"""
+import json
+import threading
+
+import simple_db
+from slot_store import SlotStore
+
+
+def test_nova_tentativa_depois_de_remarcar_e_sucesso(backend):
+    assert simple_db.agendar_slot("SLOT-001", "111")["success"]
+
+    assert simple_db.remarcar("SLOT-002", "111")["message"] == "Consulta remarcada de SLOT-001 para SLOT-002"
+    retry = simple_db.remarcar("SLOT-002", "111")
+
+    assert retry["success"] and "já estava remarcada" in retry["message"]
+    assert [slot["slot_id"] for _, slot in backend.buscar_por_paciente("111")] == ["SLOT-002"]
+
+
+def test_varios_agendamentos_exigem_slot_antigo(backend):
+    assert simple_db.agendar_slot("SLOT-001", "111")["success"]
+    assert simple_db.agendar_slot("SLOT-002", "111")["success"]
+
+    # Mesmo com o novo slot entre os agendamentos, nada foi movido: não pode responder sucesso
+    for slot_novo in ("SLOT-003", "SLOT-002"):
+        resultado = simple_db.remarcar(slot_novo, "111")
+        assert not resultado["success"] and "informe slot_antigo" in resultado["error"]
+
+    assert simple_db.remarcar("SLOT-003", "111", "SLOT-001")["success"]
+    assert sorted(slot["slot_id"] for _, slot in backend.buscar_por_paciente("111")) == ["SLOT-002", "SLOT-003"]
+
+
+def test_novo_slot_ocupado_mantem_o_agendamento(backend):
+    assert simple_db.agendar_slot("SLOT-001", "111")["success"]
+    assert simple_db.agendar_slot("SLOT-002", "222")["success"]
+
+    assert not simple_db.remarcar("SLOT-002", "111")["success"]
+    assert not simple_db.remarcar("SLOT-003", "111", "SLOT-002")["success"]
+    assert backend.buscar_slot("SLOT-001")[1]["patient"] == "111"
+    assert backend.buscar_slot("SLOT-002")[1]["patient"] == "222"
+
+
+def test_remarcacoes_cruzadas_nao_travam(dados):
+    store = SlotStore(dados[0])
+    assert store.reservar("SLOT-001", "111") == "agendado"
+    # Uma thread troca 001 -> 002 e a outra 002 -> 001: travam os mesmos dois slots em ordens opostas
+    pares = [("SLOT-001", "SLOT-002"), ("SLOT-002", "SLOT-001")]
+
+    def trocar(antigo, novo):
+        for _ in range(200):
+            store.remarcar(antigo, novo, "111")
+
+    threads = [threading.Thread(target=trocar, args=par) for par in pares]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not any(thread.is_alive() for thread in threads)
+
+    agendados = [slot["slot_id"] for _, slot in SlotStore(dados[0]).buscar_por_paciente("111")]
+    assert len(agendados) == 1 and agendados[0] in ("SLOT-001", "SLOT-002")
+
+
+def test_slots_no_mesmo_arquivo_de_trava(tmp_path):
+    # SLOT-M0058 e SLOT-M0204 caem na mesma faixa de trava (crc32 % 1024)
+    slot = {"time": "09:00", "doctor_id": "dr_a", "doctor_name": "Dr. A", "specialties": ["cardiologia"],
+            "available": True, "patient": None}
+    path = tmp_path / "appointments.json"
+    path.write_text(json.dumps({"available_slots": {"2025-10-01": [
+        {**slot, "slot_id": "SLOT-M0058"}, {**slot, "slot_id": "SLOT-M0204", "time": "10:00"}
+    ]}}))
+    store = SlotStore(str(path))
+    assert store.trava("slot", "SLOT-M0058").path == store.trava("slot", "SLOT-M0204").path
+
+    assert store.reservar("SLOT-M0058", "111") == "agendado"
+    assert store.remarcar("SLOT-M0058", "SLOT-M0204", "111") == "remarcado"
+    assert store.buscar("SLOT-M0204")[1]["patient"] == "111"
+    assert store.buscar("SLOT-M0058")[1]["available"]
@@ -0,0 +1,42 @@
+"""
+Testes do agendamento atômico entre processos (compare-and-set em reservar/liberar)
+"""
+import multiprocessing
+
+import simple_db
+from sqlite_backend import SQLiteBackend
+from storage import criar_backend
+
+
+def _reservar(args):
+    nome, dados, documento = args
+    return criar_backend(nome, *dados).reservar("SLOT-001", documento)
+
+
+def test_somente_um_processo_agenda_o_mesmo_slot(backend, dados):
+    nome = "sqlite" if isinstance(backend, SQLiteBackend) else "json"
+    with multiprocessing.get_context("spawn").Pool(6) as pool:
+        status = pool.map(_reservar, [(nome, dados, f"P{i}") for i in range(12)])
+
+    assert status.count("agendado") == 1
+    assert status.count("ocupado") == 11
+    vencedor = f"P{status.index('agendado')}"
+    assert criar_backend(nome, *dados).buscar_slot("SLOT-001")[1]["patient"] == vencedor
+
+
+def test_agendar_de_novo_para_o_mesmo_paciente(backend):
+    assert simple_db.agendar_slot("SLOT-001", "111")["message"] == "Slot agendado"
+    assert simple_db.agendar_slot("SLOT-001", "111")["message"] == "Slot já estava agendado para este paciente"
+    assert not simple_db.agendar_slot("SLOT-001", "222")["success"]
+    assert not simple_db.agendar_slot("SLOT-X", "111")["success"]
+
+
+def test_liberar_confere_o_dono_do_slot(backend):
+    assert simple_db.agendar_slot("SLOT-001", "111")["success"]
+
+    resultado = simple_db.liberar_slot("SLOT-001", "222")
+    assert not resultado["success"] and resultado["error"] == "Slot não pertence a este paciente"
+    assert backend.buscar_slot("SLOT-001")[1]["patient"] == "111"
+
+    assert simple_db.liberar_slot("SLOT-001", "111")["success"]
+    assert backend.buscar_slot("SLOT-001")[1]["available"]
@@ -0,0 +1,90 @@
+"""
+Testes do cache de leituras dos agentes (shared_mcp/result_cache.py, ResultCache)
+"""
+from datetime import datetime
+
+import result_cache
+from result_cache import ResultCache
+from shared_state import SharedState
+
+
+def _contador():
+    """Handler que conta as execuções (cada resultado diferente do anterior)"""
+    chamadas = []
+    return chamadas, lambda **kwargs: chamadas.append(kwargs) or {"success": True, "n": len(chamadas)}
+
+
+class Relogio:
+    """Substitui datetime em result_cache com um horário controlado pelo teste"""
+    agora = datetime(2025, 10, 1, 14, 0)
+
+    @classmethod
+    def now(cls):
+        return cls.agora
+
+
+def test_busca_pelo_horario_atual_nao_reaproveita_de_outro_minuto(monkeypatch):
+    monkeypatch.setattr(result_cache, "datetime", Relogio)
+    cache = ResultCache()
+    chamadas = []
+    handler = lambda **kwargs: chamadas.append(kwargs) or {"success": True, "slots": len(chamadas)}
+
+    cache.call("buscar_proximo_horario", handler, {"especialidade": "cardiologia"})
+    assert cache.call("buscar_proximo_horario", handler, {"especialidade": "cardiologia"})[1]
+
+    monkeypatch.setattr(Relogio, "agora", datetime(2025, 10, 1, 14, 1))
+    resultado, hit = cache.call("buscar_proximo_horario", handler, {"especialidade": "cardiologia"})
+    assert not hit and resultado["slots"] == 2
+
+
+def test_escrita_invalida_so_as_leituras_da_mesma_tag():
+    cache = ResultCache()
+    chamadas, handler = _contador()
+    cache.call("buscar_slots", handler, {"especialidade": "cardiologia"})
+    cache.call("get_exam_result", handler, {"document": "98765"})
+
+    assert cache.call("buscar_slots", handler, {"especialidade": " cardiologia ", "medico": ""})[1]
+    cache.invalidate("agendar_slot")
+    cache.invalidate("add_payment")
+
+    assert cache.call("buscar_slots", handler, {"especialidade": "cardiologia"}) == ({"success": True, "n": 3}, False)
+    assert cache.call("get_exam_result", handler, {"document": "98765"})[1]
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 3
+
+
+def test_versao_dos_dados_invalida_alteracoes_de_outro_processo():
+    versoes = {"slots": 1}
+    cache = ResultCache(version=versoes.get)
+    chamadas, handler = _contador()
+    cache.call("consultar_slots", handler, {})
+    assert cache.call("consultar_slots", handler, {})[1]
+
+    versoes["slots"] = 2
+    assert not cache.call("consultar_slots", handler, {})[1]
+    assert len(chamadas) == 2
+
+
+def test_erros_e_escritas_nao_sao_guardados():
+    cache = ResultCache()
+    erro = lambda **kwargs: {"success": False, "error": "Slot não encontrado"}
+    chamadas, handler = _contador()
+
+    cache.call("buscar_por_documento", erro, {"documento": "1"})
+    assert not cache.call("buscar_por_documento", erro, {"documento": "1"})[1]
+    cache.call("agendar_slot", handler, {"slot_id": "SLOT-001"})
+    assert not cache.call("agendar_slot", handler, {"slot_id": "SLOT-001"})[1]
+    assert len(chamadas) == 2 and cache.stats()["entries"] == 0
+
+
+def test_invalidacao_vale_para_os_outros_workers(tmp_path, monkeypatch):
+    estado = SharedState(str(tmp_path / "mcp_state.db"))
+    monkeypatch.setattr(result_cache, "state_store", lambda: estado)
+    worker_a, worker_b = ResultCache(namespace="scheduling"), ResultCache(namespace="scheduling")
+    chamadas, handler = _contador()
+
+    worker_a.call("buscar_slots", handler, {"data_inicio": "2025-09-26"})
+    assert worker_b.call("buscar_slots", handler, {"data_inicio": "2025-09-26"})[1]
+
+    worker_b.invalidate("remarcar_slot")
+    assert not worker_a.call("buscar_slots", handler, {"data_inicio": "2025-09-26"})[1]
+    assert len(chamadas) == 2
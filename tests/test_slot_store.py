@@ -0,0 +1,30 @@
+"""
+Testes do armazenamento residente dos slots (shared_db/slot_store.py)
+"""
+import json
+
+from slot_store import SlotStore
+
+
+def test_alterar_resultado_de_slots_nao_altera_o_store(dados):
+    store = SlotStore(dados[0])
+    date, slot = store.buscar("SLOT-001")
+    assert slot["available"]
+
+    copia = store.slots()
+    for item in copia[date]:
+        if item["slot_id"] == "SLOT-001":
+            item["available"] = False
+            item["patient"] = "99999999999"
+            item["specialties"].append("alterada")
+
+    assert store.buscar("SLOT-001")[1]["available"]
+    assert "alterada" not in store.buscar("SLOT-001")[1]["specialties"]
+    assert store.buscar_por_paciente("99999999999") == []
+    assert store.reservar("SLOT-001", "12345678900") == "agendado"
+
+    store.compactar()
+    with open(dados[0], encoding="utf8") as file:
+        gravado = {item["slot_id"]: item for item in json.load(file)["available_slots"][date]}
+    assert gravado["SLOT-001"]["patient"] == "12345678900"
+    assert "alterada" not in gravado["SLOT-001"]["specialties"]
@@ -0,0 +1,102 @@
+"""
+Testes do write-ahead log (shared_db/wal.py): repetição, reparo e compactação
+"""
+import json
+import os
+import threading
+import time
+
+import wal
+from slot_store import SlotStore
+
+
+def _wal(dados):
+    return os.path.splitext(dados[0])[0] + ".wal"
+
+
+def test_escritas_sao_repetidas_do_wal_por_outro_processo(dados):
+    escritor, leitor = SlotStore(dados[0]), SlotStore(dados[0])
+    assert leitor.buscar("SLOT-001")[1]["available"]
+
+    assert escritor.reservar("SLOT-001", "111") == "agendado"
+    assert escritor.liberar("SLOT-002") == "liberado"
+
+    # O leitor já carregado aplica só o final do WAL; um novo processo lê snapshot + WAL
+    for store in (leitor, SlotStore(dados[0])):
+        assert store.buscar("SLOT-001")[1]["patient"] == "111"
+        assert store.buscar("SLOT-002")[1]["available"]
+    with open(dados[0], encoding="utf8") as file:
+        assert '"patient": "111"' not in file.read()
+
+
+def test_linha_incompleta_no_final_e_descartada(dados):
+    SlotStore(dados[0]).reservar("SLOT-001", "111")
+    with open(_wal(dados), "ab") as file:
+        file.write(b'{"op": "agendar", "slot_id": "SLOT-002", "pat')
+
+    store = SlotStore(dados[0])
+    store.atualizar()
+    assert store.buscar("SLOT-002")[1]["available"]
+    assert store.reservar("SLOT-003", "333") == "agendado"
+
+    registros, _ = wal.WriteAheadLog(_wal(dados)).ler()
+    assert [r["slot_id"] for r in registros] == ["SLOT-001", "SLOT-003"]
+
+
+def test_queda_durante_a_compactacao_nao_repete_o_wal_antigo(dados):
+    SlotStore(dados[0]).reservar("SLOT-001", "111")
+    # Snapshot da geração 1 gravado, mas a queda aconteceu antes de recomeçar o WAL (ainda geração 0)
+    with open(dados[0], encoding="utf8") as file:
+        snapshot = json.load(file)
+    for slot in snapshot["available_slots"]["2025-09-26"]:
+        if slot["slot_id"] == "SLOT-001":
+            slot.update(available=False, patient="222")
+    snapshot["geracao_wal"] = 1
+    wal.escrever_atomico(dados[0], snapshot)
+
+    store = SlotStore(dados[0])
+    store.atualizar()
+    assert store.buscar("SLOT-001")[1]["patient"] == "222"
+    assert wal.WriteAheadLog(_wal(dados)).geracao() == 1
+
+
+def test_compactacao_grava_snapshot_e_recomeca_o_wal(dados):
+    outro = SlotStore(dados[0])
+    outro.atualizar()
+    store = SlotStore(dados[0], compactar_a_cada=2)
+    store.reservar("SLOT-001", "111")
+    store.reservar("SLOT-002", "222")
+
+    assert wal.WriteAheadLog(_wal(dados)).ler() == ([], os.path.getsize(_wal(dados)))
+    with open(dados[0], encoding="utf8") as file:
+        assert json.load(file)["geracao_wal"] == 1
+    # Um processo que já tinha o arquivo antigo aberto continua lendo e escrevendo
+    assert outro.buscar("SLOT-002")[1]["patient"] == "222"
+    assert outro.reservar("SLOT-003", "333") == "agendado"
+    assert SlotStore(dados[0]).buscar("SLOT-003")[1]["patient"] == "333"
+
+
+def test_reabrir_o_wal_espera_o_fsync_em_andamento(tmp_path, monkeypatch):
+    path = str(tmp_path / "x.wal")
+    log, outro_processo = wal.WriteAheadLog(path), wal.WriteAheadLog(path)
+    log.reiniciar(0)
+    ticket, _ = log.append({"op": "a"})
+    fsync, arquivos = os.fsync, []
+
+    def fsync_lento(fd):
+        if threading.current_thread().name == "sync":
+            inode = os.fstat(fd).st_ino
+            time.sleep(0.2)
+            arquivos.append((inode, os.fstat(fd).st_ino))
+        fsync(fd)
+
+    monkeypatch.setattr(wal.os, "fsync", fsync_lento)
+    sync = threading.Thread(target=log.sincronizar, args=(ticket,), name="sync")
+    sync.start()
+    time.sleep(0.05)
+    outro_processo.reiniciar(1)   # compactação em outro processo: novo arquivo
+    log.append({"op": "b"})       # reabre o WAL
+    sync.join()
+
+    inode_antes, inode_depois = arquivos[0]
+    assert inode_antes == inode_depois